@@ -0,0 +1,354 @@
+"""
+离线的 OpenAI 兼容接口模拟服务
+
+只实现 `POST .../chat/completions`, 根据提示词内容识别调用类型
+(生成谜题、评判问题、分级评判的快速评判、计算进度、谜题评分、提取关键事实), 返回固定格式的 JSON,
+并按配置的延迟分布和错误率模拟真实服务。请求 `stream` 时以 SSE 分段返回,
+首段在延迟的前 20% 之后到达, 其余内容在剩余的延迟内陆续到达。不依赖任何第三方库。
+
+单独运行时可以作为机器人的模型接口使用:
+    python benchmarks/fake_openai.py --port 8000 --latency judge=0.8,0.4
+然后把 ATS_OPENAI_*_BASE_URL 设为 http://127.0.0.1:8000/v1
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+# 调用类型
+KIND_GENERATE = "generate"
+KIND_JUDGE = "judge"
+KIND_JUDGE_FAST = "judge_fast"
+KIND_PROGRESS = "progress"
+KIND_RATE = "rate"
+KIND_FACTS = "facts"
+KINDS = (KIND_GENERATE, KIND_JUDGE, KIND_JUDGE_FAST, KIND_PROGRESS, KIND_RATE, KIND_FACTS)
+
+_REPLIES = ("是", "不是", "不重要")
+# 快速评判给出低置信度的比例
+_LOW_CONFIDENCE_RATE = 0.2
+
+# 流式响应: 首段到达前经过的延迟比例, 以及内容分成的段数
+_FIRST_CHUNK_SHARE = 0.2
+_STREAM_CHUNKS = 10
+
+
+class LatencyModel:
+    """对数正态分布的延迟: `median` 为中位数(秒), `sigma` 越大长尾越明显"""
+
+    def __init__(self, median: float, sigma: float = 0.0):
+        self.median = median
+        self.sigma = sigma
+
+    @classmethod
+    def parse(cls, spec: str) -> "LatencyModel":
+        """解析 "中位数[,sigma]" 格式的配置"""
+        median, _, sigma = spec.partition(",")
+        return cls(float(median), float(sigma or 0))
+
+    def sample(self, rng: random.Random) -> float:
+        if self.median <= 0:
+            return 0.0
+        if self.sigma <= 0:
+            return self.median
+        return self.median * math.exp(rng.gauss(0, self.sigma))
+
+
+DEFAULT_LATENCY = {
+    KIND_GENERATE: LatencyModel(3.0, 0.3),
+    KIND_JUDGE: LatencyModel(0.8, 0.4),
+    KIND_JUDGE_FAST: LatencyModel(0.2, 0.3),
+    KIND_PROGRESS: LatencyModel(0.8, 0.4),
+    KIND_RATE: LatencyModel(0.8, 0.4),
+    KIND_FACTS: LatencyModel(0.8, 0.4),
+}
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算 token 数量: 中文等宽字符约 1 字 1 token, 其余约 4 字符 1 token"""
+    wide = sum(1 for char in text if ord(char) > 0x2E80)
+    return wide + (len(text) - wide + 3) // 4
+
+
+def classify(messages: List[Dict[str, Any]]) -> str:
+    """根据提示词内容识别调用类型"""
+    system = str(messages[0].get("content", "")) if messages else ""
+    last = str(messages[-1].get("content", "")) if messages else ""
+    if "内容生成引擎" in last:
+        return KIND_GENERATE
+    if "recalculated_percent" in system:
+        return KIND_PROGRESS
+    if '"overall"' in system:
+        return KIND_RATE
+    if "关键事实提取" in system:
+        return KIND_FACTS
+    if "`confidence`" in system:
+        return KIND_JUDGE_FAST
+    return KIND_JUDGE
+
+
+class FakeOpenAI:
+    """模拟服务的状态: 延迟与错误配置、随机数和统计计数"""
+
+    def __init__(
+        self,
+        latency: Optional[Dict[str, LatencyModel]] = None,
+        error_rate: float = 0.0,
+        seed: Optional[int] = None
+    ):
+        self.latency = dict(DEFAULT_LATENCY)
+        self.latency.update(latency or {})
+        self.error_rate = error_rate
+        self.rng = random.Random(seed)
+        self._server: Optional[asyncio.AbstractServer] = None
+        self.port = 0
+
+        # 统计计数
+        self.requests: Dict[str, int] = {kind: 0 for kind in KINDS}
+        self.errors = 0
+        self.prompt_tokens = 0
+        self.request_bytes = 0
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """启动服务, 返回可用作 base_url 的地址"""
+        self._server = await asyncio.start_server(self._handle, host, port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return f"http://{host}:{self.port}/v1"
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """处理一个 HTTP/1.1 连接上的请求, 支持 keep-alive"""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = (await reader.readline()).decode("latin-1").strip()
+                    if not line:
+                        break
+                    name, _, value = line.partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+
+                if method == "POST" and path.rstrip("/").endswith("/chat/completions"):
+                    self.request_bytes += len(body)
+                    request = json.loads(body)
+                    if request.get("stream"):
+                        await self.stream_completion(request, writer)
+                    else:
+                        await self._write_json(writer, method, *await self.chat_completion(request))
+                else:
+                    await self._write_json(writer, method, 404, {}, {"error": {"message": "not found"}})
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _write_json(
+        writer: asyncio.StreamWriter,
+        method: str,
+        status: int,
+        extra_headers: Dict[str, str],
+        payload: Dict[str, Any]
+    ):
+        data = b"" if method == "HEAD" else json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        head = [f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}",
+                "Content-Type: application/json",
+                f"Content-Length: {len(data)}"]
+        head += [f"{name}: {value}" for name, value in extra_headers.items()]
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + data)
+        await writer.drain()
+
+    async def stream_completion(self, request: Dict[str, Any], writer: asyncio.StreamWriter):
+        """以 SSE 分段返回回复内容, 使用 chunked 传输编码"""
+        delay = self.latency[classify(request.get("messages", []))].sample(self.rng)
+        status, extra_headers, payload = await self.chat_completion(request, delay * _FIRST_CHUNK_SHARE)
+        if status != 200:
+            await self._write_json(writer, "POST", status, extra_headers, payload)
+            return
+
+        head = ["HTTP/1.1 200 OK", "Content-Type: text/event-stream", "Transfer-Encoding: chunked"]
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1"))
+
+        async def send(event: str):
+            data = f"data: {event}\n\n".encode("utf-8")
+            writer.write(f"{len(data):x}\r\n".encode("latin-1") + data + b"\r\n")
+            await writer.drain()
+
+        def chunk(choices: List[Dict[str, Any]], **extra: Any) -> str:
+            return json.dumps({
+                "id": payload["id"],
+                "object": "chat.completion.chunk",
+                "created": payload["created"],
+                "model": payload["model"],
+                "choices": choices,
+                **extra
+            }, ensure_ascii=False)
+
+        def delta(content: Optional[Dict[str, Any]], finish_reason: Optional[str] = None) -> str:
+            return chunk([{"index": 0, "delta": content, "finish_reason": finish_reason}])
+
+        content = payload["choices"][0]["message"]["content"]
+        size = math.ceil(len(content) / _STREAM_CHUNKS) or 1
+        pieces = [content[i:i + size] for i in range(0, len(content), size)]
+        await send(delta({"role": "assistant", "content": ""}))
+        for index, piece in enumerate(pieces):
+            if index:
+                await asyncio.sleep(delay * (1 - _FIRST_CHUNK_SHARE) / (len(pieces) - 1))
+            await send(delta({"content": piece}))
+        await send(delta({}, "stop"))
+        if (request.get("stream_options") or {}).get("include_usage"):
+            await send(chunk([], usage=payload["usage"]))
+        await send("[DONE]")
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+    async def chat_completion(
+        self,
+        request: Dict[str, Any],
+        delay: Optional[float] = None
+    ) -> Tuple[int, Dict[str, str], Dict[str, Any]]:
+        """返回 (状态码, 额外响应头, 响应体), `delay` 为空时按调用类型的延迟分布等待"""
+        messages = request.get("messages", [])
+        kind = classify(messages)
+        self.requests[kind] += 1
+        prompt_tokens = sum(estimate_tokens(str(message.get("content", ""))) for message in messages)
+        self.prompt_tokens += prompt_tokens
+
+        await asyncio.sleep(self.latency[kind].sample(self.rng) if delay is None else delay)
+
+        if self.rng.random() < self.error_rate:
+            self.errors += 1
+            if self.rng.random() < 0.5:
+                return 429, {"Retry-After": "0.5"}, {"error": {"message": "rate limited"}}
+            return 500, {}, {"error": {"message": "internal error"}}
+
+        content = json.dumps(self.canned(kind, messages), ensure_ascii=False)
+        completion_tokens = estimate_tokens(content)
+        return 200, {}, {
+            "id": f"chatcmpl-{self.rng.getrandbits(32):08x}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "fake"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop"
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens
+            }
+        }
+
+    def canned(self, kind: str, messages: List[Dict[str, Any]]) -> Any:
+        """各调用类型的固定格式回复"""
+        if kind == KIND_GENERATE:
+            n = self.rng.getrandbits(32)
+            return [{
+                "title": f"模拟谜题 {n:08x}",
+                "puzzle_setting": f"一个男人走进第 {n} 号餐厅, 点了一碗海龟汤, 喝了一口之后就离开了。",
+                "supplementary_info": ["他曾经遇过海难", "当时有人给他喝过所谓的海龟汤", "他尝出了味道的不同"],
+                "solution": f"编号 {n} 的谜底: 他意识到当年喝的并不是海龟汤。",
+                "key_facts": self.key_facts()
+            }]
+        if kind == KIND_PROGRESS:
+            return {"recalculated_percent": self.rng.randint(10, 90)}
+        if kind == KIND_RATE:
+            return {"scores": {key: round(self.rng.uniform(6, 9), 1) for key in
+                               ("overall", "suspense", "logic", "creativity", "playability")}}
+        if kind == KIND_FACTS:
+            return {"key_facts": self.key_facts()}
+
+        current = json.loads(messages[-1]["content"])
+        questions = current.get("player_questions") or [current.get("player_question", "")]
+        percent = current.get("last_percentage")
+        fact_count = len(json.loads(messages[1]["content"]).get("key_facts", []))
+        results = []
+        for question in questions:
+            finished = "放弃" in question
+            item: Dict[str, Any] = {"reply": self.rng.choice(_REPLIES)}
+            if percent is None:
+                item["finished"] = finished
+                if fact_count:
+                    # 约三分之一的提问确认一条关键事实
+                    item["facts"] = [self.rng.randint(1, fact_count)] if self.rng.random() < 0.3 else []
+            else:
+                percent = 100 if finished else min(95, percent + self.rng.randint(0, 10))
+                item["percent"] = percent
+            if kind == KIND_JUDGE_FAST:
+                low = self.rng.random() < _LOW_CONFIDENCE_RATE
+                item["confidence"] = round(self.rng.uniform(0.3, 0.7) if low else self.rng.uniform(0.85, 1.0), 2)
+            results.append(item)
+        return results[0] if "player_questions" not in current else {"results": results}
+
+    def key_facts(self) -> List[Dict[str, Any]]:
+        return [{"fact": f"关键事实 {index}", "weight": self.rng.randint(1, 5)} for index in range(1, 5)]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'requests': dict(self.requests),
+            'errors': self.errors,
+            'prompt_tokens': self.prompt_tokens,
+            'request_bytes': self.request_bytes
+        }
+
+
+def parse_latency(specs: List[str]) -> Dict[str, LatencyModel]:
+    """解析 "类型=中位数[,sigma]" 格式的延迟配置"""
+    latency = {}
+    for spec in specs:
+        kind, _, model = spec.partition("=")
+        if kind not in KINDS:
+            raise argparse.ArgumentTypeError(f"未知的调用类型: {kind}")
+        latency[kind] = LatencyModel.parse(model)
+    return latency
+
+
+def add_server_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument(
+        "--latency", action="append", default=[], metavar="KIND=MEDIAN[,SIGMA]",
+        help=f"各调用类型的延迟分布, 类型为 {'/'.join(KINDS)}, 可重复指定"
+    )
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回 429/500 的比例")
+    parser.add_argument("--seed", type=int, default=None, help="随机数种子")
+
+
+async def _serve(args: argparse.Namespace):
+    server = FakeOpenAI(parse_latency(args.latency), args.error_rate, args.seed)
+    base_url = await server.start(args.host, args.port)
+    print(f"模拟服务已启动: {base_url}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="离线的 OpenAI 兼容接口模拟服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    add_server_arguments(parser)
+    try:
+        asyncio.run(_serve(parser.parse_args()))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+插件导入耗时基准
+
+在独立的子进程中初始化 NoneBot 并先加载依赖插件, 只测量加载本插件本身的耗时,
+并借助 `python -X importtime` 列出加载期间累计耗时最多的模块。
+
+用法:
+    python benchmarks/import_time.py [--repeat 5] [--top 10] [--max-ms 300]
+
+指定 `--max-ms` 时, 耗时中位数超出上限则以非零状态码退出, 可用于 CI 中跟踪启动耗时。
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+from typing import List, Tuple
+
+SRC_DIR = Path(__file__).resolve().parent.parent / "src"
+PLUGIN = "nonebot_plugin_ai_turtle_soup"
+START_MARKER = "--- plugin import start ---"
+END_MARKER = "--- plugin import end ---"
+
+# 子进程中执行的代码: 依赖插件加载完成后再计时, 计时结果输出到 stdout
+CHILD_CODE = f"""
+import sys, time
+sys.path.insert(0, {str(SRC_DIR)!r})
+import nonebot
+nonebot.init(
+    driver="~none",
+    ats_openai_generate_api_key="benchmark",
+    ats_openai_judge_api_key="benchmark",
+    localstore_use_cwd=True
+)
+for name in ("nonebot_plugin_alconna", "nonebot_plugin_uninfo", "nonebot_plugin_localstore"):
+    nonebot.load_plugin(name)
+print({START_MARKER!r}, file=sys.stderr, flush=True)
+start = time.perf_counter()
+nonebot.load_plugin({PLUGIN!r})
+elapsed = time.perf_counter() - start
+print({END_MARKER!r}, file=sys.stderr, flush=True)
+print(elapsed * 1000)
+print("openai" in sys.modules)
+"""
+
+
+def run_child(workdir: str, importtime: bool = False) -> subprocess.CompletedProcess:
+    args = [sys.executable]
+    if importtime:
+        args += ["-X", "importtime"]
+    args += ["-c", CHILD_CODE]
+    result = subprocess.run(args, cwd=workdir, capture_output=True, text=True)
+    if result.returncode != 0:
+        sys.stderr.write(result.stderr)
+        raise SystemExit(f"子进程运行失败(退出码 {result.returncode})")
+    return result
+
+
+def slowest_modules(stderr: str, top: int) -> List[Tuple[int, str]]:
+    """解析 -X importtime 的输出, 返回插件加载期间累计耗时最多的模块"""
+    lines = stderr.splitlines()
+    try:
+        lines = lines[lines.index(START_MARKER) + 1:lines.index(END_MARKER)]
+    except ValueError:
+        return []
+
+    modules = []
+    for line in lines:
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3 or not fields[1].strip().isdigit():
+            continue
+        modules.append((int(fields[1]), fields[2].rstrip()))
+    modules.sort(reverse=True)
+    return modules[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="测量加载插件的耗时")
+    parser.add_argument("--repeat", type=int, default=5, help="重复测量的次数")
+    parser.add_argument("--top", type=int, default=10, help="列出累计耗时最多的模块数量")
+    parser.add_argument("--max-ms", type=float, default=0, help="耗时中位数上限(毫秒), 0 为不检查")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        samples = []
+        openai_loaded = False
+        for _ in range(args.repeat):
+            output = run_child(workdir).stdout.split()
+            samples.append(float(output[-2]))
+            openai_loaded = output[-1] == "True"
+        profile = run_child(workdir, importtime=True)
+
+    median = statistics.median(samples)
+    print(f"加载插件耗时: 中位数 {median:.1f} ms, 最小 {min(samples):.1f} ms, 最大 {max(samples):.1f} ms ({len(samples)} 次)")
+    print(f"加载插件时是否导入了 openai: {'是' if openai_loaded else '否'}")
+    print(f"\n累计耗时最多的 {args.top} 个模块(微秒):")
+    for cumulative, module in slowest_modules(profile.stderr, args.top):
+        print(f"{cumulative:>10}  {module}")
+
+    if args.max_ms and median > args.max_ms:
+        print(f"\n加载插件耗时 {median:.1f} ms 超出上限 {args.max_ms:.1f} ms")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,319 @@
+"""
+多群组并发负载测试
+
+在本进程中启动模拟的 OpenAI 兼容服务(见 fake_openai.py), 加载插件后让多个模拟群组并发地
+完成一局游戏: 开始游戏 → 提问 N 次 → 获取提示 → 放弃。
+提问和放弃按 `handle_at_bot` 的方式先经过本地意图识别, 再交给 GameManager 处理。
+
+输出吞吐量、各操作端到端延迟的 p50/p95/p99、发送给模型的 token 数、
+评判请求数的构成(批量评判、重新输出、对冲、分级评判), 以及每个进行中游戏占用的内存。
+不会调用任何真实的模型接口。
+
+用法:
+    python benchmarks/load_test.py --groups 200 --questions 10
+    python benchmarks/load_test.py --latency judge=1.5,0.6 --error-rate 0.02
+    python benchmarks/load_test.py --config ats_split_progress=true --config ats_llm_concurrency=16
+"""
+import argparse
+import asyncio
+import gc
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Dict, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from fake_openai import FakeOpenAI, LatencyModel, add_server_arguments, parse_latency  # noqa: E402
+
+# 模拟玩家的提问, 其中少量闲聊和开放式问题会被本地意图识别拦截
+QUESTIONS = [
+    "他是故意的吗", "这件事发生在室内吗", "他认识餐厅老板吗", "汤有问题吗", "他以前喝过海龟汤吗",
+    "他是一个人来的吗", "他有同伴死了吗", "这和海难有关吗", "他吃过人肉吗", "他后来自杀了吗",
+    "时间因素重要吗", "他的身体有什么特殊情况吗", "餐厅的位置重要吗", "他是厨师吗", "他哭了吗",
+    "汤的味道和以前不一样吗", "有人骗了他吗", "他当时很饿吗", "这件事发生在晚上吗", "他是船员吗",
+    "哈哈哈", "他为什么要走", "是自杀还是他杀",
+]
+
+# 测量内存时记录的调用栈深度, 以及用于区分插件和模拟服务端、本脚本分配的内存的目录
+_TRACE_FRAMES = 4
+_HARNESS_DIR = str(Path(__file__).resolve().parent)
+_PLUGIN_DIR = str(Path(__file__).resolve().parent.parent / "src" / "nonebot_plugin_ai_turtle_soup")
+
+
+def percentile(samples: List[float], q: float) -> float:
+    """最近秩法计算分位数"""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, int(round(q * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def parse_config(items: List[str]) -> Dict[str, Any]:
+    """解析 "键=值" 形式的插件配置, 值按 JSON 解析, 失败时作为字符串"""
+    config = {}
+    for item in items:
+        key, _, value = item.partition("=")
+        try:
+            config[key.strip()] = json.loads(value)
+        except json.JSONDecodeError:
+            config[key.strip()] = value
+    return config
+
+
+class Recorder:
+    """按操作类型记录延迟和错误"""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.filtered = 0
+
+    async def measure(self, op: str, coro: Any) -> Any:
+        start = time.perf_counter()
+        try:
+            return await coro
+        except Exception:
+            self.errors[op] += 1
+            return None
+        finally:
+            self.latencies[op].append(time.perf_counter() - start)
+
+
+async def play_group(game_manager: Any, intent_enum: Any, recorder: Recorder, index: int, args: argparse.Namespace):
+    """模拟一个群组完成一局游戏"""
+    rng = random.Random(index)
+    session_id = f"bench-{index}"
+    await asyncio.sleep(rng.uniform(0, args.ramp))
+
+    start = time.perf_counter()
+
+    async def _on_preview(preview: Dict[str, str]):
+        # 流式生成时玩家看到汤面的时间
+        recorder.latencies["preview"].append(time.perf_counter() - start)
+
+    puzzle = await recorder.measure("start", game_manager.create_game(session_id, theme="", on_preview=_on_preview))
+    if puzzle is None:
+        return
+
+    for question in rng.sample(QUESTIONS, min(args.questions, len(QUESTIONS))):
+        if args.think > 0:
+            await asyncio.sleep(rng.expovariate(1 / args.think))
+        intent, _ = game_manager.intent_classifier.classify(question)
+        if intent != intent_enum.QUESTION:
+            recorder.filtered += 1
+            continue
+        result = await recorder.measure("question", game_manager.process_question(session_id, question))
+        if result and result.get("percent", 0) >= 100:
+            game_manager.end_game(session_id)
+            return
+
+    await recorder.measure("hint", game_manager.get_next_hint(session_id))
+
+    intent, _ = game_manager.intent_classifier.classify("放弃")
+    if intent == intent_enum.GIVE_UP:
+        await recorder.measure("give_up", game_manager.give_up(session_id))
+
+
+def _grown(before: tracemalloc.Snapshot, after: tracemalloc.Snapshot) -> Dict[str, int]:
+    """两次快照之间整个进程新增的内存, 以及其中只经过模拟服务端和本脚本、未经过插件代码分配的部分(字节)"""
+    used = {'process': 0, 'harness': 0}
+    for stat in after.compare_to(before, "traceback"):
+        used['process'] += stat.size_diff
+        files = [frame.filename for frame in stat.traceback]
+        if any(name.startswith(_HARNESS_DIR) for name in files) and not any(name.startswith(_PLUGIN_DIR) for name in files):
+            used['harness'] += stat.size_diff
+    return used
+
+
+async def measure_memory(game_manager: Any, server: FakeOpenAI, games: int, questions: int) -> Dict[str, float]:
+    """在零延迟下创建 `games` 个进行中的游戏, 返回每多一个游戏增加的内存(字节)
+
+    先创建一半游戏, 使缓存、连接池等与游戏数量无关的开销达到稳定, 只测量之后创建的另一半。
+
+    - process: 整个进程新增的内存
+    - harness: 其中由模拟服务端和本脚本分配的部分(空闲连接保留的请求、并发任务等), 实际部署中没有
+    - estimated: 插件自身估算的游戏状态(谜题、历史问答和摘要), 即统计信息中显示的值
+    """
+    for kind in server.latency:
+        server.latency[kind] = LatencyModel(0)
+    error_rate, server.error_rate = server.error_rate, 0.0
+
+    async def _fill(indexes: range):
+        async def _play(index: int):
+            session_id = f"memory-{index}"
+            await game_manager.create_game(session_id, theme="")
+            # 每个群组的提问各不相同, 与实际一样不共享字符串, 也不命中回答缓存
+            for question in QUESTIONS[:questions]:
+                await game_manager.process_question(session_id, f"{question}({index})")
+
+        await asyncio.gather(*(_play(index) for index in indexes))
+        gc.collect()
+
+    tracemalloc.start(_TRACE_FRAMES)
+    await _fill(range(games // 2))
+    before = tracemalloc.take_snapshot()
+    warm = len(game_manager.games)
+    await _fill(range(games // 2, games))
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    added = len(game_manager.games) - warm
+    estimated = game_manager.memory_report()['avg']
+
+    for session_id in list(game_manager.games):
+        game_manager.end_game(session_id)
+    server.error_rate = error_rate
+    if added <= 0:
+        return {}
+    used = _grown(before, after)
+    return {'process': used['process'] / added, 'harness': used['harness'] / added, 'estimated': estimated}
+
+
+def judge_breakdown(server: FakeOpenAI, game_manager: Any):
+    """把模拟服务端收到的评判请求数拆分为首次请求、重新输出、对冲和其余(重试、超时)
+
+    批量评判时一次请求裁定多个问题; 开启分级评判时一个问题先问快速模型, 裁定不被采用时再问评判模型。
+    """
+    from nonebot_plugin_ai_turtle_soup.metrics import PARSE_FAILED, PARSE_REASKED
+
+    queue = game_manager.question_queue
+    print(f"\n评判的问题: {queue.questions}, 评判批次: {queue.batches}")
+
+    requests = server.stats()['requests']
+    reask = game_manager.config.ats_response_reask
+    judge_pools = game_manager.component_stats()['judge_pools']
+    for kind in ("judge", "judge_fast"):
+        if not requests.get(kind):
+            continue
+        parses = game_manager.metrics.parses.get(kind, {})
+        first = sum(parses.values()) + game_manager.metrics.errors.get(kind, 0)
+        reasks = parses.get(PARSE_REASKED, 0) + (parses.get(PARSE_FAILED, 0) if reask else 0)
+        hedges = judge_pools.get(kind, {}).get('hedges', 0)
+        print(
+            f"{kind} 请求 {requests[kind]} = 首次 {first} + 重新输出 {reasks} + 对冲 {hedges}"
+            f" + 其余(重试、超时) {requests[kind] - first - reasks - hedges}"
+        )
+
+    cascade = game_manager.metrics.cascade_stats()
+    if cascade['total']:
+        escalated = sum(cascade[outcome] for outcome in ("low_confidence", "finish", "fast_error"))
+        print(
+            f"分级评判 {cascade['total']} 次: 采用快速模型 {cascade['fast']}, "
+            f"升级到评判模型 {escalated} (置信度低 {cascade['low_confidence']}, 游戏将要结束 {cascade['finish']}, "
+            f"快速模型失败 {cascade['fast_error']}), 疑似猜测谜底直接交给评判模型 {cascade['solution_guess']}"
+        )
+
+
+def report(args: argparse.Namespace, recorder: Recorder, elapsed: float, server: FakeOpenAI, game_manager: Any):
+    print(f"\n{args.groups} 个群组, 每组最多 {args.questions} 个问题, 用时 {elapsed:.2f} 秒")
+    questions = len(recorder.latencies["question"])
+    print(f"吞吐量: {questions / elapsed:.1f} 问题/秒, {args.groups / elapsed:.2f} 局/秒")
+    print(f"本地拦截的消息: {recorder.filtered}")
+
+    print(f"\n{'操作':<10}{'次数':>8}{'错误':>8}{'p50(ms)':>10}{'p95(ms)':>10}{'p99(ms)':>10}{'max(ms)':>10}")
+    for op in ("preview", "start", "question", "hint", "give_up"):
+        samples = recorder.latencies.get(op, [])
+        print(
+            f"{op:<10}{len(samples):>8}{recorder.errors.get(op, 0):>8}"
+            f"{percentile(samples, 0.50) * 1000:>10.1f}{percentile(samples, 0.95) * 1000:>10.1f}"
+            f"{percentile(samples, 0.99) * 1000:>10.1f}{max(samples, default=0) * 1000:>10.1f}"
+        )
+
+    stats = server.stats()
+    print(f"\n模型请求: {stats['requests']}, 注入错误: {stats['errors']}")
+    print(f"发送的 token(估算): {stats['prompt_tokens']}, 请求体: {stats['request_bytes'] / 1024:.1f} KiB")
+    if questions:
+        print(f"平均每个问题发送的 token: {stats['prompt_tokens'] / questions:.0f}")
+    print(f"插件记录的用量: {json.dumps(game_manager.metrics.usage.stats(), ensure_ascii=False)}")
+    rejections = game_manager.budget.rejections
+    if any(rejections.values()):
+        print(f"因预算用完被拒绝的请求: {json.dumps(rejections, ensure_ascii=False)}")
+    judge_breakdown(server, game_manager)
+
+    waits = [
+        f"{endpoint}: 平均排队 {limiter['wait_avg'] * 1000:.1f} ms, 最长 {limiter['wait_max'] * 1000:.1f} ms, 重试 {limiter['retries']}"
+        for endpoint, limiter in game_manager.scheduler.stats().items()
+    ]
+    print("调度器: " + "; ".join(waits))
+
+
+def report_memory(args: argparse.Namespace, memory: Dict[str, float]):
+    plugin = memory['process'] - memory['harness']
+    print(
+        f"\n每个进行中游戏占用的内存(含 {args.questions} 轮问答): {plugin / 1024:.1f} KiB, "
+        f"其中游戏状态(插件估算) {memory['estimated'] / 1024:.1f} KiB, 其余为回答缓存、用量统计等会话附属状态"
+    )
+    print(f"整个进程新增 {memory['process'] / 1024:.1f} KiB, 其中 {memory['harness'] / 1024:.1f} KiB 属于模拟服务端和测试脚本")
+
+
+async def run(args: argparse.Namespace):
+    server = FakeOpenAI(parse_latency(args.latency), args.error_rate, args.seed)
+    base_url = await server.start()
+
+    import nonebot
+
+    nonebot.init(
+        driver="~none",
+        ats_openai_generate_api_key="benchmark",
+        ats_openai_generate_base_url=base_url,
+        ats_openai_generate_model="fake-generate",
+        ats_openai_judge_api_key="benchmark",
+        ats_openai_judge_base_url=base_url,
+        ats_openai_judge_model="fake-judge",
+        localstore_use_cwd=True,
+        **parse_config(args.config)
+    )
+    nonebot.load_plugin("nonebot_plugin_ai_turtle_soup")
+    from nonebot_plugin_ai_turtle_soup import Intent, get_game_manager
+    game_manager = get_game_manager()
+
+    await game_manager.start()
+    recorder = Recorder()
+    try:
+        start = time.perf_counter()
+        await asyncio.gather(*(
+            play_group(game_manager, Intent, recorder, index, args) for index in range(args.groups)
+        ))
+        elapsed = time.perf_counter() - start
+
+        # 先输出负载测试的统计, 测量内存时的请求不计入
+        report(args, recorder, elapsed, server, game_manager)
+        if args.memory_games > 0:
+            memory = await measure_memory(game_manager, server, args.memory_games, args.questions)
+            if memory:
+                report_memory(args, memory)
+    finally:
+        await game_manager.close()
+        await server.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="多群组并发负载测试")
+    parser.add_argument("--groups", type=int, default=200, help="并发的模拟群组数量")
+    parser.add_argument("--questions", type=int, default=10, help="每个群组的提问次数")
+    parser.add_argument("--ramp", type=float, default=1.0, help="各群组开始游戏的时间分散在这段时间内(秒)")
+    parser.add_argument("--think", type=float, default=0.0, help="两次提问之间的平均间隔(秒)")
+    parser.add_argument("--memory-games", type=int, default=200, help="测量内存时创建的游戏数量, 0 为不测量")
+    parser.add_argument(
+        "--config", action="append", default=[], metavar="KEY=VALUE",
+        help="插件配置, 如 ats_split_progress=true, 可重复指定"
+    )
+    add_server_arguments(parser)
+    args = parser.parse_args()
+
+    # 谜题库等本地数据写入临时目录, 不影响机器人的数据
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -2,18 +2,29 @@
 NoneBot2 Turtle Soup Game Plugin
 海龟汤游戏插件
 """
-from nonebot import on_message
+from typing import Any, Dict, Optional
+
+from nonebot import get_driver, on_message
+from nonebot.drivers import URL, ASGIMixin, HTTPServerSetup, Request, Response
+from nonebot.permission import SUPERUSER
 from nonebot.plugin import PluginMetadata, require
 from nonebot.rule import to_me
 from nonebot.exception import FinishedException
 from nonebot.adapters import Event
 from nonebot.plugin import inherit_supported_adapters
 from nonebot.log import logger
-from .game_manager import GameManager
-from .config import Config
 
 require("nonebot_plugin_alconna")
 require("nonebot_plugin_uninfo")
+require("nonebot_plugin_localstore")
+
+from .budget import BUDGET_CATEGORIES, BUDGET_GENERATE, BUDGET_JUDGE, WINDOW_DAY, WINDOW_HOUR, WINDOWS, BudgetExceededError
+from .game_manager import GameManager
+from .game_store import GameEndedError, GameExistsError
+from .intent import REASON_OPEN_QUESTION, Intent
+from .config import Config, plugin_config
+from .metrics import render_prometheus
+from .question_queue import QuestionLimitError
 
 __plugin_meta__ = PluginMetadata(
     name="海龟汤游戏",
@@ -26,6 +37,8 @@ __plugin_meta__ = PluginMetadata(
     @bot 重新计算进度 - 重新分析并计算游戏进度
     @bot 放弃 - 放弃当前游戏并查看答案
     /海龟汤帮助 - 查看帮助信息
+    /海龟汤统计 - 查看模型调用统计(仅超级用户)
+    /海龟汤用量 [数量] - 查看本小时和今天 token 用量最多的群组(仅超级用户)
     """,
     type="application",
     homepage="https://github.com/xxtg666/nonebot-plugin-ai-turtle-soup",
@@ -43,8 +56,60 @@ from nonebot_plugin_alconna import (
 from nonebot_plugin_uninfo import Session, UniSession
 
 
-# 初始化游戏管理器
-game_manager = GameManager()
+# 游戏管理器在首次使用时创建, 导入插件时不打开数据库、不建立连接池
+_game_manager: Optional[GameManager] = None
+
+driver = get_driver()
+
+
+def get_game_manager() -> GameManager:
+    """获取游戏管理器, 首次调用时创建"""
+    global _game_manager
+    if _game_manager is None:
+        _game_manager = GameManager()
+    return _game_manager
+
+
+@driver.on_startup
+async def _start_game_manager():
+    """启动游戏管理器的后台任务(谜题预生成等)"""
+    await get_game_manager().start()
+
+
+@driver.on_shutdown
+async def _close_game_manager():
+    """关闭游戏管理器的后台任务"""
+    if _game_manager is not None:
+        await _game_manager.close()
+
+
+
+async def _metrics_endpoint(request: Request) -> Response:
+    """以 Prometheus 文本格式导出监控指标"""
+    token = plugin_config.ats_metrics_token
+    if token and request.headers.get("authorization") != f"Bearer {token}":
+        return Response(401, content="Unauthorized")
+    game_manager = get_game_manager()
+    content = render_prometheus(
+        game_manager.metrics,
+        game_manager.scheduler.stats(),
+        game_manager.games.stats(),
+        game_manager.intent_classifier.stats(),
+        game_manager.component_stats()
+    )
+    return Response(200, headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}, content=content)
+
+
+if plugin_config.ats_metrics_path:
+    if isinstance(driver, ASGIMixin):
+        driver.setup_http_server(HTTPServerSetup(
+            URL(plugin_config.ats_metrics_path),
+            "GET",
+            "ats_metrics",
+            _metrics_endpoint
+        ))
+    else:
+        logger.warning("当前驱动器不支持 HTTP 服务, 无法开启监控指标接口")
 
 # 定义 Alconna 命令
 start_game = on_alconna(
@@ -64,6 +129,25 @@ help_cmd = on_alconna(
     use_cmd_start=True
 )
 
+stats_cmd = on_alconna(
+    Alconna("海龟汤统计"),
+    priority=5,
+    block=True,
+    use_cmd_start=True,
+    permission=SUPERUSER
+)
+
+usage_cmd = on_alconna(
+    Alconna(
+        "海龟汤用量",
+        Args["limit", int, 5],
+    ),
+    priority=5,
+    block=True,
+    use_cmd_start=True,
+    permission=SUPERUSER
+)
+
 # @bot 消息处理器 - 用于提问、放弃、查看进度、提示、重新计算进度
 at_bot_handler = on_message(rule=to_me(), priority=6, block=True)
 
@@ -71,9 +155,11 @@ at_bot_handler = on_message(rule=to_me(), priority=6, block=True)
 @start_game.assign("$main")
 async def handle_start_game(result: Arparma, event: Event, session: Session = UniSession()):
     """开始新游戏"""
+    game_manager = get_game_manager()
     session_id = session.scene.id
     
     # 检查是否已有进行中的游戏
+    await game_manager.sync_game(session_id)
     if game_manager.has_active_game(session_id):
         await UniMessage("当前已有进行中的游戏!请先完成或放弃当前游戏。").finish()
     
@@ -82,48 +168,65 @@ async def handle_start_game(result: Arparma, event: Event, session: Session = Un
     
     await UniMessage("正在生成新的海龟汤谜题,请稍候...").send()
     
+    # 流式生成时题目和汤面完整后先发出, 谜题其余部分在之后继续生成
+    previewed = False
+    
+    async def _send_preview(preview: Dict[str, str]):
+        nonlocal previewed
+        previewed = True
+        await UniMessage(_start_message(preview)).send()
+    
     try:
-        puzzle = await game_manager.create_game(session_id, theme=theme)
+        puzzle = await game_manager.create_game(session_id, theme=theme, on_preview=_send_preview)
 
         logger.info(f"{session_id} 创建了新的海龟汤游戏: \n{puzzle}")
-
-        message_1 = (
-            f"🎮 海龟汤游戏开始!\n\n"
-            f"📖 题目: {puzzle['title']}\n\n"
-            f"🤔 汤面:\n{puzzle['puzzle_setting']}\n\n"
-            f"💡 直接 @我 提问即可,例如: @bot 这个人是故意的吗?\n"
-            f"问题应该是可以用\"是\"、\"否\"或\"不重要\"回答的\n"
-            f"想要放弃请 @我 说\"放弃\"\n"
-            f"需要提示请 @我 说\"提示\"\n\n"
-            f"📊 当前进度: 0%"
-        )
         
-        await UniMessage(message_1).finish()
+        if previewed:
+            return
+        
+        message_1 = _start_message(puzzle)
         
-        # 生成谜题评分
-        # await UniMessage("正在评估谜题质量...").send()
-        # rating = await game_manager.rate_puzzle(session_id)
-
-        # message_2 = (
-        #     f"⭐ 谜题评分:\n"
-        #     f"  综合评分: {rating['scores']['overall']}/10\n"
-        #     f"  悬念度: {rating['scores']['suspense']}/10\n"
-        #     f"  逻辑性: {rating['scores']['logic']}/10\n"
-        #     f"  创意性: {rating['scores']['creativity']}/10\n"
-        #     f"  可玩性: {rating['scores']['playability']}/10"
-        # )
+        # 谜题评分在后台进行, 这里只展示已有的评分, 不等待评分
+        if 'scores' in puzzle:
+            message_1 += f"\n⭐ 谜题评分: {puzzle['scores']['overall']}/10"
         
-        # await UniMessage(message_2).finish()
+        await UniMessage(message_1).finish()
     except FinishedException:
         return
+    
+    except GameEndedError:
+        # 汤面发出后、谜题生成完成前游戏已结束(超时或被淘汰)
+        return
+    
+    except GameExistsError:
+        # 生成期间其他人(或其他进程)已在这个会话开始了游戏
+        await UniMessage("当前已有进行中的游戏!请先完成或放弃当前游戏。").finish()
+    
+    except BudgetExceededError as e:
+        await UniMessage(f"⛔ {e},暂时无法开始新游戏。").finish()
         
     except Exception as e:
         await UniMessage(f"生成游戏失败: {str(e)}\n请检查配置或稍后重试。").finish()
 
 
+def _start_message(puzzle: Dict[str, Any]) -> str:
+    """游戏开始时发出的题目和汤面"""
+    return (
+        f"🎮 海龟汤游戏开始!\n\n"
+        f"📖 题目: {puzzle['title']}\n\n"
+        f"🤔 汤面:\n{puzzle['puzzle_setting']}\n\n"
+        f"💡 直接 @我 提问即可,例如: @bot 这个人是故意的吗?\n"
+        f"问题应该是可以用\"是\"、\"否\"或\"不重要\"回答的\n"
+        f"想要放弃请 @我 说\"放弃\"\n"
+        f"需要提示请 @我 说\"提示\"\n\n"
+        f"📊 当前进度: 0%"
+    )
+
+
 @at_bot_handler.handle()
 async def handle_at_bot(event: Event, session: Session = UniSession()):
     """处理@bot的消息 - 提问、放弃、查看进度、提示、重新计算进度"""
+    game_manager = get_game_manager()
     session_id = session.scene.id
 
     # 获取消息内容
@@ -131,42 +234,50 @@ async def handle_at_bot(event: Event, session: Session = UniSession()):
     text = msg.extract_plain_text().strip()
     
     # 如果是命令开头,不处理(让命令处理器处理)
-    if text.startswith('/') or text.startswith('开始海龟汤') or text.startswith('海龟汤帮助'):
+    if text.startswith(('/', '开始海龟汤', '海龟汤帮助', '海龟汤统计', '海龟汤用量')):
         await at_bot_handler.skip()
     
-    # 检查是否有活跃游戏
+    # 检查是否有活跃游戏, 共享状态模式下先按版本号同步其他进程的修改
+    await game_manager.sync_game(session_id)
     if not game_manager.has_active_game(session_id):
         # 没有游戏时不响应
         await at_bot_handler.skip()
     
-    if not text:
+    # 本地识别消息意图, 闲聊和无法用是/否回答的问题直接回复, 不调用模型
+    intent, reason = game_manager.intent_classifier.classify(text)
+    
+    if intent == Intent.INVALID:
+        if reason == REASON_OPEN_QUESTION:
+            await UniMessage("🤔 这个问题无法用\"是\"或\"不是\"回答,换个问法试试吧!\n例如: @bot 他是故意的吗?").finish()
         await UniMessage("请输入你的问题、\"查看进度\"、\"提示\"、\"重新计算进度\"或\"放弃\"").finish()
     
     # 检查是否是查看进度
-    if text in ["查看进度", "进度", "当前进度", "看进度", "查询进度"]:
+    if intent == Intent.PROGRESS:
         game = game_manager.get_game(session_id)
-        puzzle = game['puzzle']
         
         message = (
             f"📈 当前游戏进度\n\n"
-            f"📖 题目: {puzzle['title']}\n\n"
-            f"🤔 汤面:\n{puzzle['puzzle_setting']}\n\n"
-            f"📊 进度: {game['percent']}%\n"
-            f"🔢 已提问: {len(game['history'])}/{game_manager.config.ats_max_questions}次\n\n"
+            f"📖 题目: {game.title}\n\n"
+            f"🤔 汤面:\n{game.puzzle_setting}\n\n"
+            f"📊 进度: {game.percent}%\n"
+            f"🔢 已提问: {game.question_count}/{game_manager.config.ats_max_questions}次\n\n"
         )
         
+        if game.unscored:
+            message += f"⏳ 最近 {game.unscored} 个问题的进度尚在计算中\n\n"
+        
         # 显示最近的3个问答
-        if game['history']:
+        recent_history = game.recent_turns(3)
+        if recent_history:
             message += "❓ 最近的问答:\n"
-            recent_history = game['history'][-3:]
-            for i, qa in enumerate(recent_history, 1):
-                message += f"{i}. Q: {qa['question']}\n   A: {qa['answer']}\n"
+            for i, turn in enumerate(recent_history, 1):
+                message += f"{i}. Q: {turn.question}\n   A: {turn.answer}\n"
         
         await UniMessage(message).finish()
     
     # 检查是否是提示
-    if text in ["提示", "给个提示", "来个提示", "要提示"]:
-        hint_result = game_manager.get_next_hint(session_id)
+    if intent == Intent.HINT:
+        hint_result = await game_manager.get_next_hint(session_id)
         
         if hint_result is None:
             await UniMessage("暂无可用的提示信息。").finish()
@@ -180,7 +291,7 @@ async def handle_at_bot(event: Event, session: Session = UniSession()):
             await UniMessage(message).finish()
     
     # 检查是否是重新计算进度
-    if text in ["重新计算进度", "重算进度", "重新计算", "重新评估", "更新进度"]:
+    if intent == Intent.RECALCULATE:
         await UniMessage("正在重新计算进度...").send()
         
         try:
@@ -190,61 +301,51 @@ async def handle_at_bot(event: Event, session: Session = UniSession()):
             message = (
                 f"🔄 进度已重新计算\n\n"
                 f"📊 新的进度: {new_percent}%\n"
-                f"🔢 已提问: {len(game['history'])}/{game_manager.config.ats_max_questions}次"
+                f"🔢 已提问: {game.question_count}/{game_manager.config.ats_max_questions}次"
             )
             
             await UniMessage(message).finish()
         except FinishedException:
             return
+        except GameEndedError:
+            # 计算期间游戏已结束(放弃或超时), 不再回复
+            return
         except Exception as e:
             await UniMessage(f"重新计算进度失败: {str(e)}").finish()
     
     # 检查是否是放弃
-    if text in ["放弃", "我放弃", "不玩了", "公布答案", "看答案", "放弃游戏"]:
-        game = game_manager.get_game(session_id)
-        
-        try:
-            result = await game_manager.process_question(session_id, "我放弃了,请告诉我答案")
-            game_manager.end_game(session_id)
-            
-            # 构建附加信息列表
-            supplementary_info = "\n".join([f"• {info}" for info in game['puzzle']['supplementary_info']])
-            
-            message = (
-                f"😔 游戏结束\n\n"
-                f"📖 题目: {game['puzzle']['title']}\n\n"
-                f"🔢 总提问数: {len(game['history'])}\n\n"
-                f"📖 正确答案:\n{game['puzzle']['solution']}\n\n"
-                f"💡 全部附加信息:\n{supplementary_info}\n\n"
-                f"💡 再接再厉!使用 /开始海龟汤 开始新游戏"
-            )
-            
-            await UniMessage(message).finish()
-        except FinishedException:
+    if intent == Intent.GIVE_UP:
+        game = await game_manager.give_up(session_id)
+        if game is None:
             return
-            
-        except Exception as e:
-            # 即使出错也要结束游戏并显示答案
-            game_manager.end_game(session_id)
-            # 构建附加信息列表
-            supplementary_info = "\n".join([f"• {info}" for info in game['puzzle']['supplementary_info']])
-            message = (
-                f"📖 正确答案:\n{game['puzzle']['solution']}\n\n"
-                f"💡 全部附加信息:\n{supplementary_info}\n\n"
-                f"💡 使用 /开始海龟汤 开始新游戏"
-            )
-            await UniMessage(message).finish()
+        
+        # 构建附加信息列表
+        supplementary_info = "\n".join([f"• {info}" for info in game.supplementary_info])
+        
+        message = (
+            f"😔 游戏结束\n\n"
+            f"📖 题目: {game.title}\n\n"
+            f"🔢 总提问数: {game.question_count}\n\n"
+            f"📖 正确答案:\n{game.solution}\n\n"
+            f"💡 全部附加信息:\n{supplementary_info}\n\n"
+            f"💡 再接再厉!使用 /开始海龟汤 开始新游戏"
+        )
+        
+        await UniMessage(message).finish()
     
     # 处理提问
     question = text
-    game = game_manager.get_game(session_id)
+    game = await game_manager.wait_ready(session_id)
+    if game is None:
+        return
     
-    # 检查问题数量限制
-    if len(game['history']) >= game_manager.config.ats_max_questions:
-        await UniMessage(
-            f"已达到最大提问次数({game_manager.config.ats_max_questions}次)!\n"
-            f"@我 说\"放弃\"可以查看答案。"
-        ).finish()
+    # 检查问题数量限制, 同时提交的多个问题在评判前还会再检查一次
+    limit_message = (
+        f"已达到最大提问次数({game_manager.config.ats_max_questions}次)!\n"
+        f"@我 说\"放弃\"可以查看答案。"
+    )
+    if game.question_count >= game_manager.config.ats_max_questions:
+        await UniMessage(limit_message).finish()
     
     try:
         result = await game_manager.process_question(session_id, question)
@@ -253,33 +354,172 @@ async def handle_at_bot(event: Event, session: Session = UniSession()):
         message = f"❓ 你的问题: {question}\n"
         message += f"💬 回答: {result['reply']}\n"
         message += f"📊 进度: {result['percent']}%\n"
-        message += f"🔢 已提问: {len(game['history'])}/{game_manager.config.ats_max_questions}次"
+        if result.get('cached'):
+            message += "♻️ 这个问题之前问过了,不计入提问次数\n"
+        message += f"🔢 已提问: {game.question_count}/{game_manager.config.ats_max_questions}次"
         
         # 检查是否游戏结束
         if result['percent'] >= 100:
             # 构建附加信息列表
-            supplementary_info = "\n".join([f"• {info}" for info in game['puzzle']['supplementary_info']])
+            supplementary_info = "\n".join([f"• {info}" for info in game.supplementary_info])
             
             game_manager.end_game(session_id)
             
             if result['reply'] and result['reply'] not in ["是", "不是", "不重要"]:
                 # 玩家猜对了
-                message += f"\n\n📖 完整答案:\n{game['puzzle']['solution']}"
+                message += f"\n\n📖 完整答案:\n{game.solution}"
                 message += f"\n\n💡 全部附加信息:\n{supplementary_info}"
                 message += f"\n\n🎉 使用 /开始海龟汤 开始新游戏"
             else:
                 # 玩家放弃了
-                message += f"\n\n📖 正确答案:\n{game['puzzle']['solution']}"
+                message += f"\n\n📖 正确答案:\n{game.solution}"
                 message += f"\n\n💡 全部附加信息:\n{supplementary_info}"
         
         await UniMessage(message).finish()
     except FinishedException:
         return
         
+    except GameEndedError:
+        # 等待回答期间游戏已结束(放弃或超时), 不再回复这个问题
+        return
+    
+    except QuestionLimitError:
+        await UniMessage(limit_message).finish()
+    
+    except BudgetExceededError as e:
+        await UniMessage(f"⛔ {e}。\n之前问过的问题仍可以回答,也可以 @我 说\"放弃\"查看答案。").finish()
+        
     except Exception as e:
         await UniMessage(f"处理问题时出错: {str(e)}").finish()
 
 
+@stats_cmd.assign("$main")
+async def handle_stats(session: Session = UniSession()):
+    """查看模型调用统计(仅超级用户)"""
+    game_manager = get_game_manager()
+    metrics = game_manager.metrics
+    message = "📈 模型调用统计\n"
+    
+    stats = metrics.stats()
+    if not stats:
+        message += "\n暂无模型调用记录"
+    for kind, item in stats.items():
+        message += (
+            f"\n[{kind}] 调用 {item['calls']} 次, 失败 {item['errors']} 次\n"
+            f"  返回内容: 本地修复 {item['parse_repaired']} 次, 重新输出 {item['parse_reasked']} 次, 解析失败 {item['parse_failures']} 次\n"
+            f"  平均耗时 {item['latency_avg']:.2f}s, p50 ≤ {item['latency_p50']:g}s, p95 ≤ {item['latency_p95']:g}s\n"
+            f"  token: 输入 {item['prompt_tokens']} (缓存命中 {item['cached_tokens']}), 输出 {item['completion_tokens']}\n"
+        )
+    
+    cascade = metrics.cascade_stats()
+    if cascade['total']:
+        message += (
+            f"\n⚖️ 分级评判 {cascade['total']} 次, 快速模型直接采用 {cascade['fast_rate']:.0%}; "
+            f"交给评判模型: 置信度低 {cascade['low_confidence']} 次, 疑似猜测谜底 {cascade['solution_guess']} 次, "
+            f"游戏将结束 {cascade['finish']} 次, 快速模型失败 {cascade['fast_error']} 次\n"
+        )
+    
+    intents = game_manager.intent_classifier.stats()
+    if any(intents.values()):
+        message += (
+            f"\n🧹 本地识别消息 {sum(value for key, value in intents.items() if key != 'filtered')} 条, "
+            f"交给评判模型 {intents['question']} 条, 直接拦截 {intents['filtered']} 条(未调用模型)\n"
+        )
+    
+    components = game_manager.component_stats()
+    message += "\n"
+    cache = components['answer_cache']
+    if cache is not None:
+        message += f"♻️ 回答缓存: 命中 {cache['hits']} 次(省下的评判调用), 未命中 {cache['misses']} 次, 已缓存 {cache['entries']} 条回答\n"
+    pool = components['pool']
+    message += (
+        f"🧺 预生成池: 现有 {sum(pool['buckets'].values())} 道, 取用命中 {pool['hits']} 次, 未命中 {pool['misses']} 次, "
+        f"已生成 {pool['generated']} 道, 生成失败 {pool['failures']} 次\n"
+    )
+    library = components['library']
+    if library is not None:
+        message += f"📚 谜题库: {library['puzzles']} 道(已评分 {library['rated']} 道), 累计游玩 {library['plays']} 次\n"
+    for name, judge_stats in components['judge_pools'].items():
+        message += (
+            f"🧑‍⚖️ 评判接口池[{name}]: 切换接口 {judge_stats['failovers']} 次, "
+            f"对冲请求 {judge_stats['hedges']} 次(对冲先返回 {judge_stats['hedge_wins']} 次)\n"
+        )
+        for endpoint, item in judge_stats['endpoints'].items():
+            ewma = f"{item['ewma']:.2f}s" if item['ewma'] is not None else "-"
+            message += (
+                f"  {endpoint}: 调用 {item['calls']} 次, 失败 {item['errors']} 次, "
+                f"近期延迟 {ewma}{'' if item['healthy'] else ', 冷却中'}\n"
+            )
+    http_pool = components['http_pool']
+    message += f"🔌 HTTP 连接池: {len(http_pool['origins'])} 个源, HTTP/2 {'开启' if http_pool['http2'] else '关闭'}\n"
+    
+    scheduler_stats = game_manager.scheduler.stats()
+    retries = sum(item['retries'] for item in scheduler_stats.values())
+    calls = sum(item['calls'] for item in scheduler_stats.values())
+    wait_avg = sum(item['wait_total'] for item in scheduler_stats.values()) / calls if calls else 0.0
+    wait_max = max((item['wait_max'] for item in scheduler_stats.values()), default=0.0)
+    games = game_manager.games.stats()
+    message += (
+        f"\n🔁 重试 {retries} 次, 排队平均 {wait_avg * 1000:.0f} ms, 最长 {wait_max * 1000:.0f} ms"
+        f"\n🎮 进行中的游戏 {games['live']} 局"
+    )
+    memory = game_manager.memory_report()
+    if memory['games']:
+        message += (
+            f"\n💾 游戏状态约占 {memory['total'] / 1024:.1f} KiB, "
+            f"平均每局 {memory['avg'] / 1024:.1f} KiB, 最大 {memory['max'] / 1024:.1f} KiB"
+        )
+    
+    top = metrics.top_sessions(5)
+    if top:
+        message += "\n\n🏷️ 用量最多的会话:"
+        for session_id, totals in top:
+            message += f"\n  {session_id}: {totals['calls']} 次, 输入 {totals['prompt_tokens']}, 输出 {totals['completion_tokens']}"
+    
+    current = metrics.session_totals(session.scene.id)
+    if current:
+        message += f"\n\n📍 当前会话: {current['calls']} 次, 输入 {current['prompt_tokens']}, 输出 {current['completion_tokens']}"
+    
+    await UniMessage(message).finish()
+
+
+@usage_cmd.assign("$main")
+async def handle_usage(result: Arparma):
+    """查看各群组的 token 用量和预算(仅超级用户)"""
+    budget = get_game_manager().budget
+    limit = max(1, result.query("limit") or 5)
+    category_names = {BUDGET_GENERATE: "生成", BUDGET_JUDGE: "提问"}
+    window_names = {WINDOW_HOUR: "本小时", WINDOW_DAY: "今天"}
+    
+    message = "💰 群组 token 用量"
+    for window in WINDOWS:
+        limits = ", ".join(
+            f"{category_names[category]} {budget.limit(category, window) or '不限'}"
+            for category in BUDGET_CATEGORIES
+        )
+        message += f"\n\n[{window_names[window]}] 预算: {limits}"
+        top = budget.top(window, limit)
+        if not top:
+            message += "\n  暂无用量"
+        for session_id, totals in top:
+            usage = ", ".join(f"{category_names[category]} {totals[category]}" for category in BUDGET_CATEGORIES)
+            marks = [
+                category_names[category] for category in BUDGET_CATEGORIES
+                if budget.exceeded(session_id, category)
+            ]
+            message += f"\n  {session_id}: {usage}"
+            if marks:
+                message += f" (已用完: {'/'.join(marks)})"
+    
+    rejections = budget.rejections
+    if any(rejections.values()):
+        message += "\n\n⛔ 因额度用完被拒绝: " + ", ".join(
+            f"{category_names[category]} {rejections[category]} 次" for category in BUDGET_CATEGORIES
+        )
+    
+    await UniMessage(message).finish()
+
+
 @help_cmd.assign("$main")
 async def handle_help():
     """显示帮助信息"""
@@ -0,0 +1,117 @@
+"""
+问题回答缓存模块
+"""
+import re
+from collections import OrderedDict
+from typing import Dict, FrozenSet, Optional, Tuple
+from .text_utils import char_ngrams, dice, normalize_text
+
+# 可以被缓存的回答
+CACHEABLE_REPLIES = ("是", "不是", "不重要")
+
+# 句首的礼貌用语和句尾的语气词
+_LEADING_RE = re.compile(r"^(请问|那么|那|所以|我想问|问一下)+")
+_TRAILING_RE = re.compile(r"[吗呢吧啊呀么嘛哦喔啦呐]+$")
+
+# 否定词, 否定词数量不同的两个问题意思可能完全相反
+_NEGATIONS = "不没非无未别"
+
+
+def normalize_question(question: str) -> str:
+    """规范化问题: 去除标点空白、句首客套和句尾语气词"""
+    text = normalize_text(question)
+    text = _LEADING_RE.sub("", text)
+    text = _TRAILING_RE.sub("", text)
+    return text
+
+
+def _negation_count(text: str) -> int:
+    """统计文本中否定词的数量"""
+    return sum(text.count(char) for char in _NEGATIONS)
+
+
+class AnswerCache:
+    """单个谜题的问题回答缓存"""
+
+    def __init__(self, threshold: float):
+        self.threshold = threshold
+        # 规范化问题 -> (n-gram 集合, 回答)
+        self._entries: Dict[str, Tuple[FrozenSet[str], str]] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, question: str) -> Optional[str]:
+        """查找相同或近似问题的回答"""
+        key = normalize_question(question)
+        if not key:
+            return None
+        entry = self._entries.get(key)
+        if entry:
+            return entry[1]
+
+        grams = char_ngrams(key)
+        chars = set(key)
+        negations = _negation_count(key)
+        for other, (other_grams, reply) in self._entries.items():
+            # 否定词数量不同, 或者存在替换(而不只是增删)的字, 都视为不同的问题
+            if _negation_count(other) != negations:
+                continue
+            other_chars = set(other)
+            if not (chars <= other_chars or other_chars <= chars):
+                continue
+            if dice(grams, other_grams) >= self.threshold:
+                return reply
+        return None
+
+    def put(self, question: str, reply: str):
+        """缓存问题的回答, 只缓存是/不是/不重要"""
+        key = normalize_question(question)
+        if key and reply in CACHEABLE_REPLIES:
+            self._entries[key] = (char_ngrams(key), reply)
+
+
+class AnswerCacheStore:
+    """按谜题划分的回答缓存集合, 超出容量时淘汰最久未使用的谜题"""
+
+    def __init__(self, threshold: float, max_puzzles: int = 256):
+        self.threshold = threshold
+        self.max_puzzles = max_puzzles
+        self._caches: "OrderedDict[str, AnswerCache]" = OrderedDict()
+
+        # 统计计数
+        self.hits = 0
+        self.misses = 0
+
+    def _cache_for(self, puzzle_key: str) -> AnswerCache:
+        """获取谜题对应的缓存, 不存在时创建"""
+        cache = self._caches.get(puzzle_key)
+        if cache is None:
+            cache = self._caches[puzzle_key] = AnswerCache(self.threshold)
+            while len(self._caches) > self.max_puzzles:
+                self._caches.popitem(last=False)
+        else:
+            self._caches.move_to_end(puzzle_key)
+        return cache
+
+    def lookup(self, puzzle_key: str, question: str) -> Optional[str]:
+        """查找缓存的回答并记录命中情况"""
+        reply = self._cache_for(puzzle_key).get(question)
+        if reply is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return reply
+
+    def store(self, puzzle_key: str, question: str, reply: str):
+        """缓存问题的回答"""
+        self._cache_for(puzzle_key).put(question, reply)
+
+    def stats(self) -> Dict[str, int]:
+        """获取缓存的统计信息"""
+        return {
+            'puzzles': len(self._caches),
+            'entries': sum(len(cache) for cache in self._caches.values()),
+            'hits': self.hits,
+            'misses': self.misses
+        }
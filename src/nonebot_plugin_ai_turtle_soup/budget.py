@@ -0,0 +1,275 @@
+"""
+会话 token 预算模块
+
+按会话(群组/频道)统计每小时、每天生成谜题和评判提问消耗的 token,
+超出配置的预算时拒绝新的调用。窗口按本地时间在整点和零点重置。
+配置了键值存储时, 用量写入存储, 重启后以及多个进程之间共用同一份预算。
+"""
+import asyncio
+import json
+import os
+import socket
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Set, Tuple
+from nonebot.log import logger
+from .kv_store import KVStore
+
+# 预算类别: 生成谜题(含谜题评分和关键事实提取)与评判提问(含进度计算)
+BUDGET_GENERATE = "generate"
+BUDGET_JUDGE = "judge"
+BUDGET_CATEGORIES = (BUDGET_GENERATE, BUDGET_JUDGE)
+
+# 模型调用类型所属的预算类别
+_KIND_CATEGORIES = {
+    "generate": BUDGET_GENERATE,
+    "rate": BUDGET_GENERATE,
+    "facts": BUDGET_GENERATE,
+    "judge": BUDGET_JUDGE,
+    "judge_fast": BUDGET_JUDGE,
+    "progress": BUDGET_JUDGE,
+}
+
+# 统计窗口
+WINDOW_HOUR = "hour"
+WINDOW_DAY = "day"
+WINDOWS = (WINDOW_HOUR, WINDOW_DAY)
+
+# 写入用量时等待其他进程释放租约的最长时间(秒), 以及租约的有效期(秒)
+_LEASE_WAIT = 5.0
+_LEASE_TTL = 10.0
+
+_CATEGORY_NAMES = {BUDGET_GENERATE: "生成谜题", BUDGET_JUDGE: "提问"}
+_WINDOW_NAMES = {WINDOW_HOUR: "本小时", WINDOW_DAY: "今天"}
+
+
+def _window_start(window: str, now: datetime) -> datetime:
+    if window == WINDOW_HOUR:
+        return now.replace(minute=0, second=0, microsecond=0)
+    return now.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _window_end(window: str, start: datetime) -> datetime:
+    return start + (timedelta(hours=1) if window == WINDOW_HOUR else timedelta(days=1))
+
+
+class BudgetExceededError(Exception):
+    """会话的 token 预算已用完"""
+
+    def __init__(self, category: str, window: str, reset_at: datetime):
+        self.category = category
+        self.window = window
+        self.reset_at = reset_at
+        day = "明天 " if reset_at.date() != datetime.now().date() else ""
+        super().__init__(
+            f"本群{_WINDOW_NAMES[window]}的{_CATEGORY_NAMES[category]}额度已用完, "
+            f"{day}{reset_at:%H:%M} 后恢复"
+        )
+
+
+# 会话的用量: (类别, 窗口) -> (窗口起点, 已用 token)
+Usage = Dict[Tuple[str, str], Tuple[datetime, int]]
+
+
+def _merge(usage: Usage, delta: Usage):
+    """把 `delta` 中的用量累加到 `usage`, 窗口起点不同时以较新的窗口为准"""
+    for key, (start, tokens) in delta.items():
+        previous = usage.get(key)
+        if previous is None or previous[0] < start:
+            usage[key] = (start, tokens)
+        elif previous[0] == start:
+            usage[key] = (start, previous[1] + tokens)
+
+
+def _dumps_usage(usage: Usage) -> str:
+    return json.dumps({
+        f"{category}:{window}": [start.isoformat(), tokens]
+        for (category, window), (start, tokens) in usage.items()
+    })
+
+
+def _loads_usage(text: str) -> Usage:
+    usage: Usage = {}
+    for key, (start, tokens) in json.loads(text).items():
+        category, window = key.split(":", 1)
+        usage[(category, window)] = (datetime.fromisoformat(start), int(tokens))
+    return usage
+
+
+class TokenBudget:
+    """按会话和时间窗口累计的 token 用量及预算
+
+    `limits` 为 {类别: {窗口: token 数}}, 未配置或为 0 的预算不限制, 但仍然统计用量。
+    配置了 `store` 时, 新的用量在后台合并写入存储(持有会话的用量租约),
+    检查预算前调用 `sync` 读取存储中的用量, 使预算在重启后和多个进程之间保持一致。
+    """
+
+    def __init__(
+        self,
+        limits: Dict[str, Dict[str, int]],
+        store: Optional[KVStore] = None,
+        key_prefix: str = "ats:"
+    ):
+        self.limits = limits
+        self.store = store
+        self.key_prefix = key_prefix
+        self.owner = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        # 会话 -> 当前窗口内的用量
+        self._usage: Dict[str, Usage] = {}
+        # 尚未写入存储的用量, 以及正在写入的用量
+        self._pending: Dict[str, Usage] = {}
+        self._writing: Dict[str, Usage] = {}
+        self._flusher: Optional[asyncio.Task] = None
+        self._tasks: Set[asyncio.Task] = set()
+        # 上一次清理过期窗口时所在的小时
+        self._pruned_at: Optional[datetime] = None
+
+        # 统计计数
+        self.rejections: Dict[str, int] = dict.fromkeys(BUDGET_CATEGORIES, 0)
+
+    def _key(self, session_id: str) -> str:
+        return f"{self.key_prefix}budget:{session_id}"
+
+    def limit(self, category: str, window: str) -> int:
+        return self.limits.get(category, {}).get(window, 0)
+
+    def used(self, session_id: str, category: str, window: str, now: Optional[datetime] = None) -> int:
+        """会话在当前窗口内已用的 token"""
+        now = now or datetime.now()
+        entry = self._usage.get(session_id, {}).get((category, window))
+        if entry is None or entry[0] != _window_start(window, now):
+            return 0
+        return entry[1]
+
+    def record(self, session_id: str, kind: str, tokens: int, now: Optional[datetime] = None):
+        """累计一次模型调用的 token, 不属于任何预算类别的调用不统计"""
+        category = _KIND_CATEGORIES.get(kind)
+        if category is None or tokens <= 0:
+            return
+        now = now or datetime.now()
+        self._prune(now)
+        delta = {(category, window): (_window_start(window, now), tokens) for window in WINDOWS}
+        _merge(self._usage.setdefault(session_id, {}), delta)
+        if self.store is not None:
+            _merge(self._pending.setdefault(session_id, {}), delta)
+            self._schedule_flush()
+
+    def _schedule_flush(self):
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self.flush())
+            self._tasks.add(self._flusher)
+            self._flusher.add_done_callback(self._tasks.discard)
+
+    async def flush(self):
+        """把尚未写入的用量合并到存储中, 写入失败的用量留到下一次写入"""
+        assert self.store is not None
+        while self._pending:
+            session_id, delta = self._pending.popitem()
+            self._writing[session_id] = delta
+            try:
+                await self._write(session_id, delta)
+            except Exception as e:
+                logger.warning(f"{session_id} 写入 token 用量失败: {e}")
+                _merge(self._pending.setdefault(session_id, {}), delta)
+                return
+            finally:
+                del self._writing[session_id]
+
+    async def _write(self, session_id: str, delta: Usage):
+        assert self.store is not None
+        key = self._key(session_id)
+        lease_key = f"{key}:lease"
+        deadline = time.monotonic() + _LEASE_WAIT
+        while not await self.store.acquire(lease_key, self.owner, _LEASE_TTL):
+            if time.monotonic() >= deadline:
+                raise TimeoutError("等待用量租约超时")
+            await asyncio.sleep(0.05)
+        try:
+            item = await self.store.get(key)
+            usage = _loads_usage(item[1]) if item is not None else {}
+            _merge(usage, delta)
+            # 保存到当天的窗口结束, 之后的用量已经没有意义
+            day_end = _window_end(WINDOW_DAY, _window_start(WINDOW_DAY, datetime.now()))
+            ttl = (day_end - datetime.now()).total_seconds() + 60
+            await self.store.put(key, _dumps_usage(usage), ttl)
+        finally:
+            await self.store.release(lease_key, self.owner)
+
+    async def sync(self, session_id: str):
+        """从存储中读取会话的用量, 加上本进程尚未写入的部分, 读取失败时沿用本地的用量"""
+        if self.store is None:
+            return
+        try:
+            item = await self.store.get(self._key(session_id))
+        except Exception as e:
+            logger.warning(f"{session_id} 读取 token 用量失败: {e}")
+            return
+        usage = _loads_usage(item[1]) if item is not None else {}
+        for unwritten in (self._writing, self._pending):
+            _merge(usage, unwritten.get(session_id, {}))
+        if usage:
+            self._usage[session_id] = usage
+        else:
+            self._usage.pop(session_id, None)
+
+    async def close(self):
+        """写入剩余的用量"""
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self.store is not None and self._pending:
+            await self.flush()
+
+    def exceeded(self, session_id: str, category: str, now: Optional[datetime] = None) -> Optional[Tuple[str, datetime]]:
+        """预算用完时返回 (窗口, 恢复时间), 多个窗口都用完时取恢复最晚的"""
+        now = now or datetime.now()
+        result = None
+        for window in WINDOWS:
+            limit = self.limit(category, window)
+            if limit > 0 and self.used(session_id, category, window, now) >= limit:
+                result = (window, _window_end(window, _window_start(window, now)))
+        return result
+
+    def check(self, session_id: str, category: str):
+        """预算用完时抛出 BudgetExceededError"""
+        now = datetime.now()
+        self._prune(now)
+        exceeded = self.exceeded(session_id, category, now)
+        if exceeded is not None:
+            self.rejections[category] += 1
+            raise BudgetExceededError(category, *exceeded)
+
+    def _prune(self, now: datetime):
+        """移除已经过去的窗口, 没有剩余窗口的会话一并移除; 每个小时最多清理一次"""
+        hour = _window_start(WINDOW_HOUR, now)
+        if hour == self._pruned_at:
+            return
+        self._pruned_at = hour
+        starts = {window: _window_start(window, now) for window in WINDOWS}
+        for session_id in list(self._usage):
+            usage = self._usage[session_id]
+            for key in [key for key, (start, _) in usage.items() if start != starts[key[1]]]:
+                del usage[key]
+            if not usage:
+                del self._usage[session_id]
+
+    def session_usage(self, session_id: str, now: Optional[datetime] = None) -> Dict[str, Dict[str, int]]:
+        """会话当前窗口内各类别的用量: {类别: {窗口: token}}"""
+        now = now or datetime.now()
+        return {
+            category: {window: self.used(session_id, category, window, now) for window in WINDOWS}
+            for category in BUDGET_CATEGORIES
+        }
+
+    def top(self, window: str = WINDOW_DAY, limit: int = 5) -> List[Tuple[str, Dict[str, int]]]:
+        """当前窗口内用量最多的会话: [(会话, {类别: token})]"""
+        now = datetime.now()
+        self._prune(now)
+        ranked = []
+        for session_id in self._usage:
+            usage = self.session_usage(session_id, now)
+            totals = {category: usage[category][window] for category in BUDGET_CATEGORIES}
+            if any(totals.values()):
+                ranked.append((session_id, totals))
+        ranked.sort(key=lambda item: sum(item[1].values()), reverse=True)
+        return ranked[:limit]
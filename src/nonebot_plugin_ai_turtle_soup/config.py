@@ -1,7 +1,16 @@
+from typing import List, Optional
 from pydantic import BaseModel, Field
 from nonebot import get_plugin_config
 
 
+class JudgeEndpointConfig(BaseModel):
+    """评判接口配置, 未填写的字段沿用 ats_openai_judge_* 的配置"""
+    
+    base_url: Optional[str] = None
+    api_key: Optional[str] = None
+    model: Optional[str] = None
+
+
 class Config(BaseModel):
     """插件配置类"""
     
@@ -9,15 +18,100 @@ class Config(BaseModel):
     ats_openai_generate_api_key: str = Field(default="")
     ats_openai_generate_base_url: str = Field(default="")
     ats_openai_generate_model: str = Field(default="")
+    ats_stream_generate: bool = Field(default=True)  # 开始游戏时流式生成谜题, 汤面完整后立即发出; 接口不支持流式输出时关闭
     
     # OpenAI API 配置 - 评判问题
     ats_openai_judge_api_key: str = Field(default="")
     ats_openai_judge_base_url: str = Field(default="")
     ats_openai_judge_model: str = Field(default="")
     
+    # 评判接口池配置
+    ats_judge_endpoints: List[JudgeEndpointConfig] = Field(default=[])  # 额外的评判接口, 与上面的接口共同组成接口池
+    ats_judge_hedge: bool = Field(default=False)  # 首个请求迟迟未返回时, 是否向另一个接口再发一个请求
+    ats_judge_hedge_percentile: float = Field(default=0.9)  # 对冲延迟取所选接口最近延迟的分位数
+    
+    # 分级评判配置: 先由快速模型评判, 不确定时再交给上面的评判模型
+    ats_judge_fast_api_key: str = Field(default="")  # 为空时沿用 ats_openai_judge_api_key
+    ats_judge_fast_base_url: str = Field(default="")  # 为空时沿用 ats_openai_judge_base_url
+    ats_judge_fast_model: str = Field(default="")  # 快速评判模型, 为空时不分级
+    ats_judge_fast_confidence: float = Field(default=0.8)  # 快速模型的置信度低于该值时交给评判模型复核
+    
+    # 提示词配置
+    ats_prompt_dir: str = Field(default="")  # 自定义提示词目录, 其中的同名文件优先于插件自带的提示词
+    
+    # 模型调用调度配置(按接口地址分别限制)
+    ats_llm_concurrency: int = Field(default=8)  # 每个接口同时进行的请求数上限
+    ats_llm_rate_limit: float = Field(default=0)  # 每个接口每分钟的请求数上限, 0 为不限制
+    ats_llm_max_retries: int = Field(default=3)  # 遇到 429/5xx 时的最大重试次数
+    ats_llm_backoff: float = Field(default=1.0)  # 重试退避的基础等待时间(秒)
+    ats_generate_deadline: float = Field(default=180.0)  # 生成谜题(含排队、重试和重新输出)的截止时间(秒), 0 为不限制
+    ats_judge_deadline: float = Field(default=60.0)  # 评判、进度计算和评分的截止时间(秒), 0 为不限制
+    
+    # HTTP 连接配置(同一主机的模型接口共用一个连接池)
+    ats_http_max_connections: int = Field(default=20)  # 每个主机的最大连接数
+    ats_http_max_keepalive: int = Field(default=10)  # 每个主机保持的空闲连接数
+    ats_http_keepalive_expiry: float = Field(default=60.0)  # 空闲连接的保持时间(秒)
+    ats_http_timeout: float = Field(default=120.0)  # 单次请求的超时时间(秒)
+    ats_http_connect_timeout: float = Field(default=10.0)  # 建立连接的超时时间(秒)
+    ats_http2: bool = Field(default=True)  # 安装了 h2 时是否使用 HTTP/2
+    ats_http_warm_up: bool = Field(default=False)  # 启动时是否预先建立连接
+    
+    # 监控指标配置
+    ats_metrics_path: str = Field(default="")  # Prometheus 指标的 HTTP 路径, 如 /turtle_soup/metrics, 留空为不开启
+    ats_metrics_token: str = Field(default="")  # 访问指标需要携带的 Bearer Token, 留空为不校验
+    
+    # 模型返回内容解析配置
+    ats_response_reask: bool = Field(default=True)  # 返回内容无法解析且无法在本地修复时, 是否让模型重新输出一次
+    
     # 游戏配置
     ats_max_questions: int = Field(default=50)
     ats_timeout: int = Field(default=7200)
+    ats_max_games: int = Field(default=1000)  # 同时进行的游戏数量上限, 超出时淘汰最久未活动的游戏, 0 为不限制
+    
+    # 游戏状态持久化配置
+    ats_game_backend: str = Field(default="memory")  # memory: 仅保存在内存中; sqlite: 写入本地日志, 重启后恢复; shared: 多个进程共享
+    ats_backend_flush_interval: float = Field(default=1.0)  # 批量写入日志的间隔(秒)
+    ats_shared_store: str = Field(default="")  # 共享存储地址, 如 redis://localhost:6379/0; 为空时使用本地 SQLite 文件(仅适用于同一台主机)
+    ats_shared_key_prefix: str = Field(default="ats:")  # 共享存储中键名的前缀
+    ats_shared_lease_ttl: float = Field(default=15.0)  # 会话租约的有效期(秒), 持有期间自动续期
+    ats_shared_lock_timeout: float = Field(default=70.0)  # 等待其他进程释放会话租约的最长时间(秒)
+    
+    # 谜题预生成池配置
+    ats_pool_size: int = Field(default=0)  # 每个主题桶保持的预生成谜题数量, 0 为关闭; 开启后会在后台调用生成模型
+    ats_pool_themes: List[str] = Field(default=[""])  # 需要预生成的主题, 空字符串表示随机主题
+    
+    # 谜题库配置
+    ats_library_enabled: bool = Field(default=True)  # 是否保存生成的谜题并优先复用
+    ats_library_duplicate_threshold: float = Field(default=0.7)  # 判定为重复谜题的相似度阈值
+    
+    # 谜题评分配置
+    ats_rating_enabled: bool = Field(default=False)  # 是否在后台为新谜题评分
+    ats_min_rating: float = Field(default=0)  # 综合评分低于该值的谜题不会被使用, 0 为不过滤
+    
+    # 回答缓存配置
+    ats_answer_cache_enabled: bool = Field(default=True)  # 是否缓存重复问题的回答
+    ats_answer_cache_threshold: float = Field(default=0.8)  # 判定为相同问题的相似度阈值
+    
+    # 问题合并配置
+    ats_batch_window: float = Field(default=0)  # 空闲会话收到问题后等待合并的时间(秒), 0 表示立即处理
+    ats_batch_max_questions: int = Field(default=5)  # 单次请求最多合并的问题数量
+    
+    # 评判上下文配置
+    ats_judge_recent_turns: int = Field(default=10)  # 评判请求中原样保留的最近问答轮数
+    ats_judge_context_tokens: int = Field(default=1500)  # 历史问答部分的 token 预算
+    
+    # 进度分离配置
+    ats_split_progress: bool = Field(default=False)  # 先返回回答, 进度在后台单独计算
+    ats_progress_interval: int = Field(default=3)  # 分离模式下每累计多少个问题计算一次进度
+    
+    # 关键事实进度配置
+    ats_key_facts: bool = Field(default=False)  # 按谜题的关键事实在本地计算进度, 评判时只需报告确认了哪些事实
+    
+    # 会话 token 预算配置(按群组/频道统计, 每小时在整点、每天在零点重置, 0 为不限制)
+    ats_budget_generate_hourly: int = Field(default=0)  # 每个会话每小时生成谜题(含评分和关键事实提取)可用的 token
+    ats_budget_generate_daily: int = Field(default=0)  # 每个会话每天生成谜题可用的 token
+    ats_budget_judge_hourly: int = Field(default=0)  # 每个会话每小时评判提问(含进度计算)可用的 token
+    ats_budget_judge_daily: int = Field(default=0)  # 每个会话每天评判提问可用的 token
 
 
 # 从 .env 文件加载配置
@@ -0,0 +1,390 @@
+"""
+游戏状态持久化后端模块
+"""
+import asyncio
+import json
+import os
+import socket
+import sqlite3
+import time
+import uuid
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import Any, AsyncIterator, Dict, List, Optional, Set, Tuple
+from nonebot.log import logger
+from .kv_store import KVStore
+
+# 不需要持久化的游戏字段(可以由其他字段重新推导)
+_TRANSIENT_FIELDS = ('summary',)
+
+
+def snapshot_game(game: Dict[str, Any]) -> Dict[str, Any]:
+    """获取游戏状态中需要持久化的部分"""
+    return {key: value for key, value in game.items() if key not in _TRANSIENT_FIELDS}
+
+
+class GameBackend:
+    """游戏状态持久化后端
+
+    默认实现只把游戏保存在内存中, 不做任何持久化。
+    子类通过记录游戏的创建、问答追加、字段更新和结束事件来持久化游戏,
+    并在启动时恢复进行中的游戏。
+    """
+
+    # 游戏状态是否由多个进程共享, 共享时需要在读写前后与后端同步
+    shared = False
+
+    async def start(self) -> Dict[str, Dict[str, Any]]:
+        """启动后端, 返回需要恢复的进行中游戏"""
+        return {}
+
+    async def close(self):
+        """关闭后端, 写入所有尚未写入的记录"""
+
+    def record_create(self, session_id: str, game: Dict[str, Any]):
+        """记录游戏创建"""
+
+    def record_turn(self, session_id: str, turn: Dict[str, Any]):
+        """记录新增的一轮问答"""
+
+    def record_update(self, session_id: str, fields: Dict[str, Any]):
+        """记录游戏字段的更新"""
+
+    def record_end(self, session_id: str):
+        """记录游戏结束"""
+
+    @asynccontextmanager
+    async def lease(self, session_id: str) -> AsyncIterator[None]:
+        """持有会话的租约, 只有共享后端需要"""
+        yield
+
+    async def fetch(self, session_id: str) -> Tuple[bool, Optional[Dict[str, Any]]]:
+        """读取会话的最新游戏, 返回 (是否有变化, 最新的游戏), 只有共享后端需要"""
+        return False, None
+
+    async def commit(self, session_id: str, game: Optional[Dict[str, Any]]) -> bool:
+        """写回会话游戏的修改, 游戏已被其他进程修改或结束时返回 False, 只有共享后端需要"""
+        return True
+
+
+_JOURNAL_SCHEMA = """
+CREATE TABLE IF NOT EXISTS journal (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id TEXT NOT NULL,
+    op TEXT NOT NULL,
+    payload TEXT,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_journal_session ON journal (session_id, seq);
+"""
+
+
+class SQLiteGameBackend(GameBackend):
+    """基于 SQLite 追加日志的持久化后端
+
+    事件先进入内存缓冲区, 由后台任务按批异步写入, 游戏主流程不等待磁盘 IO。
+    写入时删除已被新快照取代或已结束游戏的记录, 日志只保留进行中游戏的记录;
+    启动时回放日志恢复进行中的游戏, 并把日志压缩为每个游戏一条快照。
+    """
+
+    def __init__(self, path: Path, flush_interval: float = 1.0):
+        self.path = Path(path)
+        self.flush_interval = flush_interval
+        self._conn: Optional[sqlite3.Connection] = None
+        self._buffer: List[Tuple[str, str, Optional[str], float]] = []
+        self._flusher: Optional[asyncio.Task] = None
+        self._closing: Optional[asyncio.Event] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            # 写入在线程池中进行, 同一时间只有一个线程使用该连接
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.executescript(_JOURNAL_SCHEMA)
+        return self._conn
+
+    async def start(self) -> Dict[str, Dict[str, Any]]:
+        games = await asyncio.to_thread(self._restore)
+        if self._flusher is None:
+            self._closing = asyncio.Event()
+            self._flusher = asyncio.create_task(self._flush_loop())
+        return games
+
+    def _restore(self) -> Dict[str, Dict[str, Any]]:
+        """回放日志恢复游戏, 并压缩日志"""
+        conn = self._connect()
+        games: Dict[str, Dict[str, Any]] = {}
+        rows = conn.execute("SELECT session_id, op, payload FROM journal ORDER BY seq")
+        for session_id, op, payload in rows:
+            data = json.loads(payload) if payload else None
+            if op == "create":
+                games[session_id] = data
+            elif op == "end":
+                games.pop(session_id, None)
+            elif session_id not in games:
+                continue
+            elif op == "turn":
+                games[session_id]['history'].append(data)
+                games[session_id]['percent'] = data['percent']
+            elif op == "update":
+                games[session_id].update(data)
+
+        now = time.time()
+        with conn:
+            conn.execute("DELETE FROM journal")
+            conn.executemany(
+                "INSERT INTO journal (session_id, op, payload, created_at) VALUES (?, 'create', ?, ?)",
+                [
+                    (session_id, json.dumps(game, ensure_ascii=False), now)
+                    for session_id, game in games.items()
+                ]
+            )
+        return games
+
+    def _append(self, session_id: str, op: str, data: Any = None):
+        payload = None if data is None else json.dumps(data, ensure_ascii=False)
+        self._buffer.append((session_id, op, payload, time.time()))
+
+    def record_create(self, session_id: str, game: Dict[str, Any]):
+        self._append(session_id, "create", snapshot_game(game))
+
+    def record_turn(self, session_id: str, turn: Dict[str, Any]):
+        self._append(session_id, "turn", turn)
+
+    def record_update(self, session_id: str, fields: Dict[str, Any]):
+        self._append(session_id, "update", fields)
+
+    def record_end(self, session_id: str):
+        self._append(session_id, "end")
+
+    async def _flush_loop(self):
+        """定期批量写入, 关闭时写入剩余记录后退出
+
+        写入只在这个任务中进行, 关闭时不取消它, 避免同时有两个线程写入。
+        """
+        assert self._closing is not None
+        while True:
+            closing = asyncio.ensure_future(self._closing.wait())
+            try:
+                await asyncio.wait({closing}, timeout=self.flush_interval)
+            finally:
+                closing.cancel()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.warning(f"写入游戏状态日志失败: {e}")
+            if self._closing.is_set():
+                return
+
+    async def flush(self):
+        """把缓冲区中的记录批量写入数据库"""
+        if not self._buffer:
+            return
+        batch, self._buffer = self._buffer, []
+        try:
+            await asyncio.to_thread(self._write, batch)
+        except Exception:
+            # 写入失败时放回缓冲区, 下次重试
+            self._buffer[:0] = batch
+            raise
+
+    def _write(self, batch: List[Tuple[str, str, Optional[str], float]]):
+        conn = self._connect()
+        with conn:
+            conn.executemany(
+                "INSERT INTO journal (session_id, op, payload, created_at) VALUES (?, ?, ?, ?)",
+                batch
+            )
+            # 结束的游戏不再需要任何记录(含结束记录本身), 新的快照取代同一会话之前的所有记录
+            for session_id in {row[0] for row in batch if row[1] in ("create", "end")}:
+                conn.execute(
+                    "DELETE FROM journal WHERE session_id = ? AND seq <= "
+                    "(SELECT MAX(seq) FROM journal WHERE session_id = ? AND op = 'end')",
+                    (session_id, session_id)
+                )
+                conn.execute(
+                    "DELETE FROM journal WHERE session_id = ? AND seq < "
+                    "(SELECT MAX(seq) FROM journal WHERE session_id = ? AND op = 'create')",
+                    (session_id, session_id)
+                )
+
+    async def close(self):
+        try:
+            if self._flusher is not None and self._closing is not None:
+                self._closing.set()
+                await self._flusher
+                self._flusher = None
+            else:
+                await self.flush()
+        finally:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+class LeaseTimeoutError(Exception):
+    """等待会话租约超时"""
+
+    def __init__(self, message: str = "其他进程正在处理这局游戏, 请稍后再试"):
+        super().__init__(message)
+
+
+class _Lease:
+    """本进程对一个会话租约的持有状态"""
+
+    def __init__(self):
+        self.holders = 0
+        self.lock = asyncio.Lock()
+        self.renewer: Optional[asyncio.Task] = None
+
+
+class SharedGameBackend(GameBackend):
+    """基于共享键值存储的游戏状态后端, 用于多个机器人进程处理同一批会话
+
+    每个游戏以完整快照和版本号保存在共享存储中, 本进程内的游戏作为读缓存,
+    处理消息前比较版本号, 版本变化时才重新读取。修改游戏的操作持有会话租约,
+    本进程内的多个操作共用一个租约; 修改在操作结束时以版本号为条件写回,
+    期间游戏被其他进程结束或替换时写入失败, 由调用方丢弃本地的游戏。
+    """
+
+    shared = True
+
+    def __init__(
+        self,
+        store: KVStore,
+        timeout: float,
+        lease_ttl: float = 15.0,
+        lock_timeout: float = 70.0,
+        key_prefix: str = "ats:"
+    ):
+        self.store = store
+        self.timeout = timeout
+        self.lease_ttl = lease_ttl
+        self.lock_timeout = lock_timeout
+        self.key_prefix = key_prefix
+        self.owner = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        # 本地缓存的游戏对应的版本号
+        self._versions: Dict[str, str] = {}
+        # 有尚未写回修改的会话, 值为是否是新创建的游戏
+        self._dirty: Dict[str, bool] = {}
+        self._leases: Dict[str, _Lease] = {}
+        self._tasks: Set[asyncio.Task] = set()
+
+    def _game_key(self, session_id: str) -> str:
+        return f"{self.key_prefix}game:{session_id}"
+
+    def _lease_key(self, session_id: str) -> str:
+        return f"{self.key_prefix}lease:{session_id}"
+
+    async def close(self):
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        await self.store.close()
+
+    def record_create(self, session_id: str, game: Dict[str, Any]):
+        self._dirty[session_id] = True
+
+    def record_turn(self, session_id: str, turn: Dict[str, Any]):
+        self._dirty.setdefault(session_id, False)
+
+    def record_update(self, session_id: str, fields: Dict[str, Any]):
+        self._dirty.setdefault(session_id, False)
+
+    def record_end(self, session_id: str):
+        self._dirty.pop(session_id, None)
+        version = self._versions.pop(session_id, None)
+        if version is None:
+            return
+        # 只删除本进程最后看到的版本, 不会误删其他进程之后创建的新游戏
+        task = asyncio.create_task(self._delete(session_id, version))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _delete(self, session_id: str, version: str):
+        try:
+            await self.store.delete(self._game_key(session_id), version)
+        except Exception as e:
+            logger.warning(f"{session_id} 删除共享游戏状态失败: {e}")
+
+    async def fetch(self, session_id: str) -> Tuple[bool, Optional[Dict[str, Any]]]:
+        key = self._game_key(session_id)
+        version = await self.store.version(key)
+        if version == self._versions.get(session_id):
+            return False, None
+        item = await self.store.get(key) if version is not None else None
+        self._dirty.pop(session_id, None)
+        if item is None:
+            self._versions.pop(session_id, None)
+            return True, None
+        self._versions[session_id] = item[0]
+        return True, json.loads(item[1])
+
+    async def commit(self, session_id: str, game: Optional[Dict[str, Any]]) -> bool:
+        created = self._dirty.pop(session_id, None)
+        if created is None or game is None:
+            return True
+        key = self._game_key(session_id)
+        value = json.dumps(snapshot_game(game), ensure_ascii=False)
+        # 共享存储中的游戏与本地游戏同时超时
+        ttl = max(1.0, game['start_time'] + self.timeout - time.time())
+        version = self._versions.get(session_id)
+        try:
+            if created or version is None:
+                new_version = await self.store.put(key, value, ttl)
+            else:
+                new_version = await self.store.replace(key, value, version, ttl)
+        except Exception:
+            # 写入失败时保留修改标记, 下次操作结束时重试
+            self._dirty[session_id] = bool(created)
+            raise
+        if new_version is None:
+            self._versions.pop(session_id, None)
+            return False
+        self._versions[session_id] = new_version
+        return True
+
+    @asynccontextmanager
+    async def lease(self, session_id: str) -> AsyncIterator[None]:
+        """持有会话的租约, 本进程内的多个操作共用一个租约, 最后一个操作结束时释放"""
+        entry = self._leases.get(session_id)
+        if entry is None:
+            entry = self._leases[session_id] = _Lease()
+        entry.holders += 1
+        try:
+            async with entry.lock:
+                if entry.renewer is None:
+                    await self._acquire(session_id)
+                    entry.renewer = asyncio.create_task(self._renew(session_id))
+            yield
+        finally:
+            entry.holders -= 1
+            if entry.holders == 0:
+                self._leases.pop(session_id, None)
+                if entry.renewer is not None:
+                    entry.renewer.cancel()
+                    try:
+                        await self.store.release(self._lease_key(session_id), self.owner)
+                    except Exception as e:
+                        logger.warning(f"{session_id} 释放会话租约失败: {e}")
+
+    async def _acquire(self, session_id: str):
+        """等待取得会话租约, 超过 `lock_timeout` 时抛出 LeaseTimeoutError"""
+        key = self._lease_key(session_id)
+        deadline = time.monotonic() + self.lock_timeout
+        delay = 0.05
+        while not await self.store.acquire(key, self.owner, self.lease_ttl):
+            if time.monotonic() >= deadline:
+                raise LeaseTimeoutError()
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 1.0)
+
+    async def _renew(self, session_id: str):
+        """在租约过期前定期续期"""
+        key = self._lease_key(session_id)
+        while True:
+            await asyncio.sleep(self.lease_ttl / 3)
+            try:
+                if not await self.store.acquire(key, self.owner, self.lease_ttl):
+                    logger.warning(f"{session_id} 的会话租约已过期并被其他进程取得")
+            except Exception as e:
+                logger.warning(f"{session_id} 续期会话租约失败: {e}")
@@ -1,13 +1,77 @@
 """
 游戏管理器模块
 """
-import json
+import asyncio
+import hashlib
+import importlib
 import time
-from pathlib import Path
-from typing import Dict, Optional, Any
-from openai import AsyncOpenAI
+from contextlib import asynccontextmanager
+from functools import partial
+from typing import TYPE_CHECKING, AsyncIterator, Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple, TypeVar, Any
 from nonebot.exception import FinishedException
-from .config import plugin_config
+from nonebot.log import logger
+from nonebot_plugin_localstore import get_plugin_data_file
+from .answer_cache import AnswerCacheStore
+from .budget import BUDGET_GENERATE, BUDGET_JUDGE, WINDOW_DAY, WINDOW_HOUR, TokenBudget
+from .config import JudgeEndpointConfig, plugin_config
+from .game_backend import GameBackend, SharedGameBackend, SQLiteGameBackend
+from .game_state import Game, Turn
+from .game_store import GameEndedError, GameExistsError, GameStore
+from .http_pool import HTTPClientPool
+from .intent import IntentClassifier, is_solution_guess
+from .judge_context import JudgeContext
+from .json_stream import JSONFieldStream, streamed_response
+from .judge_pool import JudgeEndpoint, JudgePool
+from .key_facts import confirmed_facts, fact_percent, has_key_facts
+from .kv_store import KVStore, create_kv_store
+from .metrics import (
+    CASCADE_FAST,
+    CASCADE_FAST_ERROR,
+    CASCADE_FINISH,
+    CASCADE_LOW_CONFIDENCE,
+    CASCADE_SOLUTION_GUESS,
+    PARSE_FAILED,
+    PARSE_OK,
+    PARSE_REASKED,
+    PARSE_REPAIRED,
+    LLMMetrics
+)
+from .messages import judge_messages, key_facts_messages, progress_messages, rate_messages
+from .prompt_store import PromptStore
+from .puzzle_library import PuzzleLibrary
+from .puzzle_pool import PuzzlePool
+from .question_queue import QuestionLimitError, QuestionQueue
+from .response_parser import (
+    ResponseFormatError,
+    Schema,
+    decode,
+    judge_schema,
+    key_facts_schema,
+    progress_schema,
+    puzzle_schema,
+    rating_schema,
+    reask_message,
+    response_text
+)
+from .scheduler import (
+    PRIORITY_BACKGROUND,
+    PRIORITY_GENERATE,
+    PRIORITY_INTERACTIVE,
+    PRIORITY_PROGRESS,
+    LLMScheduler,
+    LLMTimeoutError
+)
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
+
+T = TypeVar("T")
+
+# 预生成谜题评分不达标时最多生成的次数
+_MAX_RATING_ATTEMPTS = 3
+
+# 流式生成时提前发出的谜题字段
+_PREVIEW_FIELDS = ('title', 'puzzle_setting')
 
 
 class GameManager:
@@ -15,122 +79,698 @@ class GameManager:
     
     def __init__(self):
         self.config = plugin_config
-        self.games: Dict[str, Dict[str, Any]] = {}
+        self.games = GameStore(
+            timeout=self.config.ats_timeout,
+            max_games=self.config.ats_max_games,
+            on_remove=self._cleanup_session
+        )
+        
+        # 每个会话每小时、每天的 token 预算
+        budget_limits = {
+            BUDGET_GENERATE: {
+                WINDOW_HOUR: self.config.ats_budget_generate_hourly,
+                WINDOW_DAY: self.config.ats_budget_generate_daily
+            },
+            BUDGET_JUDGE: {
+                WINDOW_HOUR: self.config.ats_budget_judge_hourly,
+                WINDOW_DAY: self.config.ats_budget_judge_daily
+            }
+        }
+        
+        # 共享游戏状态和 token 预算使用的键值存储, 只在需要时创建
+        self.kv_store: Optional[KVStore] = None
+        if self.config.ats_game_backend == "shared" or any(
+            limit > 0 for windows in budget_limits.values() for limit in windows.values()
+        ):
+            self.kv_store = create_kv_store(self.config.ats_shared_store, get_plugin_data_file("shared.db"))
+        
+        # 游戏状态持久化后端
+        if self.config.ats_game_backend == "sqlite":
+            self.backend: GameBackend = SQLiteGameBackend(
+                get_plugin_data_file("games.db"),
+                flush_interval=self.config.ats_backend_flush_interval
+            )
+        elif self.config.ats_game_backend == "shared":
+            assert self.kv_store is not None
+            self.backend = SharedGameBackend(
+                self.kv_store,
+                timeout=self.config.ats_timeout,
+                lease_ttl=self.config.ats_shared_lease_ttl,
+                lock_timeout=self.config.ats_shared_lock_timeout,
+                key_prefix=self.config.ats_shared_key_prefix
+            )
+        elif self.config.ats_game_backend == "memory":
+            self.backend = GameBackend()
+        else:
+            raise ValueError(f"未知的游戏状态后端: {self.config.ats_game_backend}")
         
-        # 为生成谜题创建客户端
-        self.generate_client = AsyncOpenAI(
-            api_key=self.config.ats_openai_generate_api_key,
-            base_url=self.config.ats_openai_generate_base_url
+        # 各类模型调用的耗时、token 用量(含命中提示词缓存的 token 数)和失败次数
+        self.metrics = LLMMetrics()
+        
+        # 按会话统计每小时、每天的 token 用量, 超出预算时拒绝新的调用;
+        # 配置了预算时用量保存在键值存储中, 重启后不会清零
+        self.budget = TokenBudget(
+            budget_limits,
+            store=self.kv_store,
+            key_prefix=self.config.ats_shared_key_prefix
         )
         
-        # 为评判问题创建客户端
-        self.judge_client = AsyncOpenAI(
-            api_key=self.config.ats_openai_judge_api_key,
-            base_url=self.config.ats_openai_judge_base_url
+        # 所有模型接口共用的 HTTP 连接池, 同一主机的接口共用连接
+        self.http_pool = HTTPClientPool(
+            max_connections=self.config.ats_http_max_connections,
+            max_keepalive_connections=self.config.ats_http_max_keepalive,
+            keepalive_expiry=self.config.ats_http_keepalive_expiry,
+            timeout=self.config.ats_http_timeout,
+            connect_timeout=self.config.ats_http_connect_timeout,
+            http2=self.config.ats_http2
         )
         
-        # 加载提示词模板
-        self._load_prompts()
-    
-    def _load_prompts(self):
-        """从文件加载提示词"""
-        prompts_dir = Path(__file__).parent / "prompts"
+        # 所有模型调用共用的调度器
+        self.scheduler = LLMScheduler(
+            concurrency=self.config.ats_llm_concurrency,
+            rate_per_minute=self.config.ats_llm_rate_limit,
+            max_retries=self.config.ats_llm_max_retries,
+            backoff=self.config.ats_llm_backoff
+        )
+        
+        # 生成谜题的客户端和评判接口池在首次使用时创建, 避免导入插件时加载 openai
+        self._generate_client: Optional["AsyncOpenAI"] = None
+        self._judge_pool: Optional[JudgePool] = None
+        self._fast_judge_pool: Optional[JudgePool] = None
+        
+        # 提示词模板, 首次使用时读取, 文件修改后自动重新读取
+        self.prompts = PromptStore(self.config.ats_prompt_dir or None)
+        
+        # 谜题预生成池, 谜题评分后才放入池中
+        self.pool = PuzzlePool(
+            self._generate_rated_puzzle,
+            size=self.config.ats_pool_size,
+            themes=self.config.ats_pool_themes
+        )
+        
+        # 本地谜题库
+        self.library: Optional[PuzzleLibrary] = None
+        if self.config.ats_library_enabled:
+            self.library = PuzzleLibrary(
+                get_plugin_data_file("puzzles.db"),
+                duplicate_threshold=self.config.ats_library_duplicate_threshold,
+                min_rating=self.config.ats_min_rating
+            )
         
-        # 读取生成谜题的提示词
-        generate_prompt_path = prompts_dir / "generate.md"
-        with open(generate_prompt_path, "r", encoding="utf-8") as f:
-            self.generate_prompt = f.read()
+        # 按谜题划分的回答缓存
+        self.answer_cache: Optional[AnswerCacheStore] = None
+        if self.config.ats_answer_cache_enabled:
+            self.answer_cache = AnswerCacheStore(self.config.ats_answer_cache_threshold)
+        
+        # 本地消息意图识别, 拦截无需调用模型的消息
+        self.intent_classifier = IntentClassifier()
+        
+        # 按会话串行处理问题的队列, 以及保护游戏状态更新的会话锁
+        self.question_queue = QuestionQueue(
+            self._judge_questions,
+            window=self.config.ats_batch_window,
+            max_batch=self.config.ats_batch_max_questions
+        )
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._background_tasks: Set[asyncio.Task] = set()
+        # 各会话进行中的模型调用, 游戏结束时一并取消
+        self._session_tasks: Dict[str, Set[asyncio.Task]] = {}
+        self._scoring: Set[str] = set()
+        self._extracting: Set[str] = set()
+        self._rating: Set[int] = set()
+        # 流式生成中的游戏: 会话 ID -> (只有汤面的游戏, 谜题完整后完成的 Future)
+        self._pending: Dict[str, Tuple[Game, asyncio.Future]] = {}
         
-        # 读取游戏主持的提示词
-        gaming_prompt_path = prompts_dir / "gaming.md"
-        with open(gaming_prompt_path, "r", encoding="utf-8") as f:
-            self.gaming_prompt = f.read()
+        # 评判请求的历史上下文管理
+        self.judge_context = JudgeContext(
+            recent_turns=self.config.ats_judge_recent_turns,
+            token_budget=self.config.ats_judge_context_tokens
+        )
+    
+    async def start(self):
+        """恢复持久化的游戏并启动后台任务"""
+        restored = await self.backend.start()
+        for session_id, data in restored.items():
+            self.games[session_id] = Game.from_dict(data)
+        if restored:
+            logger.info(f"恢复了 {len(restored)} 个进行中的游戏")
         
-        # 读取进度计算的提示词
-        progress_prompt_path = prompts_dir / "progress.md"
-        with open(progress_prompt_path, "r", encoding="utf-8") as f:
-            self.progress_prompt = f.read()
+        self.games.start()
+        self.pool.warm_up()
         
-        # 读取评分的提示词
-        rate_prompt_path = prompts_dir / "rate.md"
-        with open(rate_prompt_path, "r", encoding="utf-8") as f:
-            self.rate_prompt = f.read()
+        # 在后台创建客户端并预先建立到各模型接口的连接, 不阻塞启动
+        if self.config.ats_http_warm_up:
+            task = asyncio.create_task(self._warm_up_clients())
+            self._background_tasks.add(task)
+            task.add_done_callback(self._background_tasks.discard)
+    
+    async def _warm_up_clients(self):
+        """在线程中导入 openai 后创建所有客户端, 再预热连接"""
+        await asyncio.to_thread(importlib.import_module, "openai")
+        # 访问属性即创建客户端, 并在连接池中登记各接口地址
+        _ = self.generate_client, self.judge_pool, self.fast_judge_pool
+        await self.http_pool.warm_up()
+    
+    async def close(self):
+        """停止后台任务"""
+        await self.games.close()
+        await self.pool.close()
+        await self.question_queue.close()
+        for task in list(self._background_tasks):
+            task.cancel()
+        if self._background_tasks:
+            await asyncio.gather(*self._background_tasks, return_exceptions=True)
+        await self.budget.close()
+        await self.backend.close()
+        # 共享后端关闭时会一并关闭键值存储
+        if self.kv_store is not None and not self.backend.shared:
+            await self.kv_store.close()
+        await self.http_pool.close()
+        if self.library:
+            self.library.close()
     
     def has_active_game(self, session_id: str) -> bool:
         """检查会话是否有活跃的游戏"""
         if session_id not in self.games:
             return False
         
-        # 检查超时
-        game = self.games[session_id]
-        if time.time() - game['start_time'] > self.config.ats_timeout:
-            del self.games[session_id]
+        # 检查超时, 后台清理任务尚未清理到的游戏在这里及时移除
+        if self.games.is_expired(session_id):
+            self.games.expire(session_id)
             return False
         
         return True
     
-    def get_game(self, session_id: str) -> Optional[Dict[str, Any]]:
+    @asynccontextmanager
+    async def session_lock(self, session_id: str) -> AsyncIterator[None]:
+        """持有会话的锁, 修改游戏状态的操作需要持有该锁
+        
+        共享状态模式下同时持有会话租约, 见 `_shared_session`。
+        """
+        lock = self._locks.get(session_id)
+        if lock is None:
+            lock = self._locks[session_id] = asyncio.Lock()
+        async with lock, self._shared_session(session_id):
+            yield
+    
+    @asynccontextmanager
+    async def _shared_session(self, session_id: str) -> AsyncIterator[None]:
+        """共享状态模式下持有会话租约: 进入时同步最新的游戏, 退出时写回修改; 其他模式下不做任何事"""
+        if not self.backend.shared:
+            yield
+            return
+        async with self.backend.lease(session_id):
+            await self.sync_game(session_id)
+            try:
+                yield
+            finally:
+                await self._commit(session_id)
+    
+    async def sync_game(self, session_id: str):
+        """共享状态模式下按版本号同步会话的游戏, 版本未变时直接使用本地缓存"""
+        if not self.backend.shared:
+            return
+        try:
+            changed, data = await self.backend.fetch(session_id)
+        except Exception as e:
+            logger.warning(f"{session_id} 读取共享游戏状态失败, 使用本地缓存: {e}")
+            return
+        if not changed:
+            return
+        if data is None:
+            # 游戏已被其他进程结束
+            if self.games.pop(session_id) is not None:
+                self._release_session(session_id)
+        else:
+            self.games[session_id] = Game.from_dict(data)
+    
+    async def _commit(self, session_id: str):
+        """把本地的修改写回共享存储, 游戏已被其他进程修改或结束时丢弃本地的游戏"""
+        game = self.games.get(session_id)
+        try:
+            committed = await self.backend.commit(session_id, game.to_dict() if game else None)
+        except Exception as e:
+            logger.warning(f"{session_id} 写入共享游戏状态失败: {e}")
+            return
+        if not committed:
+            logger.warning(f"{session_id} 的游戏已被其他进程修改或结束, 丢弃本地的修改")
+            self.games.pop(session_id)
+            self._release_session(session_id)
+    
+    def get_game(self, session_id: str) -> Optional[Game]:
         """获取游戏状态"""
         return self.games.get(session_id)
     
-    async def create_game(self, session_id: str, theme: str) -> Dict[str, Any]:
-        """创建新游戏"""
-        # 调用 AI 生成新谜题
-        puzzle = await self._generate_puzzle(theme)
+    def _current_game(self, session_id: str, game: Game) -> Optional[Game]:
+        """会话当前的游戏仍是 `game` 这一局时返回当前的游戏对象, 游戏已结束或被替换时返回 None
         
-        # 初始化游戏状态
-        game = {
-            'puzzle': puzzle,
-            'history': [],
-            'percent': 0,
-            'start_time': time.time(),
-            'hint_index': 0  # 记录当前提示到第几条
+        共享状态模式下同步会用新的对象替换本地的游戏, 因此按谜题和开始时间判断是否为同一局。
+        """
+        current = self.games.get(session_id)
+        if current is None or (current.puzzle_key, current.start_time) != (game.puzzle_key, game.start_time):
+            return None
+        return current
+    
+    def memory_report(self) -> Dict[str, int]:
+        """估算进行中游戏占用的内存(字节), 用于评估主机容量"""
+        sizes = [self.games[session_id].memory_size() for session_id in self.games]
+        total = sum(sizes)
+        return {
+            'games': len(sizes),
+            'total': total,
+            'avg': total // len(sizes) if sizes else 0,
+            'max': max(sizes, default=0)
         }
+    
+    def component_stats(self) -> Dict[str, Any]:
+        """回答缓存、预生成池、谜题库、评判接口池和 HTTP 连接池的统计信息
         
-        self.games[session_id] = game
+        未开启的组件为 None; 评判接口池只包含已经创建的, 不会因为查看统计而创建客户端。
+        """
+        judge_pools = {
+            name: pool.stats()
+            for name, pool in (("judge", self._judge_pool), ("judge_fast", self._fast_judge_pool))
+            if pool is not None
+        }
+        return {
+            'answer_cache': self.answer_cache.stats() if self.answer_cache else None,
+            'pool': self.pool.stats(),
+            'library': self.library.stats() if self.library else None,
+            'judge_pools': judge_pools,
+            'http_pool': self.http_pool.stats()
+        }
+    
+    async def create_game(
+        self,
+        session_id: str,
+        theme: str,
+        on_preview: Optional[Callable[[Dict[str, str]], Awaitable[None]]] = None
+    ) -> Dict[str, Any]:
+        """创建新游戏
+        
+        提供 `on_preview` 且开启流式生成时, 题目和汤面生成完整后先创建只有汤面的游戏并回调 `on_preview`,
+        谜题的其余部分在之后继续生成, 期间的提问等到谜题完整后再处理。
+        """
+        try:
+            return await self._create_game(session_id, theme, on_preview)
+        finally:
+            self._settle_pending(session_id)
+    
+    async def _create_game(
+        self,
+        session_id: str,
+        theme: str,
+        on_preview: Optional[Callable[[Dict[str, str]], Awaitable[None]]]
+    ) -> Dict[str, Any]:
+        start = time.monotonic()
+        puzzle = None
+        puzzle_id = None
+        # 记录为本场景玩过的库中谜题
+        played_id = None
+        
+        # 提问额度用完时开始的游戏无法提问, 即使谜题库或预生成池中有谜题也不开始新游戏
+        await self.budget.sync(session_id)
+        self.budget.check(session_id, BUDGET_JUDGE)
+        
+        # 优先从谜题库中选取本场景未玩过的谜题
+        if self.library:
+            picked = self.library.pick(session_id, theme)
+            if picked:
+                puzzle_id, puzzle = picked
+        
+        # 其次从预生成池中取出谜题, 没有匹配时再调用 AI 生成
+        if puzzle is None:
+            puzzle = self.pool.pop(theme)
+            if puzzle is None:
+                # 生成额度用完时只能使用谜题库和预生成池中已有的谜题
+                self.budget.check(session_id, BUDGET_GENERATE)
+                if on_preview is not None and self.config.ats_stream_generate:
+                    puzzle = await self._generate_with_preview(session_id, theme, on_preview)
+                else:
+                    puzzle = await self._generate_puzzle(theme, session_id=session_id)
+            if self.library:
+                puzzle_id = self.library.add(puzzle, theme)
+                # 库中已有相似谜题时, 回答缓存、评分和关键事实都属于库中保存的那道谜题, 因此改为使用库中的谜题;
+                # 本场景玩过那道谜题, 或汤面已经发出且与之不同时, 只能使用新谜题, 不与库中的谜题关联
+                stored = self.library.get(puzzle_id)
+                if stored is None:
+                    puzzle_id = None
+                elif self.library.has_played(puzzle_id, session_id) or (
+                    session_id in self._pending
+                    and (stored['title'], stored['puzzle_setting']) != (puzzle['title'], puzzle['puzzle_setting'])
+                ):
+                    played_id, puzzle_id = puzzle_id, None
+                else:
+                    puzzle = stored
+        
+        if puzzle_id is not None:
+            played_id = puzzle_id
+        
+        # 初始化游戏状态
+        game = Game(puzzle, puzzle_id, self._puzzle_key(puzzle, puzzle_id))
+        
+        async with self._shared_session(session_id):
+            # 生成期间同一会话可能已经开始了其他游戏(共享状态模式下可能来自其他进程),
+            # 持有租约并同步后再检查一次, 不覆盖已有的游戏; 流式生成的汤面占位游戏除外
+            pending = self._pending.get(session_id)
+            if self.has_active_game(session_id) and (pending is None or self.games[session_id] is not pending[0]):
+                raise GameExistsError()
+            self.games[session_id] = game
+            self.backend.record_create(session_id, game.to_dict())
+        
+        if self.library and played_id is not None:
+            self.library.record_play(played_id, session_id)
+        
+        # 没有关键事实的谜题(如旧版本保存的谜题)在后台提取一次, 提取结果保存到谜题库
+        if self.config.ats_key_facts and not has_key_facts(puzzle):
+            self._schedule_key_facts(session_id, game)
+        
+        # 尚未评分的入库谜题在后台评分, 不影响本局游戏, 评分过低的谜题之后不再被选中
+        if self.config.ats_rating_enabled and 'scores' not in puzzle and puzzle_id is not None:
+            self._schedule_rating(puzzle_id, puzzle)
+        
+        self.metrics.observe_operation("create_game", time.monotonic() - start)
         return puzzle
     
-    async def _generate_puzzle(self, theme: str) -> Dict[str, Any]:
-        """调用 AI 生成谜题"""
+    async def _generate_with_preview(
+        self,
+        session_id: str,
+        theme: str,
+        on_preview: Callable[[Dict[str, str]], Awaitable[None]]
+    ) -> Dict[str, Any]:
+        """流式生成谜题, 题目和汤面完整后创建只有汤面的游戏并回调 `on_preview`, 谜题完整后返回"""
+        start = time.monotonic()
+        preview: asyncio.Future = asyncio.get_running_loop().create_future()
+        
+        def _on_fields(values: Dict[str, str]):
+            if not preview.done():
+                preview.set_result(values)
+        
+        generation = asyncio.ensure_future(self._generate_puzzle(theme, on_fields=_on_fields, session_id=session_id))
+        try:
+            await asyncio.wait({generation, preview}, return_when=asyncio.FIRST_COMPLETED)
+            # 生成失败, 或者谜题在汤面之前就已经完整
+            if generation.done():
+                return generation.result()
+            
+            self.metrics.observe_operation("generate_preview", time.monotonic() - start)
+            fields = preview.result()
+            placeholder = Game(
+                {'title': fields['title'], 'puzzle_setting': fields['puzzle_setting'], 'supplementary_info': [], 'solution': ''},
+                None,
+                ""
+            )
+            self.games[session_id] = placeholder
+            self._pending[session_id] = (placeholder, asyncio.get_running_loop().create_future())
+            
+            try:
+                await on_preview(dict(fields))
+            except FinishedException:
+                pass
+            except Exception as e:
+                logger.warning(f"{session_id} 发送汤面失败: {e}")
+            
+            # 游戏在生成期间被结束时取消生成
+            puzzle = await self._session_call(session_id, generation)
+        finally:
+            if not generation.done():
+                generation.cancel()
+        
+        if self.games.get(session_id) is not placeholder:
+            raise GameEndedError()
+        if (puzzle['title'], puzzle['puzzle_setting']) != (fields['title'], fields['puzzle_setting']):
+            # 重试后重新输出的谜题与已经发出的汤面不同
+            raise Exception("生成谜题失败: 谜题内容与已发出的汤面不一致")
+        return puzzle
+    
+    def _settle_pending(self, session_id: str):
+        """流式生成结束: 生成失败时移除只有汤面的游戏, 并唤醒等待谜题的提问"""
+        pending = self._pending.pop(session_id, None)
+        if pending is None:
+            return
+        placeholder, ready = pending
+        if self.games.get(session_id) is placeholder:
+            self.games.pop(session_id)
+            self._release_session(session_id)
+        ready.set_result(None)
+    
+    async def wait_ready(self, session_id: str) -> Optional[Game]:
+        """等待流式生成中的谜题完整后返回游戏, 游戏已结束或生成失败时返回 None"""
+        pending = self._pending.get(session_id)
+        if pending is not None:
+            await asyncio.shield(pending[1])
+        if not self.has_active_game(session_id):
+            return None
+        return self.games[session_id]
+    
+    @staticmethod
+    def _puzzle_key(puzzle: Dict[str, Any], puzzle_id: Optional[int]) -> str:
+        """谜题的唯一标识, 入库的谜题使用库 ID 以便跨场景共享回答缓存"""
+        if puzzle_id is not None:
+            return f"library:{puzzle_id}"
+        text = f"{puzzle.get('puzzle_setting', '')}\n{puzzle.get('solution', '')}"
+        return "sha1:" + hashlib.sha1(text.encode("utf-8")).hexdigest()
+    
+    @property
+    def generate_client(self) -> "AsyncOpenAI":
+        """生成谜题的客户端"""
+        if self._generate_client is None:
+            self._generate_client = self._create_client(
+                self.config.ats_openai_generate_api_key,
+                self.config.ats_openai_generate_base_url
+            )
+        return self._generate_client
+    
+    @property
+    def judge_pool(self) -> JudgePool:
+        """评判问题的接口池"""
+        if self._judge_pool is None:
+            self._judge_pool = JudgePool(
+                self._create_judge_endpoints(),
+                self.scheduler.submit,
+                hedge=self.config.ats_judge_hedge,
+                hedge_percentile=self.config.ats_judge_hedge_percentile
+            )
+        return self._judge_pool
+    
+    @property
+    def fast_judge_pool(self) -> Optional[JudgePool]:
+        """分级评判的快速模型接口, 未配置 `ats_judge_fast_model` 时为 None"""
+        if not self.config.ats_judge_fast_model:
+            return None
+        if self._fast_judge_pool is None:
+            client = self._create_client(
+                self.config.ats_judge_fast_api_key or self.config.ats_openai_judge_api_key,
+                self.config.ats_judge_fast_base_url or self.config.ats_openai_judge_base_url
+            )
+            self._fast_judge_pool = JudgePool(
+                [JudgeEndpoint(client, self.config.ats_judge_fast_model)],
+                self.scheduler.submit
+            )
+        return self._fast_judge_pool
+    
+    def _create_client(self, api_key: str, base_url: str) -> "AsyncOpenAI":
+        """创建使用共享连接池的 OpenAI 客户端"""
+        from openai import AsyncOpenAI
+        
+        return AsyncOpenAI(
+            api_key=api_key,
+            base_url=base_url or None,
+            timeout=self.http_pool.timeout,
+            max_retries=0,  # 由调度器统一重试
+            http_client=self.http_pool.get(base_url)
+        )
+    
+    def _create_judge_endpoints(self) -> List[JudgeEndpoint]:
+        """创建评判接口, 额外接口中未填写的字段沿用默认评判接口的配置"""
+        configs = [JudgeEndpointConfig()] + list(self.config.ats_judge_endpoints)
+        endpoints = []
+        for endpoint_config in configs:
+            client = self._create_client(
+                endpoint_config.api_key or self.config.ats_openai_judge_api_key,
+                endpoint_config.base_url or self.config.ats_openai_judge_base_url
+            )
+            endpoints.append(JudgeEndpoint(
+                client,
+                endpoint_config.model or self.config.ats_openai_judge_model
+            ))
+        return endpoints
+    
+    async def _chat(self, client: "AsyncOpenAI", priority: int, **kwargs) -> Any:
+        """通过调度器调用 chat completion 接口"""
+        return await self.scheduler.submit(
+            str(client.base_url),
+            priority,
+            lambda: client.chat.completions.create(**kwargs)
+        )
+    
+    async def _chat_stream(
+        self,
+        client: "AsyncOpenAI",
+        priority: int,
+        fields: Iterable[str],
+        on_fields: Callable[[Dict[str, str]], None],
+        **kwargs
+    ) -> Any:
+        """通过调度器流式调用 chat completion 接口, 返回与非流式调用结构相同的响应
+        
+        `fields` 中的字符串字段全部完整时调用一次 `on_fields`。
+        已经收到内容后连接中断时不再重试, 避免重新生成与已发出的内容不同的谜题。
+        """
+        async def _call() -> Any:
+            extractor = JSONFieldStream(fields)
+            parts: List[str] = []
+            usage = None
+            stream = await client.chat.completions.create(
+                stream=True,
+                stream_options={"include_usage": True},
+                **kwargs
+            )
+            try:
+                async for chunk in stream:
+                    if getattr(chunk, "usage", None):
+                        usage = chunk.usage
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta.content
+                    if not delta:
+                        continue
+                    parts.append(delta)
+                    if not extractor.complete and extractor.feed(delta) and extractor.complete:
+                        on_fields(dict(extractor.values))
+            except Exception as e:
+                if parts:
+                    raise Exception(f"流式输出中断: {e}") from e
+                raise
+            return streamed_response("".join(parts), usage)
+        
+        return await self.scheduler.submit(str(client.base_url), priority, _call)
+    
+    async def _observe_call(
+        self,
+        kind: str,
+        call: Awaitable[Any],
+        session_id: Optional[str] = None,
+        messages: Optional[List[Dict[str, str]]] = None
+    ) -> Any:
+        """等待一次模型调用, 记录耗时、token 用量和失败次数, 并计入会话的 token 预算"""
+        start = time.monotonic()
+        try:
+            response = await call
+        except Exception:
+            self.metrics.record_error(kind)
+            raise
+        latency = time.monotonic() - start
+        usage = self.metrics.observe(kind, latency, response, session_id, messages)
+        if session_id:
+            self.budget.record(session_id, kind, usage['prompt_tokens'] + usage['completion_tokens'])
+        logger.debug(
+            f"模型调用 kind={kind} session={session_id} latency={latency:.3f}s "
+            f"prompt_tokens={usage['prompt_tokens']} completion_tokens={usage['completion_tokens']} "
+            f"cached_tokens={usage['cached_tokens']}"
+        )
+        return response
+    
+    async def _request_json(
+        self,
+        kind: str,
+        chat: Callable[..., Awaitable[Any]],
+        messages: List[Dict[str, str]],
+        schema: Schema,
+        session_id: Optional[str] = None
+    ) -> Any:
+        """调用模型并按 `schema` 解析返回的 JSON, 超过截止时间时中止调用
+        
+        生成谜题使用 `ats_generate_deadline`, 其余调用使用 `ats_judge_deadline`,
+        截止时间包含排队、重试和重新输出的时间。
+        """
+        if kind == "generate":
+            deadline = self.config.ats_generate_deadline
+        else:
+            deadline = self.config.ats_judge_deadline
+        call = self._request_json_once(kind, chat, messages, schema, session_id)
+        if deadline <= 0:
+            return await call
+        try:
+            return await asyncio.wait_for(call, deadline)
+        except asyncio.TimeoutError:
+            self.metrics.record_error(kind)
+            logger.warning(f"{kind} 调用超过截止时间 {deadline:g} 秒, 已中止(session={session_id})")
+            raise LLMTimeoutError(f"AI 响应超时(超过 {deadline:g} 秒),请稍后重试") from None
+    
+    async def _request_json_once(
+        self,
+        kind: str,
+        chat: Callable[..., Awaitable[Any]],
+        messages: List[Dict[str, str]],
+        schema: Schema,
+        session_id: Optional[str] = None
+    ) -> Any:
+        """调用模型并按 `schema` 解析返回的 JSON
+        
+        格式有误但含义明确时在本地修复; 无法修复时让模型重新输出一次。
+        """
+        response = await self._observe_call(kind, chat(messages=messages), session_id, messages)
+        content = response_text(response)
+        try:
+            value, repairs = decode(content, schema)
+        except ResponseFormatError as e:
+            if not self.config.ats_response_reask:
+                self.metrics.record_parse(kind, PARSE_FAILED)
+                raise
+            logger.info(f"{kind} 返回内容无法使用({e}), 让模型重新输出")
+            messages = messages + [{"role": "assistant", "content": content or ""}, reask_message(e)]
+            response = await self._observe_call(kind, chat(messages=messages), session_id, messages)
+            try:
+                value, _ = decode(response_text(response), schema)
+            except ResponseFormatError:
+                self.metrics.record_parse(kind, PARSE_FAILED)
+                raise
+            self.metrics.record_parse(kind, PARSE_REASKED)
+            return value
+        
+        if repairs:
+            logger.debug(f"{kind} 返回内容已在本地修复: {', '.join(repairs)}")
+        self.metrics.record_parse(kind, PARSE_REPAIRED if repairs else PARSE_OK)
+        return value
+    
+    async def _generate_puzzle(
+        self,
+        theme: str,
+        priority: int = PRIORITY_GENERATE,
+        on_fields: Optional[Callable[[Dict[str, str]], None]] = None,
+        session_id: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """调用 AI 生成谜题, 提供 `on_fields` 时流式生成, 题目和汤面完整后立即回调
+        
+        为会话实时生成时提供 `session_id`, 用量计入该会话的预算; 预生成池的谜题不计入任何会话。
+        """
         if theme:
             theme = f"\n用户期望的谜题主题为: {theme}"
         else:
             theme = ""
+        if on_fields is not None:
+            chat = partial(self._chat_stream, self.generate_client, priority, _PREVIEW_FIELDS, on_fields)
+        else:
+            chat = partial(self._chat, self.generate_client, priority)
         try:
-            response = await self.generate_client.chat.completions.create(
-                model=self.config.ats_openai_generate_model,
-                messages=[
-                    {"role": "system", "content": self.generate_prompt},
+            # 返回的可以是谜题数组、谜题对象或包含谜题数组字段的对象, 取第一个谜题
+            puzzle = await self._request_json(
+                "generate",
+                partial(
+                    chat,
+                    model=self.config.ats_openai_generate_model,
+                    temperature=0.9,
+                    response_format={"type": "json_object"}
+                ),
+                [
+                    {"role": "system", "content": self.prompts.get("generate")},
                     {"role": "user", "content": f"### **执行指令**\n\n现在，启动你的内容生成引擎。请遵循以上所有规则，为我生成 **1** 个全新的、符合JSON格式的海龟汤谜题。将它们包含在一个JSON数组中。{theme}"}
                 ],
-                temperature=0.9,
-                response_format={"type": "json_object"}
+                puzzle_schema,
+                session_id
             )
             
-            content = response.choices[0].message.content
-            # 处理返回内容可能带有 ```json 前缀和 ``` 后缀的情况
-            if content.startswith("```json"):
-                content = content[7:]
-            if content.endswith("```"):
-                content = content[:-3]
-            puzzles = json.loads(content.strip())
-            
-            # 如果返回的是数组,取第一个
-            if isinstance(puzzles, list):
-                puzzle = puzzles[0]
-            # 如果返回的是对象但包含数组字段
-            elif isinstance(puzzles, dict):
-                # 尝试找到包含谜题的字段
-                for key in ['puzzles', 'data', 'items']:
-                    if key in puzzles and isinstance(puzzles[key], list):
-                        puzzle = puzzles[key][0]
-                        break
-                else:
-                    # 如果没有找到数组字段,假设整个对象就是谜题
-                    puzzle = puzzles
-            else:
-                raise ValueError("Unexpected response format")
-            
             return puzzle
         
         except FinishedException:
@@ -138,73 +778,274 @@ class GameManager:
         except Exception as e:
             raise Exception(f"生成谜题失败: {str(e)}")
     
-    async def process_question(self, session_id: str, question: str) -> Dict[str, Any]:
+    async def _generate_rated_puzzle(self, theme: str) -> Optional[Dict[str, Any]]:
+        """为预生成池生成谜题并评分, 评分低于下限时重新生成, 多次不达标时返回 None"""
+        for _ in range(_MAX_RATING_ATTEMPTS):
+            puzzle = await self._generate_puzzle(theme, priority=PRIORITY_BACKGROUND)
+            if not puzzle or not self.config.ats_rating_enabled:
+                return puzzle
+            try:
+                puzzle['scores'] = await self._rate(puzzle, PRIORITY_BACKGROUND)
+            except Exception as e:
+                # 评分失败不影响使用, 之后开始游戏时会再次评分
+                logger.warning(f"预生成谜题评分失败: {e}")
+                return puzzle
+            if puzzle['scores']['overall'] >= self.config.ats_min_rating:
+                return puzzle
+            logger.info(f"预生成谜题 {puzzle['title']} 综合评分 {puzzle['scores']['overall']} 过低, 重新生成")
+            # 入库记录评分, 避免之后被选中或再次生成相同的谜题
+            if self.library:
+                self.library.add(puzzle, theme)
+        return None
+    
+    async def process_question(self, session_id: str, question: str, use_cache: bool = True) -> Dict[str, Any]:
         """处理玩家的问题"""
-        if not self.has_active_game(session_id):
+        # 流式生成中的谜题等到完整后再处理提问
+        game = await self.wait_ready(session_id)
+        if game is None:
             raise ValueError("没有活跃的游戏")
         
-        game = self.games[session_id]
-        puzzle = game['puzzle']
-        
-        # 构建游戏数据
-        game_data = {
-            "puzzle_setting": puzzle['puzzle_setting'],
-            "supplementary_info": puzzle['supplementary_info'],
-            "solution": puzzle['solution'],
-            "history": game['history'],
-            "last_percentage": game['percent'],
-            "player_question": question
-        }
+        # 相同或近似的问题直接返回缓存的回答, 不计入提问次数
+        if use_cache and self.answer_cache:
+            reply = self.answer_cache.lookup(game.puzzle_key, question)
+            if reply is not None:
+                return {'reply': reply, 'percent': game.percent, 'cached': True}
+        
+        # 提问额度用完时只回复缓存中的回答
+        await self.budget.sync(session_id)
+        self.budget.check(session_id, BUDGET_JUDGE)
         
+        # 同一会话的问题排队串行处理, 短时间内的多个问题合并为一次请求
+        start = time.monotonic()
         try:
-            # 调用 AI 进行判断
-            response = await self.judge_client.chat.completions.create(
-                model=self.config.ats_openai_judge_model,
-                messages=[
-                    {"role": "system", "content": self.gaming_prompt},
-                    {"role": "user", "content": json.dumps(game_data, ensure_ascii=False)}
-                ],
-                temperature=0.3,
-                response_format={"type": "json_object"}
-            )
+            result = await self.question_queue.submit(session_id, question)
+        finally:
+            self.metrics.observe_operation("process_question", time.monotonic() - start)
+        
+        if use_cache and self.answer_cache and result['percent'] < 100:
+            self.answer_cache.store(game.puzzle_key, question, result['reply'])
+        
+        return result
+    
+    async def _judge_questions(self, session_id: str, questions: List[str]) -> List[Any]:
+        """调用 AI 依次裁定一批问题并更新游戏状态
+        
+        超出提问次数上限的问题不评判, 对应的结果为 QuestionLimitError。
+        """
+        async with self.session_lock(session_id):
+            # 排队期间游戏已经结束
+            if not self.has_active_game(session_id):
+                raise GameEndedError()
             
-            content = response.choices[0].message.content
-            # 处理返回内容可能带有 ```json 前缀和 ``` 后缀的情况
-            if content.startswith("```json"):
-                content = content[7:]
-            if content.endswith("```"):
-                content = content[:-3]
-            result = json.loads(content)
+            game = self.games[session_id]
+            puzzle = game.puzzle
             
-            # 更新游戏状态
-            game['history'].append({
-                'question': question,
-                'answer': result['reply'],
-                'percent': result['percent']
-            })
-            game['percent'] = result['percent']
+            # 提交时的次数检查早于排队, 同一批或之前批次的问题可能已经用完提问次数
+            remaining = max(0, self.config.ats_max_questions - game.question_count)
+            rejected: List[Any] = [QuestionLimitError() for _ in questions[remaining:]]
+            questions = questions[:remaining]
+            if not questions:
+                return rejected
             
-            return result
+            # 较早的问答折叠为事实摘要, 只保留最近的问答原文
+            self.judge_context.fold(game)
             
-        except Exception as e:
-            raise Exception(f"处理问题失败: {str(e)}")
+            # 构建游戏数据: 谜题和历史问答在前, 最新的提问在最后
+            # 关键事实模式下模型只需报告确认了哪些事实, 进度在本地计算;
+            # 分离模式下只要求模型给出回答, 进度在之后单独计算
+            use_facts = self.config.ats_key_facts and has_key_facts(puzzle)
+            split = self.config.ats_split_progress and not use_facts
+            if split or use_facts:
+                system_prompt = self.prompts.get("answer")
+                if len(questions) > 1:
+                    system_prompt += self.prompts.get("answer_batch")
+                if use_facts:
+                    system_prompt += self.prompts.get("answer_facts")
+            else:
+                system_prompt = self.prompts.get("gaming")
+                if len(questions) > 1:
+                    system_prompt += self.prompts.get("gaming_batch")
+            last_percentage = None if split or use_facts else game.percent
+            messages = judge_messages(
+                system_prompt,
+                puzzle,
+                history=self.judge_context.recent_history(game),
+                last_percentage=last_percentage,
+                questions=questions,
+                established_facts=self.judge_context.established_facts(game),
+                include_key_facts=use_facts
+            )
+            
+            try:
+                # 调用 AI 进行判断, 游戏结束时调用被取消
+                results = await self._session_call(session_id, self._cascade_judge(
+                    session_id,
+                    questions,
+                    messages,
+                    last_percentage,
+                    len(puzzle['key_facts']) if use_facts else 0
+                ))
+                
+                # 调用返回时游戏可能刚好结束, 不再写入已结束的游戏
+                game = self._current_game(session_id, game)
+                if game is None:
+                    raise GameEndedError()
+                
+                # 按提问顺序更新游戏状态
+                confirmed = confirmed_facts(game.history) if use_facts else set()
+                for question, item in zip(questions, results):
+                    if use_facts:
+                        # 进度为已确认事实的权重占比, 游戏结束时为 100
+                        confirmed.update(item['facts'])
+                        item['percent'] = fact_percent(puzzle['key_facts'], confirmed, item['finished'])
+                    elif split:
+                        # 游戏结束时进度为 100, 否则沿用最近一次计算出的进度
+                        item['percent'] = 100 if item.get('finished') else game.percent
+                    turn = Turn(question, item['reply'], item['percent'], item['facts'] if use_facts else None)
+                    game.add_turn(turn)
+                    self.backend.record_turn(session_id, turn.to_dict())
+                
+            except GameEndedError:
+                raise
+            except Exception as e:
+                raise Exception(f"处理问题失败: {str(e)}")
+            
+            # 每累计一定数量的问题, 在后台重新计算一次进度
+            if split and game.percent < 100:
+                game.unscored += len(questions)
+                self.backend.record_update(session_id, {'unscored': game.unscored})
+                if game.unscored >= self.config.ats_progress_interval:
+                    self._schedule_progress(session_id)
+            
+            return results + rejected
+    
+    async def _cascade_judge(
+        self,
+        session_id: str,
+        questions: List[str],
+        messages: List[Dict[str, str]],
+        last_percentage: Optional[int],
+        fact_count: int
+    ) -> List[Dict[str, Any]]:
+        """分级评判: 配置了快速模型时先由快速模型评判并给出置信度
+        
+        置信度低、提问疑似猜测完整谜底、裁定会使游戏结束或快速模型调用失败时,
+        整批问题交给评判模型重新评判(同一批中后面的裁定以前面的裁定为前提)。
+        """
+        fast_pool = self.fast_judge_pool
+        if fast_pool is not None:
+            if any(is_solution_guess(question) for question in questions):
+                self.metrics.record_cascade(CASCADE_SOLUTION_GUESS)
+            else:
+                fast_messages = [
+                    {"role": "system", "content": messages[0]['content'] + self.prompts.get("answer_confidence")}
+                ] + messages[1:]
+                try:
+                    results = await self._request_json(
+                        "judge_fast",
+                        partial(
+                            fast_pool.chat,
+                            PRIORITY_INTERACTIVE,
+                            temperature=0.3,
+                            response_format={"type": "json_object"}
+                        ),
+                        fast_messages,
+                        judge_schema(len(questions), last_percentage, fact_count, confidence=True),
+                        session_id
+                    )
+                except Exception as e:
+                    logger.warning(f"{session_id} 快速模型评判失败, 交给评判模型: {e}")
+                    self.metrics.record_cascade(CASCADE_FAST_ERROR)
+                else:
+                    if any(item['confidence'] < self.config.ats_judge_fast_confidence for item in results):
+                        self.metrics.record_cascade(CASCADE_LOW_CONFIDENCE)
+                    elif any(item.get('finished') or item.get('percent', 0) >= 100 for item in results):
+                        self.metrics.record_cascade(CASCADE_FINISH)
+                    else:
+                        self.metrics.record_cascade(CASCADE_FAST)
+                        return results
+        
+        return await self._request_json(
+            "judge",
+            partial(
+                self.judge_pool.chat,
+                PRIORITY_INTERACTIVE,
+                hedge=True,
+                temperature=0.3,
+                response_format={"type": "json_object"}
+            ),
+            messages,
+            judge_schema(len(questions), last_percentage, fact_count),
+            session_id
+        )
     
     def end_game(self, session_id: str):
         """结束游戏"""
-        if session_id in self.games:
-            del self.games[session_id]
+        self.games.pop(session_id)
+        self._cleanup_session(session_id)
+    
+    async def give_up(self, session_id: str) -> Optional[Game]:
+        """玩家放弃时结束游戏, 返回结束的游戏; 没有进行中的游戏时返回 None
+        
+        谜题还在流式生成时等到谜底生成后再结束; 进行中的评判和进度计算会被取消, 不再等待模型。
+        """
+        game = await self.wait_ready(session_id)
+        if game is None:
+            return None
+        self.end_game(session_id)
+        return game
+    
+    def _cleanup_session(self, session_id: str):
+        """清理游戏结束、超时或被淘汰后会话的附属状态, 并取消进行中的模型调用"""
+        self._release_session(session_id)
+        self.backend.record_end(session_id)
+    
+    def _release_session(self, session_id: str):
+        """清理本进程内会话的附属状态, 并取消进行中的模型调用"""
+        self.question_queue.discard(session_id)
+        current = asyncio.current_task() if self._session_tasks else None
+        for task in self._session_tasks.pop(session_id, ()):
+            if task is not current:
+                task.cancel()
+        self._locks.pop(session_id, None)
     
-    def get_next_hint(self, session_id: str) -> Optional[dict]:
-        """按顺序获取下一条附加信息作为提示"""
+    async def _session_call(self, session_id: str, call: Awaitable[T]) -> T:
+        """在会话名下执行模型调用, 游戏结束时调用被取消并抛出 GameEndedError"""
+        task = asyncio.ensure_future(call)
+        tasks = self._session_tasks.setdefault(session_id, set())
+        tasks.add(task)
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if task.cancelled():
+                raise GameEndedError() from None
+            # 调用方自身被取消
+            task.cancel()
+            raise
+        finally:
+            tasks.discard(task)
+            if not tasks and self._session_tasks.get(session_id) is tasks:
+                del self._session_tasks[session_id]
+    
+    async def get_next_hint(self, session_id: str) -> Optional[dict]:
+        """按顺序获取下一条附加信息作为提示
+        
+        不等待会话锁, 评判进行中也能立即返回; 共享状态模式下持有会话租约。
+        流式生成中的谜题等到附加信息生成后再返回。
+        """
+        await self.wait_ready(session_id)
+        async with self._shared_session(session_id):
+            return self._next_hint(session_id)
+    
+    def _next_hint(self, session_id: str) -> Optional[dict]:
         if not self.has_active_game(session_id):
             return None
         
         game = self.games[session_id]
-        puzzle = game['puzzle']
+        hints = game.supplementary_info
         
-        if 'supplementary_info' in puzzle and puzzle['supplementary_info']:
-            hints = puzzle['supplementary_info']
-            current_index = game.get('hint_index', 0)
+        if hints:
+            current_index = game.hint_index
             
             # 如果已经展示完所有提示
             if current_index >= len(hints):
@@ -218,7 +1059,8 @@ class GameManager:
             # 获取当前提示
             hint = hints[current_index]
             # 更新索引
-            game['hint_index'] = current_index + 1
+            game.hint_index = current_index + 1
+            self.backend.record_update(session_id, {'hint_index': game.hint_index})
             
             return {
                 'hint': hint,
@@ -235,81 +1077,169 @@ class GameManager:
             raise ValueError("没有活跃的游戏")
         
         game = self.games[session_id]
-        puzzle = game['puzzle']
-        
-        # 构建评分数据
-        rate_data = {
-            "puzzle_setting": puzzle['puzzle_setting'],
-            "supplementary_info": puzzle['supplementary_info'],
-            "solution": puzzle['solution']
-        }
+        puzzle = game.puzzle
         
+        # 已经评过分的谜题直接返回保存的评分
+        if 'scores' in puzzle:
+            return {'scores': puzzle['scores']}
+        return {'scores': await self._rate(puzzle, PRIORITY_BACKGROUND, session_id)}
+    
+    async def _rate(self, puzzle: Dict[str, Any], priority: int, session_id: Optional[str] = None) -> Dict[str, Any]:
+        """调用 AI 对谜题评分, 返回各项评分"""
         try:
-            # 调用 AI 进行评分
-            response = await self.judge_client.chat.completions.create(
-                model=self.config.ats_openai_judge_model,
-                messages=[
-                    {"role": "system", "content": self.rate_prompt},
-                    {"role": "user", "content": json.dumps(rate_data, ensure_ascii=False)}
-                ],
-                temperature=0.3,
-                response_format={"type": "json_object"}
+            result = await self._request_json(
+                "rate",
+                partial(
+                    self.judge_pool.chat,
+                    priority,
+                    temperature=0.3,
+                    response_format={"type": "json_object"}
+                ),
+                rate_messages(self.prompts.get("rate"), puzzle),
+                rating_schema,
+                session_id
             )
             
-            content = response.choices[0].message.content
-            # 处理返回内容可能带有 ```json 前缀和 ``` 后缀的情况
-            if content.startswith("```json"):
-                content = content[7:]
-            if content.endswith("```"):
-                content = content[:-3]
-            result = json.loads(content.strip())
-            
-            return result
+            return result['scores']
             
         except Exception as e:
             raise Exception(f"评分失败: {str(e)}")
     
-    async def recalculate_progress(self, session_id: str) -> int:
+    def _schedule_rating(self, puzzle_id: int, puzzle: Dict[str, Any]):
+        """在后台为入库的谜题评分; 同一谜题同时只有一个评分任务"""
+        if puzzle_id in self._rating:
+            return
+        self._rating.add(puzzle_id)
+        task = asyncio.create_task(self._background_rating(puzzle_id, puzzle))
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+    
+    async def _background_rating(self, puzzle_id: int, puzzle: Dict[str, Any]):
+        """评分并保存到谜题库, 失败时只记录日志"""
+        try:
+            scores = await self._rate(puzzle, PRIORITY_BACKGROUND)
+            self.library.set_rating(puzzle_id, scores['overall'], scores)
+        except Exception as e:
+            logger.warning(f"谜题 {puzzle_id} 后台评分失败: {e}")
+        finally:
+            self._rating.discard(puzzle_id)
+    
+    async def recalculate_progress(self, session_id: str, priority: int = PRIORITY_PROGRESS) -> int:
         """重新计算游戏进度"""
-        if not self.has_active_game(session_id):
+        game = await self.wait_ready(session_id)
+        if game is None:
             raise ValueError("没有活跃的游戏")
         
-        game = self.games[session_id]
-        puzzle = game['puzzle']
-        
-        # 构建进度重计算数据
-        progress_data = {
-            "puzzle_setting": puzzle['puzzle_setting'],
-            "supplementary_info": puzzle['supplementary_info'],
-            "solution": puzzle['solution'],
-            "history": game['history']
-        }
+        puzzle = game.puzzle
+        
+        # 有关键事实时按历史问答中确认的事实在本地计算, 无需调用模型
+        if self.config.ats_key_facts and has_key_facts(puzzle):
+            async with self.session_lock(session_id):
+                # 取得锁时可能已同步了其他进程的修改, 使用当前的游戏对象
+                game = self._current_game(session_id, game)
+                if game is None:
+                    raise GameEndedError()
+                game.percent = fact_percent(puzzle['key_facts'], confirmed_facts(game.history))
+                game.unscored = 0
+                self.backend.record_update(session_id, {
+                    'percent': game.percent,
+                    'unscored': game.unscored
+                })
+            return game.percent
+        
+        await self.budget.sync(session_id)
+        self.budget.check(session_id, BUDGET_JUDGE)
+        history = list(game.history)
         
         try:
-            # 调用 AI 重新计算进度
-            response = await self.judge_client.chat.completions.create(
-                model=self.config.ats_openai_judge_model,
-                messages=[
-                    {"role": "system", "content": self.progress_prompt},
-                    {"role": "user", "content": json.dumps(progress_data, ensure_ascii=False)}
-                ],
-                temperature=0.3,
-                response_format={"type": "json_object"}
-            )
-            
-            content = response.choices[0].message.content
-            # 处理返回内容可能带有 ```json 前缀和 ``` 后缀的情况
-            if content.startswith("```json"):
-                content = content[7:]
-            if content.endswith("```"):
-                content = content[:-3]
-            result = json.loads(content.strip())
+            # 调用 AI 重新计算进度, 游戏结束时调用被取消
+            new_percent = await self._session_call(session_id, self._request_json(
+                "progress",
+                partial(
+                    self.judge_pool.chat,
+                    priority,
+                    temperature=0.3,
+                    response_format={"type": "json_object"}
+                ),
+                progress_messages(self.prompts.get("progress"), puzzle, history),
+                progress_schema,
+                session_id
+            ))
             
-            # 更新游戏进度
-            new_percent = result['recalculated_percent']
-            game['percent'] = new_percent
+        except GameEndedError:
+            raise
+        except Exception as e:
+            raise Exception(f"重新计算进度失败: {str(e)}")
+        
+        # 持有会话锁更新进度, 游戏已结束或被替换时不再写入
+        async with self.session_lock(session_id):
+            game = self._current_game(session_id, game)
+            if game is None:
+                raise GameEndedError()
+            game.percent = new_percent
+            game.unscored = game.question_count - len(history)
+            self.backend.record_update(session_id, {
+                'percent': game.percent,
+                'unscored': game.unscored
+            })
+        
+        return new_percent
+    
+    def _schedule_progress(self, session_id: str):
+        """在后台重新计算进度, 不阻塞回答; 同一会话同时只有一个计算任务, 提问额度用完时不再计算"""
+        if session_id in self._scoring or self.budget.exceeded(session_id, BUDGET_JUDGE):
+            return
+        self._scoring.add(session_id)
+        task = asyncio.create_task(self._background_progress(session_id))
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+    
+    async def _background_progress(self, session_id: str):
+        """后台计算进度, 失败时只记录日志"""
+        try:
+            await self.recalculate_progress(session_id, priority=PRIORITY_BACKGROUND)
+        except GameEndedError:
+            pass
+        except Exception as e:
+            logger.warning(f"{session_id} 后台计算进度失败: {e}")
+        finally:
+            self._scoring.discard(session_id)
+    
+    def _schedule_key_facts(self, session_id: str, game: Game):
+        """在后台提取谜题的关键事实; 同一谜题同时只有一个提取任务"""
+        if game.puzzle_key in self._extracting:
+            return
+        self._extracting.add(game.puzzle_key)
+        task = asyncio.create_task(self._background_key_facts(session_id, game))
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+    
+    async def _background_key_facts(self, session_id: str, game: Game):
+        """提取关键事实并保存到谜题库, 尚未开始提问的游戏立即改用关键事实计算进度"""
+        try:
+            key_facts = await self._request_json(
+                "facts",
+                partial(
+                    self.judge_pool.chat,
+                    PRIORITY_BACKGROUND,
+                    temperature=0.3,
+                    response_format={"type": "json_object"}
+                ),
+                key_facts_messages(self.prompts.get("facts"), game.puzzle),
+                key_facts_schema,
+                session_id
+            )
             
-            return new_percent
+            if self.library and game.puzzle_id is not None:
+                self.library.set_key_facts(game.puzzle_id, key_facts)
             
+            # 已经开始提问的游戏继续使用原来的进度计算方式, 避免进度中途跳变
+            async with self.session_lock(session_id):
+                current = self._current_game(session_id, game)
+                if current is not None and not current.history:
+                    current.puzzle = dict(current.puzzle, key_facts=key_facts)
+                    self.backend.record_update(session_id, {'puzzle': current.puzzle})
         except Exception as e:
-            raise Exception(f"重新计算进度失败: {str(e)}")
+            logger.warning(f"{session_id} 提取谜题关键事实失败: {e}")
+        finally:
+            self._extracting.discard(game.puzzle_key)
@@ -0,0 +1,166 @@
+"""
+游戏状态模块
+
+进行中的游戏和每轮问答使用带 `__slots__` 的类保存, 回答以枚举代码表示,
+避免每个游戏、每轮问答各带一个字典和重复的字符串键。
+持久化和恢复时与字典格式互相转换。
+"""
+import sys
+import time
+from enum import IntEnum
+from typing import Any, Dict, List, Optional, Set, Sequence
+
+
+class Answer(IntEnum):
+    """回答代码"""
+    YES = 0
+    NO = 1
+    IRRELEVANT = 2
+    OTHER = 3  # 猜中谜底时的评语、放弃时的空回答等自由文本
+
+
+ANSWER_TEXT = {Answer.YES: "是", Answer.NO: "不是", Answer.IRRELEVANT: "不重要"}
+_ANSWER_CODES = {text: code for code, text in ANSWER_TEXT.items()}
+
+
+class Turn:
+    """一轮问答"""
+
+    __slots__ = ('question', 'code', 'text', 'percent', 'facts')
+
+    def __init__(self, question: str, answer: str, percent: int, facts: Optional[Sequence[int]] = None):
+        self.question = question
+        self.code = _ANSWER_CODES.get(answer, Answer.OTHER)
+        # 只有自由文本的回答才保存原文
+        self.text = answer if self.code is Answer.OTHER else None
+        self.percent = percent
+        # 关键事实模式下本轮确认的事实编号, 其他模式为 None
+        self.facts = tuple(facts) if facts is not None else None
+
+    @property
+    def answer(self) -> str:
+        """回答文本"""
+        if self.code is Answer.OTHER:
+            return self.text
+        return ANSWER_TEXT[self.code]
+
+    def to_dict(self) -> Dict[str, Any]:
+        data: Dict[str, Any] = {'question': self.question, 'answer': self.answer, 'percent': self.percent}
+        if self.facts is not None:
+            data['facts'] = list(self.facts)
+        return data
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Turn":
+        return cls(data['question'], data['answer'], data['percent'], data.get('facts'))
+
+
+class Game:
+    """一局进行中的游戏
+
+    `summary` 为评判上下文折叠的事实摘要, 可以由历史问答重新推导, 不参与持久化。
+    """
+
+    __slots__ = (
+        'puzzle', 'puzzle_id', 'puzzle_key', 'history', 'percent',
+        'start_time', 'hint_index', 'unscored', 'summary'
+    )
+
+    def __init__(
+        self,
+        puzzle: Dict[str, Any],
+        puzzle_id: Optional[int],
+        puzzle_key: str,
+        start_time: Optional[float] = None,
+        percent: int = 0,
+        history: Optional[List[Turn]] = None,
+        hint_index: int = 0,
+        unscored: int = 0
+    ):
+        self.puzzle = puzzle
+        self.puzzle_id = puzzle_id
+        self.puzzle_key = puzzle_key
+        self.start_time = time.time() if start_time is None else start_time
+        self.percent = percent
+        self.history: List[Turn] = history or []
+        self.hint_index = hint_index  # 记录当前提示到第几条
+        self.unscored = unscored  # 进度分离模式下尚未计入进度的提问数
+        self.summary: Optional[Dict[str, Any]] = None
+
+    @property
+    def title(self) -> str:
+        return self.puzzle['title']
+
+    @property
+    def puzzle_setting(self) -> str:
+        return self.puzzle['puzzle_setting']
+
+    @property
+    def solution(self) -> str:
+        return self.puzzle['solution']
+
+    @property
+    def supplementary_info(self) -> List[str]:
+        return self.puzzle.get('supplementary_info') or []
+
+    @property
+    def question_count(self) -> int:
+        """已提问的次数"""
+        return len(self.history)
+
+    def recent_turns(self, count: int) -> List[Turn]:
+        """最近的 `count` 轮问答"""
+        return self.history[-count:] if count > 0 else []
+
+    def add_turn(self, turn: Turn):
+        """追加一轮问答并更新进度"""
+        self.history.append(turn)
+        self.percent = turn.percent
+
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为持久化使用的字典"""
+        return {
+            'puzzle': self.puzzle,
+            'puzzle_id': self.puzzle_id,
+            'puzzle_key': self.puzzle_key,
+            'history': [turn.to_dict() for turn in self.history],
+            'percent': self.percent,
+            'start_time': self.start_time,
+            'hint_index': self.hint_index,
+            'unscored': self.unscored
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Game":
+        """从持久化的字典恢复"""
+        return cls(
+            puzzle=data['puzzle'],
+            puzzle_id=data.get('puzzle_id'),
+            puzzle_key=data['puzzle_key'],
+            start_time=data['start_time'],
+            percent=data.get('percent', 0),
+            history=[Turn.from_dict(turn) for turn in data.get('history', [])],
+            hint_index=data.get('hint_index', 0),
+            unscored=data.get('unscored', 0)
+        )
+
+    def memory_size(self) -> int:
+        """估算游戏占用的内存(字节), 包括谜题、历史问答和摘要"""
+        return _deep_sizeof(self, set())
+
+
+def _deep_sizeof(obj: Any, seen: Set[int]) -> int:
+    """递归估算对象占用的内存, 共享的对象(枚举、None、小整数)和重复引用只计算一次"""
+    if obj is None or isinstance(obj, (bool, Answer)) or id(obj) in seen:
+        return 0
+    if isinstance(obj, int) and -5 <= obj <= 256:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(_deep_sizeof(key, seen) + _deep_sizeof(value, seen) for key, value in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        size += sum(_deep_sizeof(item, seen) for item in obj)
+    elif hasattr(obj, '__slots__'):
+        size += sum(_deep_sizeof(getattr(obj, name, None), seen) for name in obj.__slots__)
+    return size
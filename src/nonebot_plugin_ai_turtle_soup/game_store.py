@@ -0,0 +1,179 @@
+"""
+游戏状态存储模块
+"""
+import asyncio
+import heapq
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from nonebot.log import logger
+from .game_state import Game
+
+# 清理任务两次检查之间的最长间隔(秒)
+_MAX_SWEEP_INTERVAL = 60
+
+
+class GameEndedError(ValueError):
+    """游戏在处理过程中结束(放弃、超时或被淘汰), 进行中的操作被中止"""
+
+    def __init__(self, message: str = "游戏已结束"):
+        super().__init__(message)
+
+
+class GameExistsError(ValueError):
+    """会话中已有进行中的游戏(如其他进程刚刚在同一会话开始了游戏)"""
+
+    def __init__(self, message: str = "当前已有进行中的游戏"):
+        super().__init__(message)
+
+
+class GameStore:
+    """进行中游戏的内存存储
+
+    用截止时间小根堆在后台清理超时游戏(插入和清理均为 O(log n)),
+    并在游戏数量超出上限时淘汰最久未访问的游戏。
+    """
+
+    def __init__(
+        self,
+        timeout: float,
+        max_games: int = 0,
+        on_remove: Optional[Callable[[str], None]] = None
+    ):
+        self.timeout = timeout
+        self.max_games = max_games
+        self._on_remove = on_remove
+        self._games: "OrderedDict[str, Game]" = OrderedDict()
+        # (截止时间, 会话 ID), 游戏被替换或删除后堆中的旧条目在弹出时跳过
+        self._heap: List[Tuple[float, str]] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._sweeper: Optional[asyncio.Task] = None
+
+        # 统计计数
+        self.expired = 0
+        self.evicted = 0
+
+    def _deadline(self, game: Game) -> float:
+        return game.start_time + self.timeout
+
+    def __contains__(self, session_id: object) -> bool:
+        return session_id in self._games
+
+    def __len__(self) -> int:
+        return len(self._games)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(list(self._games))
+
+    def __getitem__(self, session_id: str) -> Game:
+        game = self._games[session_id]
+        self._games.move_to_end(session_id)
+        return game
+
+    def get(self, session_id: str) -> Optional[Game]:
+        """获取游戏并标记为最近访问"""
+        if session_id not in self._games:
+            return None
+        return self[session_id]
+
+    def __setitem__(self, session_id: str, game: Game):
+        previous = self._games.get(session_id)
+        self._games[session_id] = game
+        self._games.move_to_end(session_id)
+
+        # 每轮问答都会写回游戏, 截止时间没有变化时堆中已有对应的条目
+        deadline = self._deadline(game)
+        if previous is None or self._deadline(previous) != deadline:
+            if self._wakeup and (not self._heap or deadline < self._heap[0][0]):
+                self._wakeup.set()
+            heapq.heappush(self._heap, (deadline, session_id))
+            # 旧条目多于进行中的游戏时重建堆, 避免堆随替换和删除无限增长
+            if len(self._heap) > 2 * len(self._games):
+                self._rebuild_heap()
+
+        # 超出数量上限时淘汰最久未访问的游戏
+        while self.max_games > 0 and len(self._games) > self.max_games:
+            evicted_id, _ = self._games.popitem(last=False)
+            self.evicted += 1
+            logger.info(f"{evicted_id} 的游戏因进行中的游戏数量超出上限被淘汰")
+            self._notify_remove(evicted_id)
+
+    def _rebuild_heap(self):
+        self._heap = [(self._deadline(game), session_id) for session_id, game in self._games.items()]
+        heapq.heapify(self._heap)
+
+    def __delitem__(self, session_id: str):
+        del self._games[session_id]
+
+    def pop(self, session_id: str, default: Any = None) -> Any:
+        return self._games.pop(session_id, default)
+
+    def is_expired(self, session_id: str, now: Optional[float] = None) -> bool:
+        """检查游戏是否已超时"""
+        game = self._games.get(session_id)
+        if game is None:
+            return False
+        return (now or time.time()) >= self._deadline(game)
+
+    def expire(self, session_id: str):
+        """移除一个已超时的游戏"""
+        if self._games.pop(session_id, None) is not None:
+            self.expired += 1
+            self._notify_remove(session_id)
+
+    def sweep(self, now: Optional[float] = None) -> List[str]:
+        """清理所有已超时的游戏, 返回被清理的会话 ID"""
+        now = now or time.time()
+        removed = []
+        while self._heap and self._heap[0][0] <= now:
+            deadline, session_id = heapq.heappop(self._heap)
+            game = self._games.get(session_id)
+            # 跳过已结束或已被新游戏替换的旧条目
+            if game is None or self._deadline(game) != deadline:
+                continue
+            self.expire(session_id)
+            removed.append(session_id)
+        return removed
+
+    def _notify_remove(self, session_id: str):
+        if self._on_remove:
+            self._on_remove(session_id)
+
+    def start(self):
+        """启动后台清理任务"""
+        if self._sweeper is None:
+            self._wakeup = asyncio.Event()
+            self._sweeper = asyncio.create_task(self._sweep_loop())
+
+    async def close(self):
+        """停止后台清理任务"""
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            await asyncio.gather(self._sweeper, return_exceptions=True)
+            self._sweeper = None
+
+    async def _sweep_loop(self):
+        """睡眠到最近的截止时间后清理超时游戏, 插入更早的截止时间时提前唤醒"""
+        assert self._wakeup is not None
+        while True:
+            self._wakeup.clear()
+            removed = self.sweep()
+            if removed:
+                logger.info(f"清理了 {len(removed)} 个超时的游戏")
+
+            delay = _MAX_SWEEP_INTERVAL
+            if self._heap:
+                delay = min(delay, max(0.0, self._heap[0][0] - time.time()))
+            waiter = asyncio.ensure_future(self._wakeup.wait())
+            try:
+                await asyncio.wait({waiter}, timeout=delay)
+            finally:
+                waiter.cancel()
+
+    def stats(self) -> Dict[str, int]:
+        """获取游戏存储的统计信息"""
+        return {
+            'live': len(self._games),
+            'expired': self.expired,
+            'evicted': self.evicted
+        }
@@ -0,0 +1,116 @@
+"""
+HTTP 连接池模块
+"""
+import asyncio
+from typing import TYPE_CHECKING, Any, Dict
+from urllib.parse import urlsplit
+from nonebot.log import logger
+
+if TYPE_CHECKING:
+    import httpx
+
+# 预热请求的超时时间(秒)
+_WARM_UP_TIMEOUT = 10.0
+
+
+def _http2_available() -> bool:
+    """HTTP/2 需要安装 h2 (httpx[http2])"""
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def origin_of(base_url: str) -> str:
+    """接口地址的源(协议 + 主机 + 端口), 同源的接口共用连接"""
+    url = urlsplit(base_url or "https://api.openai.com/v1")
+    return f"{url.scheme}://{url.netloc.rpartition('@')[2]}".lower()
+
+
+class HTTPClientPool:
+    """按源共享的 `httpx.AsyncClient`
+
+    指向同一主机的生成和评判接口共用一个连接池,
+    启动时预先建立连接, 关闭时统一释放。
+    """
+
+    def __init__(
+        self,
+        max_connections: int = 20,
+        max_keepalive_connections: int = 10,
+        keepalive_expiry: float = 60.0,
+        timeout: float = 60.0,
+        connect_timeout: float = 10.0,
+        http2: bool = True
+    ):
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self.keepalive_expiry = keepalive_expiry
+        self.read_timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.http2 = http2
+        # httpx 在首次创建客户端时才导入
+        self._clients: Dict[str, "httpx.AsyncClient"] = {}
+        # 每个源用于预热的一个接口地址
+        self._warm_up_urls: Dict[str, str] = {}
+
+    @property
+    def timeout(self) -> "httpx.Timeout":
+        import httpx
+
+        return httpx.Timeout(self.read_timeout, connect=self.connect_timeout)
+
+    def get(self, base_url: str) -> "httpx.AsyncClient":
+        """获取接口地址所在源的共享客户端"""
+        import httpx
+
+        origin = origin_of(base_url)
+        client = self._clients.get(origin)
+        if client is None:
+            if self.http2 and not _http2_available():
+                logger.info("未安装 h2, 模型接口使用 HTTP/1.1 连接")
+                self.http2 = False
+            client = self._clients[origin] = httpx.AsyncClient(
+                http2=self.http2,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_keepalive_connections,
+                    keepalive_expiry=self.keepalive_expiry
+                ),
+                timeout=self.timeout,
+                follow_redirects=True
+            )
+            self._warm_up_urls[origin] = base_url or origin
+        return client
+
+    async def warm_up(self):
+        """向每个源发送一个轻量请求, 提前完成 DNS 解析、TLS 握手并保持连接
+
+        只关心连接是否建立, 不关心响应状态; 失败时只记录日志。
+        """
+        async def _warm(origin: str, client: "httpx.AsyncClient"):
+            try:
+                await client.head(self._warm_up_urls[origin], timeout=_WARM_UP_TIMEOUT)
+            except Exception as e:
+                logger.warning(f"预热到 {origin} 的连接失败: {e}")
+
+        await asyncio.gather(*(
+            _warm(origin, client) for origin, client in self._clients.items()
+        ))
+
+    async def close(self):
+        """关闭所有客户端及其连接"""
+        clients, self._clients = list(self._clients.values()), {}
+        self._warm_up_urls = {}
+        await asyncio.gather(
+            *(client.aclose() for client in clients),
+            return_exceptions=True
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        """获取连接池的统计信息"""
+        return {
+            'origins': list(self._clients),
+            'http2': self.http2
+        }
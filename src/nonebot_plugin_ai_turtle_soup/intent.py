@@ -0,0 +1,157 @@
+"""
+消息意图识别模块
+
+在调用评判模型之前, 用本地规则识别玩家消息的意图:
+路由各类指令, 并直接拦截闲聊和无法用"是/否"回答的问题。
+"""
+import re
+from difflib import SequenceMatcher
+from enum import Enum
+from typing import Dict, Optional, Tuple
+from .text_utils import normalize_text
+
+
+class Intent(Enum):
+    """消息意图"""
+    PROGRESS = "progress"  # 查看进度
+    HINT = "hint"  # 获取提示
+    RECALCULATE = "recalculate"  # 重新计算进度
+    GIVE_UP = "give_up"  # 放弃游戏
+    QUESTION = "question"  # 需要交给评判模型的提问
+    INVALID = "invalid"  # 无需调用模型即可拒绝的消息
+
+
+# 无效消息的原因
+REASON_EMPTY = "empty"
+REASON_CHATTER = "chatter"
+REASON_OPEN_QUESTION = "open_question"
+
+# 各指令的同义词
+COMMAND_SYNONYMS: Dict[Intent, Tuple[str, ...]] = {
+    Intent.PROGRESS: ("查看进度", "进度", "当前进度", "看进度", "查询进度", "进度如何", "现在进度"),
+    Intent.HINT: ("提示", "给个提示", "来个提示", "要提示", "给点提示", "来点提示", "求提示"),
+    Intent.RECALCULATE: ("重新计算进度", "重算进度", "重新计算", "重新评估", "更新进度", "刷新进度"),
+    Intent.GIVE_UP: ("放弃", "我放弃", "不玩了", "不想玩了", "公布答案", "看答案", "放弃游戏", "告诉我答案", "揭晓答案"),
+}
+
+# 消息中包含即可识别的指令关键词, 按顺序检查, 如 "进度怎么样" "帮我重新计算一下"
+_COMMAND_KEYWORDS: Tuple[Tuple[Intent, Tuple[str, ...]], ...] = (
+    (Intent.RECALCULATE, ("重新计算", "重算", "重新评估", "更新进度", "刷新进度")),
+    (Intent.PROGRESS, ("进度",)),
+)
+
+# 模糊匹配指令时的最低相似度, 只对较短的消息进行模糊匹配
+_FUZZY_THRESHOLD = 0.8
+_FUZZY_MAX_LENGTH = 8
+# 会结束游戏并公布答案的指令不做模糊匹配, 避免把"他放弃了游戏"之类的提问当成放弃
+_EXACT_INTENTS = frozenset({Intent.GIVE_UP})
+# 精确匹配前去掉的句尾语气词, 如 "我放弃了" "放弃吧"
+_TRAILING_PARTICLES_RE = re.compile(r"(吧|了|啦|呀|啊|哈|嘛)+$")
+
+# 表情/图片等非文字消息的文本形式, 如 "[图片]" "[表情]"
+_STICKER_RE = re.compile(r"^(\[[^\[\]]{1,10}\]\s*)+$")
+# 笑声、语气词和打招呼等闲聊
+_CHATTER_RE = re.compile(
+    r"^((哈|呵|嘿|嘻|嗯|啊|哦|噢|喔|额|呃|草|6|h|w|23+)+"
+    r"|你好|您好|在吗|在不在|hello|hi|早|早上好|晚上好|晚安|谢谢|多谢|好的|好|ok|收到)$"
+)
+# 开放式提问的疑问词
+# "什么/啥/谁" 后接 都/也 或前面是 没/不/不是 时是泛指(如 "什么都没发生" "没什么"),
+# "多少" 只有后接量词、名词或位于句尾时才是疑问(排除 "他多少知道一些" 这类副词用法)
+_OPEN_QUESTION_RE = re.compile(
+    r"为什么|为啥|怎么回事|怎么|如何|(?<![没不])(?<!不是)(什么|啥|谁)(?![都也])|哪里|哪儿|哪个|哪些|哪种"
+    r"|多少(?=$|[个只岁次天年月人钱元块米斤层楼种件位名本张]|小时|分钟)|几个|几岁|几点|几次|几天|几年"
+)
+# 可以用"是/否"回答的提问标志
+_YES_NO_RE = re.compile(r"吗|是不是|是否|有没有|对不对|会不会|能不能|要不要|算不算|可不可以|对吧|没错吧")
+# 二选一的提问, 如 "是自杀还是他杀"、"是不是A或者B"
+_CHOICE_RE = re.compile(r"是.+(还是|或者|或是).+")
+# 解释前因后果的陈述, 多为对谜底的猜测, 如 "他是因为……所以……"
+_EXPLANATION_RE = re.compile(r"因为|所以|原来|其实|真相|汤底|谜底|答案是|导致|于是|为了")
+# 超过这个长度(去除标点后)的提问视为对谜底的完整猜测
+_GUESS_MIN_LENGTH = 24
+
+
+def is_solution_guess(text: str) -> bool:
+    """提问是否像是在猜测完整的谜底(较长的陈述, 或包含因果解释)"""
+    normalized = normalize_text(text)
+    return len(normalized) >= _GUESS_MIN_LENGTH or bool(_EXPLANATION_RE.search(normalized))
+
+
+class IntentClassifier:
+    """基于关键词、正则和模糊匹配的本地意图分类器"""
+
+    def __init__(self):
+        self._commands: Dict[str, Intent] = {
+            normalize_text(synonym): intent
+            for intent, synonyms in COMMAND_SYNONYMS.items()
+            for synonym in synonyms
+        }
+
+        # 统计计数
+        self.counts: Dict[str, int] = {intent.value: 0 for intent in Intent}
+
+    def classify(self, text: str) -> Tuple[Intent, Optional[str]]:
+        """识别消息意图, 返回意图和(无效消息的)原因"""
+        intent, reason = self._classify(text)
+        self.counts[intent.value] += 1
+        return intent, reason
+
+    def _classify(self, text: str) -> Tuple[Intent, Optional[str]]:
+        raw = (text or "").strip()
+        if _STICKER_RE.match(raw):
+            return Intent.INVALID, REASON_CHATTER
+
+        normalized = normalize_text(raw)
+        if not normalized:
+            return Intent.INVALID, REASON_EMPTY
+
+        command = self._match_command(normalized) or self._match_keyword(normalized)
+        if command:
+            return command, None
+
+        if _CHATTER_RE.match(normalized):
+            return Intent.INVALID, REASON_CHATTER
+
+        # 带有是非疑问标志的提问交给评判模型, 如 "他是不是生病了或者受伤了"
+        if _YES_NO_RE.search(normalized):
+            return Intent.QUESTION, None
+
+        if _CHOICE_RE.search(normalized) or _OPEN_QUESTION_RE.search(normalized):
+            return Intent.INVALID, REASON_OPEN_QUESTION
+
+        return Intent.QUESTION, None
+
+    def _match_command(self, normalized: str) -> Optional[Intent]:
+        """精确匹配指令同义词, 不会结束游戏的指令还可以模糊匹配"""
+        intent = self._commands.get(normalized) or self._commands.get(_TRAILING_PARTICLES_RE.sub("", normalized))
+        if intent or len(normalized) > _FUZZY_MAX_LENGTH:
+            return intent
+
+        best_intent, best_ratio = None, 0.0
+        for synonym, candidate in self._commands.items():
+            if candidate in _EXACT_INTENTS:
+                continue
+            ratio = SequenceMatcher(None, normalized, synonym).ratio()
+            if ratio > best_ratio:
+                best_intent, best_ratio = candidate, ratio
+        if best_ratio >= _FUZZY_THRESHOLD:
+            return best_intent
+        return None
+
+    @staticmethod
+    def _match_keyword(normalized: str) -> Optional[Intent]:
+        """消息中包含查看或重新计算进度的关键词"""
+        for intent, keywords in _COMMAND_KEYWORDS:
+            if any(keyword in normalized for keyword in keywords):
+                return intent
+        return None
+
+    @property
+    def filtered(self) -> int:
+        """被本地拦截、没有调用模型的消息数量"""
+        return self.counts[Intent.INVALID.value]
+
+    def stats(self) -> Dict[str, int]:
+        """获取分类统计信息"""
+        return dict(self.counts, filtered=self.filtered)
@@ -0,0 +1,106 @@
+"""
+流式 JSON 字段提取模块
+
+流式生成时模型的返回内容是逐段到达的, 这里在 JSON 完整之前增量地识别出
+已经完整的字符串字段(如谜题的 title 和 puzzle_setting), 使它们可以提前使用。
+"""
+import json
+from types import SimpleNamespace
+from typing import Any, Dict, Iterable, List, Optional
+
+# 字符串之外 JSON 中可能出现的字符: 空白、结构符号、数字以及 true/false/null
+_JSON_CHARS = frozenset(" \t\r\n{}[],:\"0123456789+-.eEtruefalsn")
+
+
+class JSONFieldStream:
+    """从逐段到达的 JSON 文本中提取指定的字符串字段
+
+    跳过 JSON 之前的内容(代码块标记、说明文字), 括号内出现 JSON 中不可能出现的字符时
+    (如 "[结果如下]")视为说明文字, 继续寻找下一个 `{` 或 `[`。不要求字段位于顶层,
+    任意对象中的同名字段都会被识别, 每个字段只报告第一次出现的值。
+    """
+
+    def __init__(self, fields: Iterable[str]):
+        self.fields = set(fields)
+        self.values: Dict[str, str] = {}
+        # 未闭合的容器, "{" 或 "["
+        self._stack: List[str] = []
+        self._done = False
+        # 当前对象中是否在等待键名, 以及最近读到的键名
+        self._expect_key = False
+        self._key: Optional[str] = None
+        # 正在读取的字符串(含转义序列的原文)
+        self._string: Optional[List[str]] = None
+        self._string_is_key = False
+        self._escaped = False
+
+    @property
+    def complete(self) -> bool:
+        """是否已经提取到所有字段"""
+        return len(self.values) == len(self.fields)
+
+    def feed(self, chunk: str) -> Dict[str, str]:
+        """处理一段新到达的文本, 返回这段文本中新完成的字段"""
+        found: Dict[str, str] = {}
+        for char in chunk:
+            if self._done:
+                break
+            if self._string is not None:
+                self._read_string(char, found)
+            elif char in "{[":
+                self._stack.append(char)
+                self._expect_key = char == "{"
+                self._key = None
+            elif not self._stack:
+                # 第一个容器之前的内容
+                continue
+            elif char in "}]":
+                self._stack.pop()
+                self._expect_key = False
+                if not self._stack:
+                    self._done = self.complete
+            elif char not in _JSON_CHARS:
+                # 括号里是说明文字而不是 JSON, 从头寻找下一个容器
+                self._stack.clear()
+                self._expect_key = False
+                self._key = None
+            elif char == "\"":
+                self._string = []
+                self._string_is_key = self._stack[-1] == "{" and self._expect_key
+            elif char == ":":
+                self._expect_key = False
+            elif char == "," and self._stack[-1] == "{":
+                self._expect_key = True
+                self._key = None
+        return found
+
+    def _read_string(self, char: str, found: Dict[str, str]):
+        assert self._string is not None
+        if self._escaped:
+            self._escaped = False
+            self._string.append(char)
+            return
+        if char == "\\":
+            self._escaped = True
+            self._string.append(char)
+            return
+        if char != "\"":
+            self._string.append(char)
+            return
+
+        try:
+            text = json.loads("\"" + "".join(self._string) + "\"")
+        except ValueError:
+            text = "".join(self._string)
+        self._string = None
+        if self._string_is_key:
+            self._key = text
+        elif self._stack[-1] == "{" and self._key in self.fields and self._key not in self.values:
+            self.values[self._key] = text
+            found[self._key] = text
+
+
+def streamed_response(content: str, usage: Any = None) -> Any:
+    """把流式调用收到的内容组装成与非流式调用结构相同的响应对象"""
+    message = SimpleNamespace(role="assistant", content=content)
+    return SimpleNamespace(choices=[SimpleNamespace(message=message, finish_reason="stop")], usage=usage)
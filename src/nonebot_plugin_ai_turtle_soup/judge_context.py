@@ -0,0 +1,92 @@
+"""
+评判上下文管理模块
+"""
+import json
+from typing import Any, Dict, List
+from .game_state import Answer, Game, Turn
+from .text_utils import estimate_tokens
+
+# 每次折叠进摘要的问答轮数, 按块折叠使摘要不会每轮都变化
+FOLD_BLOCK = 5
+# 摘要块中的分类
+_CATEGORIES = ('confirmed', 'denied', 'irrelevant', 'other')
+# 摘要超出预算时各类条目的丢弃顺序
+_TRIM_ORDER = ('irrelevant', 'denied', 'other', 'confirmed')
+
+
+class JudgeContext:
+    """控制评判请求中历史问答的体积
+
+    最近 `recent_turns` 轮问答原样保留, 更早的问答每 `FOLD_BLOCK` 轮折叠为一个摘要块,
+    块内按"是/不是/不重要"归类提问, 其他回答保留原文。摘要块只在末尾追加,
+    已折叠的内容在请求中保持不变, 使提示词前缀缓存能够跨越折叠命中。
+    摘要超出 token 预算时丢弃最早的条目, 一次裁剪到预算的一半,
+    为之后的折叠留出空间, 避免每次折叠都改动前缀。
+    """
+
+    def __init__(self, recent_turns: int = 10, token_budget: int = 1500):
+        self.recent_turns = max(1, recent_turns)
+        self.token_budget = token_budget
+
+    @staticmethod
+    def _summary(game: Game) -> Dict[str, Any]:
+        """获取游戏的摘要状态, 不存在时初始化"""
+        summary = game.summary
+        if summary is None:
+            summary = game.summary = {'blocks': [], 'folded': 0}
+        return summary
+
+    def fold(self, game: Game):
+        """把超出保留轮数的问答按块折叠进摘要"""
+        summary = self._summary(game)
+        history = game.history
+        changed = False
+        while len(history) - summary['folded'] >= self.recent_turns + FOLD_BLOCK:
+            block: Dict[str, List[Any]] = {key: [] for key in _CATEGORIES}
+            for turn in history[summary['folded']:summary['folded'] + FOLD_BLOCK]:
+                if turn.code is Answer.YES:
+                    block['confirmed'].append(turn.question)
+                elif turn.code is Answer.NO:
+                    block['denied'].append(turn.question)
+                elif turn.code is Answer.IRRELEVANT:
+                    block['irrelevant'].append(turn.question)
+                else:
+                    block['other'].append({'question': turn.question, 'reply': turn.answer})
+            summary['blocks'].append(block)
+            summary['folded'] += FOLD_BLOCK
+            changed = True
+        if changed:
+            self._trim(game, summary)
+
+    def _trim(self, game: Game, summary: Dict[str, Any]):
+        """摘要超出预算时, 按 不重要、否定、其他回答、确认 的顺序丢弃各类中最早的条目, 直到不超过预算的一半"""
+        budget = self.token_budget - estimate_tokens(
+            json.dumps([turn.to_dict() for turn in self.recent_history(game)], ensure_ascii=False)
+        )
+        if self._summary_tokens(summary) <= budget:
+            return
+        target = budget // 2
+        blocks = summary['blocks']
+        while blocks and self._summary_tokens(summary) > target:
+            for key in _TRIM_ORDER:
+                block = next((block for block in blocks if block[key]), None)
+                if block is not None:
+                    block[key].pop(0)
+                    break
+            summary['blocks'] = blocks = [block for block in blocks if any(block.values())]
+
+    def _summary_tokens(self, summary: Dict[str, Any]) -> int:
+        """估算摘要的 token 数量"""
+        return estimate_tokens(json.dumps(self._render(summary), ensure_ascii=False))
+
+    @staticmethod
+    def _render(summary: Dict[str, Any]) -> List[Dict[str, List[Any]]]:
+        return [{key: items for key, items in block.items() if items} for block in summary['blocks']]
+
+    def recent_history(self, game: Game) -> List[Turn]:
+        """获取尚未折叠、原样保留的问答"""
+        return game.history[self._summary(game)['folded']:]
+
+    def established_facts(self, game: Game) -> List[Dict[str, List[Any]]]:
+        """获取已折叠问答的摘要块, 按折叠顺序排列, 每块只包含非空的分类"""
+        return self._render(self._summary(game))
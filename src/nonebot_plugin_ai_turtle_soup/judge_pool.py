@@ -0,0 +1,236 @@
+"""
+评判接口池模块
+"""
+import asyncio
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+from nonebot.log import logger
+
+# 延迟 EWMA 的平滑系数
+_EWMA_ALPHA = 0.3
+# 计算对冲延迟时保留的最近延迟样本数, 以及开始使用分位数所需的最少样本数
+_LATENCY_SAMPLES = 50
+_MIN_SAMPLES = 5
+# 样本不足时的对冲延迟, 以及对冲延迟的下限(秒)
+_DEFAULT_HEDGE_DELAY = 5.0
+_MIN_HEDGE_DELAY = 0.5
+# 出错的接口在这段时间内排在其他接口之后(秒)
+_ERROR_COOLDOWN = 30.0
+
+
+class JudgeEndpoint:
+    """一个评判接口及其最近的延迟和错误统计"""
+
+    def __init__(self, client: Any, model: str):
+        self.client = client
+        self.model = model
+        self.ewma: Optional[float] = None
+        self.latencies: Deque[float] = deque(maxlen=_LATENCY_SAMPLES)
+        self.cooldown_until = 0.0
+
+        # 统计计数
+        self.calls = 0
+        self.errors = 0
+        self.wins = 0
+
+    @property
+    def name(self) -> str:
+        """接口名称, 同一地址上的不同模型分别统计延迟和限流"""
+        return f"{self.client.base_url}#{self.model}"
+
+    def healthy(self, now: float) -> bool:
+        return now >= self.cooldown_until
+
+    def _update_ewma(self, latency: float):
+        if self.ewma is None:
+            self.ewma = latency
+        else:
+            self.ewma = _EWMA_ALPHA * latency + (1 - _EWMA_ALPHA) * self.ewma
+
+    def record_success(self, latency: float):
+        self.latencies.append(latency)
+        self._update_ewma(latency)
+        self.cooldown_until = 0.0
+
+    def record_cancelled(self, elapsed: float):
+        """请求被取消时, 已等待的时间是实际延迟的下限, 只在它更慢时计入 EWMA"""
+        if self.ewma is not None and elapsed > self.ewma:
+            self._update_ewma(elapsed)
+
+    def record_error(self):
+        self.errors += 1
+        self.cooldown_until = time.monotonic() + _ERROR_COOLDOWN
+
+    def percentile(self, q: float) -> Optional[float]:
+        """最近延迟的 q 分位数, 样本不足时返回 None"""
+        if len(self.latencies) < _MIN_SAMPLES:
+            return None
+        samples = sorted(self.latencies)
+        index = min(len(samples) - 1, int(q * len(samples)))
+        return samples[index]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'model': self.model,
+            'ewma': self.ewma,
+            'calls': self.calls,
+            'errors': self.errors,
+            'wins': self.wins,
+            'healthy': self.healthy(time.monotonic())
+        }
+
+
+# 在指定接口上执行一次调用: (接口名称, 优先级, 调用, 最大重试次数) -> 响应
+Submit = Callable[[str, int, Callable[[], Awaitable[Any]], Optional[int]], Awaitable[Any]]
+
+
+class JudgePool:
+    """多个评判接口组成的接口池
+
+    每次调用优先选择最近延迟(EWMA)最低的健康接口, 出错时切换到下一个接口;
+    开启对冲时, 若首个请求在该接口近期延迟的分位数内仍未返回,
+    则向下一个接口再发一个请求, 采用先返回的结果并取消另一个。
+    """
+
+    def __init__(
+        self,
+        endpoints: List[JudgeEndpoint],
+        submit: Submit,
+        hedge: bool = False,
+        hedge_percentile: float = 0.9
+    ):
+        if not endpoints:
+            raise ValueError("至少需要一个评判接口")
+        self.endpoints = endpoints
+        self._submit = submit
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+
+        # 统计计数
+        self.failovers = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    @property
+    def primary(self) -> JudgeEndpoint:
+        """当前排名最前的接口"""
+        return self._ranked()[0]
+
+    def _ranked(self) -> List[JudgeEndpoint]:
+        """健康的接口在前, 同类中尚无延迟记录的优先试用, 其余按 EWMA 升序"""
+        now = time.monotonic()
+        return sorted(
+            self.endpoints,
+            key=lambda endpoint: (
+                not endpoint.healthy(now),
+                endpoint.ewma is not None,
+                endpoint.ewma or 0.0
+            )
+        )
+
+    def _hedge_delay(self, endpoint: JudgeEndpoint) -> float:
+        delay = endpoint.percentile(self.hedge_percentile)
+        if delay is None:
+            delay = _DEFAULT_HEDGE_DELAY
+        return max(_MIN_HEDGE_DELAY, delay)
+
+    async def _attempt(
+        self,
+        endpoint: JudgeEndpoint,
+        priority: int,
+        max_retries: Optional[int],
+        kwargs: Dict[str, Any]
+    ) -> Any:
+        endpoint.calls += 1
+        start = time.monotonic()
+        try:
+            response = await self._submit(
+                endpoint.name,
+                priority,
+                lambda: endpoint.client.chat.completions.create(model=endpoint.model, **kwargs),
+                max_retries
+            )
+        except asyncio.CancelledError:
+            endpoint.record_cancelled(time.monotonic() - start)
+            raise
+        except Exception:
+            endpoint.record_error()
+            raise
+        endpoint.record_success(time.monotonic() - start)
+        return response
+
+    async def chat(self, priority: int, hedge: bool = False, **kwargs) -> Any:
+        """调用 chat completion 接口, `model` 由所选接口决定
+
+        还有后备接口时不在同一接口上重试, 直接切换到下一个接口。
+        """
+        candidates = self._ranked()
+        hedge = hedge and self.hedge and len(candidates) > 1
+        pending: Dict[asyncio.Future, JudgeEndpoint] = {}
+        next_index = 0
+        launched_at = 0.0
+        hedged = False
+        hedge_endpoint: Optional[JudgeEndpoint] = None
+        error: Optional[Exception] = None
+
+        def launch():
+            nonlocal next_index, launched_at
+            endpoint = candidates[next_index]
+            next_index += 1
+            max_retries = None if next_index == len(candidates) else 0
+            task = asyncio.ensure_future(self._attempt(endpoint, priority, max_retries, kwargs))
+            pending[task] = endpoint
+            launched_at = time.monotonic()
+
+        launch()
+        try:
+            while pending:
+                timeout = None
+                if hedge and not hedged and len(pending) == 1 and next_index < len(candidates):
+                    primary = next(iter(pending.values()))
+                    timeout = max(0.0, launched_at + self._hedge_delay(primary) - time.monotonic())
+
+                done, _ = await asyncio.wait(
+                    set(pending), timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    # 首个请求超过对冲延迟仍未返回, 向下一个接口再发一个请求
+                    hedged = True
+                    self.hedges += 1
+                    hedge_endpoint = candidates[next_index]
+                    launch()
+                    continue
+
+                for task in done:
+                    endpoint = pending.pop(task)
+                    try:
+                        response = task.result()
+                    except Exception as e:
+                        logger.warning(f"评判接口 {endpoint.name} 调用失败: {e}")
+                        error = e
+                        continue
+                    endpoint.wins += 1
+                    if endpoint is hedge_endpoint:
+                        self.hedge_wins += 1
+                    return response
+
+                if not pending and next_index < len(candidates):
+                    self.failovers += 1
+                    launch()
+        finally:
+            # 取消未完成的请求(对冲中落后的一方, 或调用方被取消)
+            for task in pending:
+                task.cancel()
+
+        assert error is not None
+        raise error
+
+    def stats(self) -> Dict[str, Any]:
+        """获取接口池的统计信息"""
+        return {
+            'endpoints': {endpoint.name: endpoint.stats() for endpoint in self.endpoints},
+            'failovers': self.failovers,
+            'hedges': self.hedges,
+            'hedge_wins': self.hedge_wins
+        }
@@ -0,0 +1,36 @@
+"""
+关键事实进度模块
+
+谜题的关键事实是从汤底中提取的、揭开谜底所必需的若干信息点, 每条带有权重。
+评判时模型只需报告提问确认了哪些事实(编号从 1 开始), 进度由已确认事实的权重在本地计算,
+结果确定且无需额外的模型调用。
+"""
+from typing import Any, Dict, Iterable, List, Set
+from .game_state import Turn
+
+# 游戏未结束时的最高进度
+MAX_UNFINISHED_PERCENT = 99
+
+
+def has_key_facts(puzzle: Dict[str, Any]) -> bool:
+    """谜题是否带有关键事实"""
+    return bool(puzzle.get('key_facts'))
+
+
+def confirmed_facts(history: Iterable[Turn]) -> Set[int]:
+    """历史问答中已确认的所有关键事实编号"""
+    confirmed: Set[int] = set()
+    for turn in history:
+        confirmed.update(turn.facts or ())
+    return confirmed
+
+
+def fact_percent(key_facts: List[Dict[str, Any]], confirmed: Iterable[int], finished: bool = False) -> int:
+    """按已确认事实的权重占比计算进度, 游戏未结束时最高为 99"""
+    if finished:
+        return 100
+    total = sum(fact['weight'] for fact in key_facts)
+    if total <= 0:
+        return 0
+    score = sum(key_facts[index - 1]['weight'] for index in set(confirmed) if 1 <= index <= len(key_facts))
+    return min(MAX_UNFINISHED_PERCENT, int(round(score * 100 / total)))
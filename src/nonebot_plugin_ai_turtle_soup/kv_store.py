@@ -0,0 +1,347 @@
+"""
+共享键值存储模块
+
+多个机器人进程共享游戏状态时使用。每个值带有版本号(每次写入生成的随机字符串),
+写入可以以版本号为条件; 租约是带过期时间的锁, 持有者需要在过期前续期。
+"""
+import asyncio
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+from urllib.parse import urlsplit
+
+
+def _new_version() -> str:
+    return uuid.uuid4().hex
+
+
+class KVStore:
+    """共享键值存储接口"""
+
+    async def get(self, key: str) -> Optional[Tuple[str, str]]:
+        """读取值, 返回 (版本号, 值), 不存在或已过期时返回 None"""
+        raise NotImplementedError
+
+    async def version(self, key: str) -> Optional[str]:
+        """只读取版本号, 不存在或已过期时返回 None"""
+        raise NotImplementedError
+
+    async def put(self, key: str, value: str, ttl: float) -> str:
+        """写入值, 返回新的版本号"""
+        raise NotImplementedError
+
+    async def replace(self, key: str, value: str, version: str, ttl: float) -> Optional[str]:
+        """当前版本号为 `version` 时写入值, 返回新的版本号; 值已被修改或删除时返回 None"""
+        raise NotImplementedError
+
+    async def delete(self, key: str, version: str) -> bool:
+        """当前版本号为 `version` 时删除值"""
+        raise NotImplementedError
+
+    async def acquire(self, key: str, owner: str, ttl: float) -> bool:
+        """取得或续期租约, 租约被其他持有者持有且未过期时返回 False"""
+        raise NotImplementedError
+
+    async def release(self, key: str, owner: str):
+        """释放自己持有的租约"""
+        raise NotImplementedError
+
+    async def close(self):
+        """关闭连接"""
+
+
+class MemoryKVStore(KVStore):
+    """进程内的键值存储, 只用于测试和单进程运行"""
+
+    def __init__(self):
+        # key -> (版本号, 值, 过期时间)
+        self._values: Dict[str, Tuple[str, str, float]] = {}
+        # key -> (持有者, 过期时间)
+        self._leases: Dict[str, Tuple[str, float]] = {}
+
+    def _entry(self, key: str) -> Optional[Tuple[str, str, float]]:
+        entry = self._values.get(key)
+        if entry is not None and entry[2] <= time.time():
+            del self._values[key]
+            return None
+        return entry
+
+    async def get(self, key: str) -> Optional[Tuple[str, str]]:
+        entry = self._entry(key)
+        return (entry[0], entry[1]) if entry else None
+
+    async def version(self, key: str) -> Optional[str]:
+        entry = self._entry(key)
+        return entry[0] if entry else None
+
+    async def put(self, key: str, value: str, ttl: float) -> str:
+        version = _new_version()
+        self._values[key] = (version, value, time.time() + ttl)
+        return version
+
+    async def replace(self, key: str, value: str, version: str, ttl: float) -> Optional[str]:
+        entry = self._entry(key)
+        if entry is None or entry[0] != version:
+            return None
+        return await self.put(key, value, ttl)
+
+    async def delete(self, key: str, version: str) -> bool:
+        entry = self._entry(key)
+        if entry is None or entry[0] != version:
+            return False
+        del self._values[key]
+        return True
+
+    async def acquire(self, key: str, owner: str, ttl: float) -> bool:
+        now = time.time()
+        lease = self._leases.get(key)
+        if lease is not None and lease[0] != owner and lease[1] > now:
+            return False
+        self._leases[key] = (owner, now + ttl)
+        return True
+
+    async def release(self, key: str, owner: str):
+        lease = self._leases.get(key)
+        if lease is not None and lease[0] == owner:
+            del self._leases[key]
+
+
+_SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS kv (
+    key TEXT PRIMARY KEY,
+    version TEXT NOT NULL,
+    value TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_kv_expires_at ON kv (expires_at);
+CREATE TABLE IF NOT EXISTS leases (
+    key TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+"""
+
+
+class SQLiteKVStore(KVStore):
+    """基于 SQLite 文件的键值存储
+
+    适用于同一台主机上的多个进程共享状态, 条件写入和租约在 IMMEDIATE 事务中完成。
+    数据库操作在线程池中进行, 同一时间只有一个线程使用连接。
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(
+                self.path, timeout=10, isolation_level=None, check_same_thread=False
+            )
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(_SQLITE_SCHEMA)
+        return self._conn
+
+    async def _run(self, func: Callable[..., Any], *args: Any) -> Any:
+        def _call():
+            with self._lock:
+                return func(self._connect(), *args)
+        return await asyncio.to_thread(_call)
+
+    @staticmethod
+    @contextmanager
+    def _transaction(conn: sqlite3.Connection) -> Iterator[None]:
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    @staticmethod
+    def _current_version(conn: sqlite3.Connection, key: str) -> Optional[str]:
+        row = conn.execute(
+            "SELECT version FROM kv WHERE key = ? AND expires_at > ?", (key, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    async def get(self, key: str) -> Optional[Tuple[str, str]]:
+        def _get(conn: sqlite3.Connection) -> Optional[Tuple[str, str]]:
+            row = conn.execute(
+                "SELECT version, value FROM kv WHERE key = ? AND expires_at > ?", (key, time.time())
+            ).fetchone()
+            return (row[0], row[1]) if row else None
+        return await self._run(_get)
+
+    async def version(self, key: str) -> Optional[str]:
+        return await self._run(self._current_version, key)
+
+    @staticmethod
+    def _write(conn: sqlite3.Connection, key: str, value: str, ttl: float) -> str:
+        now = time.time()
+        version = _new_version()
+        conn.execute("DELETE FROM kv WHERE expires_at <= ?", (now,))
+        conn.execute(
+            "INSERT OR REPLACE INTO kv (key, version, value, expires_at) VALUES (?, ?, ?, ?)",
+            (key, version, value, now + ttl)
+        )
+        return version
+
+    async def put(self, key: str, value: str, ttl: float) -> str:
+        def _put(conn: sqlite3.Connection) -> str:
+            with self._transaction(conn):
+                return self._write(conn, key, value, ttl)
+        return await self._run(_put)
+
+    async def replace(self, key: str, value: str, version: str, ttl: float) -> Optional[str]:
+        def _replace(conn: sqlite3.Connection) -> Optional[str]:
+            with self._transaction(conn):
+                if self._current_version(conn, key) != version:
+                    return None
+                return self._write(conn, key, value, ttl)
+        return await self._run(_replace)
+
+    async def delete(self, key: str, version: str) -> bool:
+        def _delete(conn: sqlite3.Connection) -> bool:
+            cursor = conn.execute("DELETE FROM kv WHERE key = ? AND version = ?", (key, version))
+            return cursor.rowcount > 0
+        return await self._run(_delete)
+
+    async def acquire(self, key: str, owner: str, ttl: float) -> bool:
+        def _acquire(conn: sqlite3.Connection) -> bool:
+            now = time.time()
+            with self._transaction(conn):
+                row = conn.execute("SELECT owner, expires_at FROM leases WHERE key = ?", (key,)).fetchone()
+                if row and row[0] != owner and row[1] > now:
+                    return False
+                conn.execute(
+                    "INSERT OR REPLACE INTO leases (key, owner, expires_at) VALUES (?, ?, ?)",
+                    (key, owner, now + ttl)
+                )
+                return True
+        return await self._run(_acquire)
+
+    async def release(self, key: str, owner: str):
+        def _release(conn: sqlite3.Connection):
+            conn.execute("DELETE FROM leases WHERE key = ? AND owner = ?", (key, owner))
+        await self._run(_release)
+
+    async def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+# 值保存为哈希 {v: 版本号, d: 值}
+_REDIS_REPLACE = """
+if redis.call('HGET', KEYS[1], 'v') ~= ARGV[1] then
+    return 0
+end
+redis.call('HSET', KEYS[1], 'v', ARGV[2], 'd', ARGV[3])
+redis.call('PEXPIRE', KEYS[1], ARGV[4])
+return 1
+"""
+
+_REDIS_DELETE = """
+if redis.call('HGET', KEYS[1], 'v') ~= ARGV[1] then
+    return 0
+end
+return redis.call('DEL', KEYS[1])
+"""
+
+_REDIS_ACQUIRE = """
+local owner = redis.call('GET', KEYS[1])
+if owner and owner ~= ARGV[1] then
+    return 0
+end
+redis.call('SET', KEYS[1], ARGV[1], 'PX', ARGV[2])
+return 1
+"""
+
+_REDIS_RELEASE = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class RedisKVStore(KVStore):
+    """基于 Redis 的键值存储, 条件写入和租约由 Lua 脚本保证原子性
+
+    需要安装 redis (`pip install nonebot-plugin-ai-turtle-soup[redis]`)。
+    """
+
+    def __init__(self, url: str):
+        try:
+            from redis import asyncio as aioredis
+        except ImportError as e:
+            raise ImportError("使用 Redis 共享存储需要安装 redis: pip install nonebot-plugin-ai-turtle-soup[redis]") from e
+        self._redis = aioredis.from_url(url, decode_responses=True)
+        self._replace = self._redis.register_script(_REDIS_REPLACE)
+        self._delete = self._redis.register_script(_REDIS_DELETE)
+        self._acquire = self._redis.register_script(_REDIS_ACQUIRE)
+        self._release = self._redis.register_script(_REDIS_RELEASE)
+
+    async def get(self, key: str) -> Optional[Tuple[str, str]]:
+        version, value = await self._redis.hmget(key, "v", "d")
+        if version is None or value is None:
+            return None
+        return version, value
+
+    async def version(self, key: str) -> Optional[str]:
+        return await self._redis.hget(key, "v")
+
+    async def put(self, key: str, value: str, ttl: float) -> str:
+        version = _new_version()
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.hset(key, mapping={"v": version, "d": value})
+            pipe.pexpire(key, int(ttl * 1000))
+            await pipe.execute()
+        return version
+
+    async def replace(self, key: str, value: str, version: str, ttl: float) -> Optional[str]:
+        new_version = _new_version()
+        if await self._replace(keys=[key], args=[version, new_version, value, int(ttl * 1000)]):
+            return new_version
+        return None
+
+    async def delete(self, key: str, version: str) -> bool:
+        return bool(await self._delete(keys=[key], args=[version]))
+
+    async def acquire(self, key: str, owner: str, ttl: float) -> bool:
+        return bool(await self._acquire(keys=[key], args=[owner, int(ttl * 1000)]))
+
+    async def release(self, key: str, owner: str):
+        await self._release(keys=[key], args=[owner])
+
+    async def close(self):
+        # redis 5 起 close() 改名为 aclose()
+        close = getattr(self._redis, "aclose", None) or self._redis.close
+        await close()
+
+
+def create_kv_store(url: str, default_path: Path) -> KVStore:
+    """根据地址创建键值存储
+
+    redis:// 或 rediss:// 使用 Redis; memory:// 使用进程内存储;
+    sqlite:///路径 使用指定的 SQLite 文件; 为空时使用 `default_path` 的 SQLite 文件。
+    """
+    scheme = urlsplit(url).scheme if url else ""
+    if scheme in ("redis", "rediss", "unix"):
+        return RedisKVStore(url)
+    if scheme == "memory":
+        return MemoryKVStore()
+    if scheme == "sqlite":
+        return SQLiteKVStore(Path(url[len("sqlite:///"):]))
+    if not url:
+        return SQLiteKVStore(default_path)
+    raise ValueError(f"不支持的共享存储地址: {url}")
@@ -0,0 +1,94 @@
+"""
+模型请求消息构建模块
+
+消息按"稳定前缀 + 追加内容 + 易变内容"的顺序排列:
+系统提示词和谜题信息在整局游戏中保持不变, 折叠的摘要块和历史问答只在末尾追加,
+最新的提问放在最后, 使服务商的提示词前缀缓存能够在多轮之间命中。
+"""
+import json
+from typing import Any, Dict, List, Optional
+from .game_state import Turn
+
+
+def _dumps(data: Any) -> str:
+    """序列化为紧凑且稳定的 JSON 文本"""
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+
+def puzzle_message(puzzle: Dict[str, Any], include_key_facts: bool = False) -> Dict[str, str]:
+    """谜题信息消息, 整局游戏中内容不变"""
+    data = {
+        "puzzle_setting": puzzle['puzzle_setting'],
+        "supplementary_info": puzzle['supplementary_info'],
+        "solution": puzzle['solution']
+    }
+    if include_key_facts:
+        data["key_facts"] = [fact['fact'] for fact in puzzle['key_facts']]
+    return {"role": "user", "content": _dumps(data)}
+
+
+def history_messages(history: List[Turn], include_percent: bool = True) -> List[Dict[str, str]]:
+    """将历史问答展开为一问一答的对话轮次, 关键事实模式下的回答带有确认的事实编号"""
+    messages = []
+    for turn in history:
+        messages.append({"role": "user", "content": _dumps({"player_question": turn.question})})
+        if include_percent:
+            reply = {"percent": turn.percent, "reply": turn.answer}
+        else:
+            reply = {"reply": turn.answer}
+            if turn.facts is not None:
+                reply["facts"] = list(turn.facts)
+        messages.append({"role": "assistant", "content": _dumps(reply)})
+    return messages
+
+
+def judge_messages(
+    system_prompt: str,
+    puzzle: Dict[str, Any],
+    history: List[Turn],
+    last_percentage: Optional[int],
+    questions: List[str],
+    established_facts: Optional[List[Dict[str, List[Any]]]] = None,
+    include_key_facts: bool = False
+) -> List[Dict[str, str]]:
+    """构建评判请求的消息列表, `last_percentage` 为 None 时只要求模型给出回答
+
+    每个折叠的摘要块是一条单独的消息, 新的折叠只追加消息, 不改动之前的内容。
+    """
+    messages = [{"role": "system", "content": system_prompt}, puzzle_message(puzzle, include_key_facts)]
+    for block in established_facts or ():
+        messages.append({"role": "user", "content": _dumps({"established_facts": block})})
+    messages.extend(history_messages(history, include_percent=last_percentage is not None))
+
+    current: Dict[str, Any] = {}
+    if last_percentage is not None:
+        current["last_percentage"] = last_percentage
+    if len(questions) == 1:
+        current["player_question"] = questions[0]
+    else:
+        current["player_questions"] = questions
+    messages.append({"role": "user", "content": _dumps(current)})
+    return messages
+
+
+def progress_messages(
+    system_prompt: str,
+    puzzle: Dict[str, Any],
+    history: List[Turn]
+) -> List[Dict[str, str]]:
+    """构建进度重算请求的消息列表"""
+    return [
+        {"role": "system", "content": system_prompt},
+        puzzle_message(puzzle),
+        {"role": "user", "content": _dumps({"history": [turn.to_dict() for turn in history]})}
+    ]
+
+
+def key_facts_messages(system_prompt: str, puzzle: Dict[str, Any]) -> List[Dict[str, str]]:
+    """构建关键事实提取请求的消息列表"""
+    return [{"role": "system", "content": system_prompt}, puzzle_message(puzzle)]
+
+
+def rate_messages(system_prompt: str, puzzle: Dict[str, Any]) -> List[Dict[str, str]]:
+    """构建谜题评分请求的消息列表"""
+    return [{"role": "system", "content": system_prompt}, puzzle_message(puzzle)]
@@ -0,0 +1,321 @@
+"""
+模型调用监控指标模块
+"""
+import bisect
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+from .usage import UsageStats
+
+# 延迟直方图的桶上限(秒)
+LATENCY_BUCKETS = (0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 20.0, 60.0)
+
+# 返回内容解析结果: 直接可用、本地修复后可用、让模型重新输出后可用、失败
+PARSE_OK = "ok"
+PARSE_REPAIRED = "repaired"
+PARSE_REASKED = "reasked"
+PARSE_FAILED = "failed"
+PARSE_OUTCOMES = (PARSE_OK, PARSE_REPAIRED, PARSE_REASKED, PARSE_FAILED)
+
+# 分级评判的结果: 采用快速模型的裁定, 或因置信度低、疑似猜测谜底、游戏将要结束、快速模型失败而交给评判模型
+CASCADE_FAST = "fast"
+CASCADE_LOW_CONFIDENCE = "low_confidence"
+CASCADE_SOLUTION_GUESS = "solution_guess"
+CASCADE_FINISH = "finish"
+CASCADE_FAST_ERROR = "fast_error"
+CASCADE_OUTCOMES = (CASCADE_FAST, CASCADE_LOW_CONFIDENCE, CASCADE_SOLUTION_GUESS, CASCADE_FINISH, CASCADE_FAST_ERROR)
+
+# 最多保留多少个会话的用量累计, 超出时丢弃最久未调用的会话
+_MAX_SESSIONS = 1000
+
+
+class Histogram:
+    """固定桶的累计直方图"""
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        # 最后一个桶对应 +Inf
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative(self) -> List[Tuple[str, int]]:
+        """Prometheus 风格的累计桶计数: [(上限, 不超过上限的样本数), ...]"""
+        result, total = [], 0
+        for bound, count in zip(list(self.buckets) + [float("inf")], self.counts):
+            total += count
+            result.append(("+Inf" if bound == float("inf") else f"{bound:g}", total))
+        return result
+
+    def quantile(self, q: float) -> float:
+        """按桶估算分位数, 返回样本所在桶的上限, 落在最后一个桶时返回最大桶上限"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            if total >= rank:
+                return bound
+        return self.buckets[-1]
+
+
+class LLMMetrics:
+    """模型调用的监控指标
+
+    按调用类型(generate/judge/judge_fast/progress/rate)记录延迟直方图、token 用量、
+    调用失败次数和返回内容的解析结果, 并按会话累计 token 用量;
+    按操作记录端到端耗时(如 process_question 含排队、合并和缓存查询);
+    记录分级评判中快速模型裁定被采用和交给评判模型的次数。
+    """
+
+    def __init__(self, max_sessions: int = _MAX_SESSIONS):
+        self.usage = UsageStats()
+        self.latency: Dict[str, Histogram] = {}
+        self.operations: Dict[str, Histogram] = {}
+        self.errors: Dict[str, int] = {}
+        self.parses: Dict[str, Dict[str, int]] = {}
+        self.cascade: Dict[str, int] = dict.fromkeys(CASCADE_OUTCOMES, 0)
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[str, Dict[str, int]]" = OrderedDict()
+
+    def observe(
+        self,
+        kind: str,
+        latency: float,
+        response: Any,
+        session_id: Optional[str] = None,
+        messages: Optional[List[Dict[str, str]]] = None
+    ) -> Dict[str, int]:
+        """记录一次成功的模型调用, 返回本次调用的用量
+
+        响应中没有 `usage` 时按请求消息 `messages` 和回复内容估算用量。
+        """
+        self.latency.setdefault(kind, Histogram()).observe(latency)
+        usage = self.usage.record(kind, response, messages)
+        if session_id:
+            totals = self._sessions.get(session_id)
+            if totals is None:
+                totals = self._sessions[session_id] = {
+                    'calls': 0, 'prompt_tokens': 0, 'completion_tokens': 0, 'cached_tokens': 0
+                }
+            self._sessions.move_to_end(session_id)
+            totals['calls'] += 1
+            for key, value in usage.items():
+                totals[key] += value
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        return usage
+
+    def observe_operation(self, name: str, elapsed: float):
+        """记录一次操作的端到端耗时"""
+        self.operations.setdefault(name, Histogram()).observe(elapsed)
+
+    def record_error(self, kind: str):
+        """记录一次失败的模型调用(重试用尽或不可重试的错误)"""
+        self.errors[kind] = self.errors.get(kind, 0) + 1
+
+    def record_parse(self, kind: str, outcome: str):
+        """记录一次返回内容的解析结果"""
+        outcomes = self.parses.setdefault(kind, dict.fromkeys(PARSE_OUTCOMES, 0))
+        outcomes[outcome] += 1
+
+    def record_cascade(self, outcome: str):
+        """记录一次分级评判的结果"""
+        self.cascade[outcome] += 1
+
+    def cascade_stats(self) -> Dict[str, Any]:
+        """分级评判各结果的次数, 以及快速模型裁定被采用的比例"""
+        total = sum(self.cascade.values())
+        return dict(self.cascade, total=total, fast_rate=self.cascade[CASCADE_FAST] / total if total else 0.0)
+
+    def session_totals(self, session_id: str) -> Optional[Dict[str, int]]:
+        """获取会话累计的用量"""
+        totals = self._sessions.get(session_id)
+        return dict(totals) if totals else None
+
+    def top_sessions(self, limit: int = 5) -> List[Tuple[str, Dict[str, int]]]:
+        """按发送的 token 数排序的用量最多的会话"""
+        ranked = sorted(
+            self._sessions.items(),
+            key=lambda item: item[1]['prompt_tokens'] + item[1]['completion_tokens'],
+            reverse=True
+        )
+        return [(session_id, dict(totals)) for session_id, totals in ranked[:limit]]
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """获取各调用类型的汇总指标"""
+        usage = self.usage.stats()
+        result = {}
+        for kind in sorted(set(usage) | set(self.errors) | set(self.parses)):
+            histogram = self.latency.get(kind, Histogram())
+            parses = self.parses.get(kind, {})
+            result[kind] = dict(
+                usage.get(kind, {'calls': 0, 'prompt_tokens': 0, 'completion_tokens': 0, 'cached_tokens': 0}),
+                errors=self.errors.get(kind, 0),
+                parse_repaired=parses.get(PARSE_REPAIRED, 0),
+                parse_reasked=parses.get(PARSE_REASKED, 0),
+                parse_failures=parses.get(PARSE_FAILED, 0),
+                latency_avg=histogram.sum / histogram.count if histogram.count else 0.0,
+                latency_p50=histogram.quantile(0.5),
+                latency_p95=histogram.quantile(0.95)
+            )
+        return result
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _histogram_lines(name: str, label: str, histograms: Dict[str, Histogram]) -> List[str]:
+    lines = [f"# TYPE {name} histogram"]
+    for key, histogram in sorted(histograms.items()):
+        labels = f'{label}="{_escape(key)}"'
+        for bound, count in histogram.cumulative():
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {count}')
+        lines.append(f"{name}_sum{{{labels}}} {histogram.sum}")
+        lines.append(f"{name}_count{{{labels}}} {histogram.count}")
+    return lines
+
+
+def _component_lines(components: Dict[str, Any]) -> List[str]:
+    """回答缓存、预生成池、谜题库、评判接口池和 HTTP 连接池的指标, 未开启的组件不导出"""
+    lines: List[str] = []
+
+    cache = components.get('answer_cache')
+    if cache is not None:
+        # 命中次数即回答缓存省下的评判调用次数
+        lines.append("# TYPE ats_answer_cache_lookups_total counter")
+        lines.append(f'ats_answer_cache_lookups_total{{result="hit"}} {cache["hits"]}')
+        lines.append(f'ats_answer_cache_lookups_total{{result="miss"}} {cache["misses"]}')
+        lines.append("# TYPE ats_answer_cache_entries gauge")
+        lines.append(f"ats_answer_cache_entries {cache['entries']}")
+
+    pool = components.get('pool')
+    if pool is not None:
+        lines.append("# TYPE ats_puzzle_pool_size gauge")
+        for theme, size in sorted(pool['buckets'].items()):
+            lines.append(f'ats_puzzle_pool_size{{theme="{_escape(theme)}"}} {size}')
+        lines.append("# TYPE ats_puzzle_pool_requests_total counter")
+        lines.append(f'ats_puzzle_pool_requests_total{{result="hit"}} {pool["hits"]}')
+        lines.append(f'ats_puzzle_pool_requests_total{{result="miss"}} {pool["misses"]}')
+        for key in ("generated", "failures"):
+            lines.append(f"# TYPE ats_puzzle_pool_{key}_total counter")
+            lines.append(f"ats_puzzle_pool_{key}_total {pool[key]}")
+
+    library = components.get('library')
+    if library is not None:
+        for name, key, metric_type in (
+            ("ats_library_puzzles", "puzzles", "gauge"),
+            ("ats_library_rated_puzzles", "rated", "gauge"),
+            ("ats_library_plays_total", "plays", "counter"),
+        ):
+            lines.append(f"# TYPE {name} {metric_type}")
+            lines.append(f"{name} {library[key]}")
+
+    judge_pools = components.get('judge_pools') or {}
+    for name, key, metric_type in (
+        ("ats_judge_endpoint_calls_total", "calls", "counter"),
+        ("ats_judge_endpoint_errors_total", "errors", "counter"),
+        ("ats_judge_endpoint_wins_total", "wins", "counter"),
+        ("ats_judge_endpoint_latency_ewma_seconds", "ewma", "gauge"),
+        ("ats_judge_endpoint_healthy", "healthy", "gauge"),
+    ):
+        lines.append(f"# TYPE {name} {metric_type}")
+        for pool_name, stats in sorted(judge_pools.items()):
+            for endpoint, item in sorted(stats['endpoints'].items()):
+                value = item[key]
+                if value is None:
+                    continue
+                labels = f'pool="{pool_name}",endpoint="{_escape(endpoint)}"'
+                lines.append(f"{name}{{{labels}}} {int(value) if isinstance(value, bool) else value}")
+    for key in ("failovers", "hedges", "hedge_wins"):
+        lines.append(f"# TYPE ats_judge_{key}_total counter")
+        for pool_name, stats in sorted(judge_pools.items()):
+            lines.append(f'ats_judge_{key}_total{{pool="{pool_name}"}} {stats[key]}')
+
+    http_pool = components.get('http_pool')
+    if http_pool is not None:
+        lines.append("# TYPE ats_http_origins gauge")
+        lines.append(f"ats_http_origins {len(http_pool['origins'])}")
+        lines.append("# TYPE ats_http2_enabled gauge")
+        lines.append(f"ats_http2_enabled {int(http_pool['http2'])}")
+    return lines
+
+
+def render_prometheus(
+    metrics: LLMMetrics,
+    scheduler_stats: Dict[str, Dict[str, Any]],
+    games_stats: Dict[str, int],
+    intent_stats: Dict[str, int],
+    component_stats: Dict[str, Any]
+) -> str:
+    """以 Prometheus 文本格式导出指标
+
+    不包含按会话划分的用量, 避免暴露群组 ID 和产生过多的时间序列。
+    """
+    lines = _histogram_lines("ats_llm_call_duration_seconds", "kind", metrics.latency)
+    lines += _histogram_lines("ats_operation_duration_seconds", "operation", metrics.operations)
+
+    usage = metrics.usage.stats()
+    lines.append("# TYPE ats_llm_tokens_total counter")
+    for kind, stats in sorted(usage.items()):
+        for token_type in ("prompt", "completion", "cached"):
+            lines.append(
+                f'ats_llm_tokens_total{{kind="{_escape(kind)}",type="{token_type}"}} {stats[f"{token_type}_tokens"]}'
+            )
+
+    for name, values in (
+        ("ats_llm_calls_total", {kind: stats['calls'] for kind, stats in usage.items()}),
+        ("ats_llm_errors_total", metrics.errors),
+    ):
+        lines.append(f"# TYPE {name} counter")
+        for kind, value in sorted(values.items()):
+            lines.append(f'{name}{{kind="{_escape(kind)}"}} {value}')
+
+    lines.append("# TYPE ats_llm_parse_total counter")
+    for kind, outcomes in sorted(metrics.parses.items()):
+        for outcome, value in outcomes.items():
+            lines.append(f'ats_llm_parse_total{{kind="{_escape(kind)}",outcome="{outcome}"}} {value}')
+
+    lines.append("# TYPE ats_judge_cascade_total counter")
+    for outcome, value in metrics.cascade.items():
+        lines.append(f'ats_judge_cascade_total{{outcome="{outcome}"}} {value}')
+
+    for name, key, metric_type in (
+        ("ats_llm_retries_total", "retries", "counter"),
+        ("ats_llm_queued", "queued", "gauge"),
+        ("ats_llm_active", "active", "gauge"),
+        ("ats_llm_queue_wait_max_seconds", "wait_max", "gauge"),
+    ):
+        lines.append(f"# TYPE {name} {metric_type}")
+        for endpoint, stats in sorted(scheduler_stats.items()):
+            lines.append(f'{name}{{endpoint="{_escape(endpoint)}"}} {stats[key]}')
+
+    # 调用在调度器中排队(并发名额和速率限制)的时间, 平均值为 _sum / _count
+    lines.append("# TYPE ats_llm_queue_wait_seconds summary")
+    for endpoint, stats in sorted(scheduler_stats.items()):
+        labels = f'endpoint="{_escape(endpoint)}"'
+        lines.append(f"ats_llm_queue_wait_seconds_sum{{{labels}}} {stats['wait_total']}")
+        lines.append(f"ats_llm_queue_wait_seconds_count{{{labels}}} {stats['calls']}")
+
+    # 本地识别的消息意图, invalid 为在本地拦截、没有调用模型的消息
+    lines.append("# TYPE ats_intent_messages_total counter")
+    for intent, value in sorted(intent_stats.items()):
+        if intent != "filtered":
+            lines.append(f'ats_intent_messages_total{{intent="{_escape(intent)}"}} {value}')
+    lines.append("# TYPE ats_intent_filtered_total counter")
+    lines.append(f"ats_intent_filtered_total {intent_stats['filtered']}")
+
+    lines += _component_lines(component_stats)
+
+    lines.append("# TYPE ats_games_live gauge")
+    lines.append(f"ats_games_live {games_stats['live']}")
+    for key in ("expired", "evicted"):
+        lines.append(f"# TYPE ats_games_{key}_total counter")
+        lines.append(f"ats_games_{key}_total {games_stats[key]}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,59 @@
+"""
+提示词加载模块
+"""
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from nonebot.log import logger
+
+# 插件自带的提示词目录
+BUILTIN_PROMPTS_DIR = Path(__file__).parent / "prompts"
+
+
+class PromptStore:
+    """按需读取提示词并缓存在内存中
+
+    每次获取时检查文件的修改时间, 文件被修改后自动重新读取,
+    修改提示词无需重启机器人。`override_dir` 中的同名文件优先于插件自带的提示词。
+    """
+
+    def __init__(self, override_dir: Optional[Path] = None):
+        self.dirs: List[Path] = [BUILTIN_PROMPTS_DIR]
+        if override_dir:
+            self.dirs.insert(0, Path(override_dir))
+        # 提示词名称 -> (文件路径, 修改时间, 内容)
+        self._cache: Dict[str, Tuple[Path, int, str]] = {}
+
+        # 统计计数
+        self.loads = 0
+
+    def _locate(self, name: str) -> Tuple[Path, int]:
+        """查找提示词文件, 返回路径和修改时间"""
+        for directory in self.dirs:
+            path = directory / f"{name}.md"
+            try:
+                return path, path.stat().st_mtime_ns
+            except OSError:
+                continue
+        raise FileNotFoundError(f"找不到提示词文件: {name}.md")
+
+    def get(self, name: str) -> str:
+        """获取提示词内容, 文件有变化时重新读取"""
+        cached = self._cache.get(name)
+        try:
+            path, mtime = self._locate(name)
+        except FileNotFoundError:
+            # 文件被临时移走(如编辑器保存过程中)时继续使用已缓存的内容
+            if cached:
+                return cached[2]
+            raise
+
+        if cached and cached[0] == path and cached[1] == mtime:
+            return cached[2]
+
+        with open(path, "r", encoding="utf-8") as f:
+            text = f.read()
+        if cached:
+            logger.info(f"提示词 {name}.md 已修改, 重新加载")
+        self._cache[name] = (path, mtime, text)
+        self.loads += 1
+        return text
@@ -0,0 +1,224 @@
+"""
+本地谜题库模块
+"""
+import hashlib
+import json
+import re
+import sqlite3
+import time
+from pathlib import Path
+from typing import Any, Dict, FrozenSet, List, Optional, Tuple
+from .text_utils import char_ngrams, jaccard, normalize_text
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS puzzles (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    title TEXT NOT NULL,
+    theme TEXT NOT NULL DEFAULT '',
+    data TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    rating REAL,
+    play_count INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_puzzles_fingerprint ON puzzles (fingerprint);
+CREATE TABLE IF NOT EXISTS puzzle_keywords (
+    keyword TEXT NOT NULL,
+    puzzle_id INTEGER NOT NULL,
+    PRIMARY KEY (keyword, puzzle_id)
+);
+CREATE TABLE IF NOT EXISTS plays (
+    scene_id TEXT NOT NULL,
+    puzzle_id INTEGER NOT NULL,
+    played_at REAL NOT NULL,
+    PRIMARY KEY (scene_id, puzzle_id)
+);
+"""
+
+# 主题关键词分隔符
+_KEYWORD_SPLIT_RE = re.compile(r"[\s,，、;；/|]+")
+
+
+def theme_keywords(theme: Optional[str]) -> List[str]:
+    """将主题拆分为用于索引的关键词"""
+    theme = (theme or "").strip().lower()
+    if not theme:
+        return []
+    keywords = {keyword for keyword in _KEYWORD_SPLIT_RE.split(theme) if keyword}
+    keywords.add(normalize_text(theme))
+    keywords.discard("")
+    return sorted(keywords)
+
+
+def _puzzle_text(puzzle: Dict[str, Any]) -> str:
+    """用于查重的谜题文本(汤面 + 汤底)"""
+    return normalize_text(f"{puzzle.get('puzzle_setting', '')}{puzzle.get('solution', '')}")
+
+
+class PuzzleLibrary:
+    """基于 SQLite 的持久化谜题库
+
+    保存生成过的谜题及其主题、评分和游玩次数,
+    按主题关键词建立索引, 并对汤面/汤底做近似重复检测。
+    综合评分低于 `min_rating` 的谜题不会被选中, 尚未评分的谜题不受影响。
+    """
+
+    def __init__(self, path: Path, duplicate_threshold: float = 0.7, min_rating: float = 0):
+        self.path = Path(path)
+        self.duplicate_threshold = duplicate_threshold
+        self.min_rating = min_rating
+        self._conn: Optional[sqlite3.Connection] = None
+        # 查重用的 n-gram 集合缓存: puzzle_id -> n-gram 集合
+        self._shingles: Dict[int, FrozenSet[str]] = {}
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        """首次使用时打开数据库连接"""
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(self.path)
+            self._conn.executescript(_SCHEMA)
+            for puzzle_id, data in self._conn.execute("SELECT id, data FROM puzzles"):
+                self._shingles[puzzle_id] = char_ngrams(_puzzle_text(json.loads(data)))
+        return self._conn
+
+    def close(self):
+        """关闭数据库连接"""
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+            self._shingles.clear()
+
+    def find_duplicate(self, puzzle: Dict[str, Any]) -> Optional[int]:
+        """查找与给定谜题重复或高度相似的已有谜题, 返回其 ID"""
+        text = _puzzle_text(puzzle)
+        fingerprint = hashlib.sha1(text.encode("utf-8")).hexdigest()
+        row = self.conn.execute(
+            "SELECT id FROM puzzles WHERE fingerprint = ? LIMIT 1", (fingerprint,)
+        ).fetchone()
+        if row:
+            return row[0]
+
+        shingles = char_ngrams(text)
+        best_id, best_score = None, 0.0
+        for puzzle_id, other in self._shingles.items():
+            score = jaccard(shingles, other)
+            if score > best_score:
+                best_id, best_score = puzzle_id, score
+        if best_score >= self.duplicate_threshold:
+            return best_id
+        return None
+
+    def add(self, puzzle: Dict[str, Any], theme: Optional[str] = "") -> int:
+        """保存谜题, 如果已存在相似谜题则直接返回已有谜题的 ID
+
+        返回的 ID 可能对应内容不同的已有谜题, 使用该 ID 时应通过 `get` 取得它保存的内容。
+        """
+        duplicate_id = self.find_duplicate(puzzle)
+        if duplicate_id is not None:
+            return duplicate_id
+
+        text = _puzzle_text(puzzle)
+        with self.conn:
+            cursor = self.conn.execute(
+                "INSERT INTO puzzles (title, theme, data, fingerprint, rating, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    puzzle.get('title', ''),
+                    (theme or "").strip(),
+                    json.dumps(puzzle, ensure_ascii=False),
+                    hashlib.sha1(text.encode("utf-8")).hexdigest(),
+                    (puzzle.get('scores') or {}).get('overall'),
+                    time.time()
+                )
+            )
+            puzzle_id = cursor.lastrowid
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO puzzle_keywords (keyword, puzzle_id) VALUES (?, ?)",
+                [(keyword, puzzle_id) for keyword in theme_keywords(theme)]
+            )
+        self._shingles[puzzle_id] = char_ngrams(text)
+        return puzzle_id
+
+    def get(self, puzzle_id: int) -> Optional[Dict[str, Any]]:
+        """获取已保存的谜题"""
+        row = self.conn.execute("SELECT data FROM puzzles WHERE id = ?", (puzzle_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def pick(self, scene_id: str, theme: Optional[str] = "") -> Optional[Tuple[int, Dict[str, Any]]]:
+        """挑选一道该场景未玩过且符合主题的谜题
+
+        优先选择评分高、游玩次数少的谜题, 跳过评分低于 `min_rating` 的谜题,
+        没有符合条件的谜题时返回 None。
+        """
+        sql = (
+            "SELECT id, data FROM puzzles "
+            "WHERE id NOT IN (SELECT puzzle_id FROM plays WHERE scene_id = ?)"
+        )
+        params: List[Any] = [scene_id]
+
+        if self.min_rating > 0:
+            sql += " AND (rating IS NULL OR rating >= ?)"
+            params.append(self.min_rating)
+
+        keywords = theme_keywords(theme)
+        if keywords:
+            placeholders = ", ".join("?" * len(keywords))
+            sql += f" AND id IN (SELECT puzzle_id FROM puzzle_keywords WHERE keyword IN ({placeholders}))"
+            params.extend(keywords)
+
+        sql += " ORDER BY rating IS NULL, rating DESC, play_count ASC, RANDOM() LIMIT 1"
+        row = self.conn.execute(sql, params).fetchone()
+        if row is None:
+            return None
+        return row[0], json.loads(row[1])
+
+    def record_play(self, puzzle_id: int, scene_id: str):
+        """记录某个场景游玩了该谜题"""
+        with self.conn:
+            cursor = self.conn.execute(
+                "INSERT OR IGNORE INTO plays (scene_id, puzzle_id, played_at) VALUES (?, ?, ?)",
+                (scene_id, puzzle_id, time.time())
+            )
+            if cursor.rowcount:
+                self.conn.execute(
+                    "UPDATE puzzles SET play_count = play_count + 1 WHERE id = ?", (puzzle_id,)
+                )
+
+    def has_played(self, puzzle_id: int, scene_id: str) -> bool:
+        """某个场景是否游玩过该谜题"""
+        row = self.conn.execute(
+            "SELECT 1 FROM plays WHERE scene_id = ? AND puzzle_id = ?", (scene_id, puzzle_id)
+        ).fetchone()
+        return row is not None
+
+    def _update_data(self, puzzle_id: int, fields: Dict[str, Any]):
+        """更新已保存谜题数据中的字段"""
+        row = self.conn.execute("SELECT data FROM puzzles WHERE id = ?", (puzzle_id,)).fetchone()
+        if row is None:
+            return
+        puzzle = json.loads(row[0])
+        puzzle.update(fields)
+        self.conn.execute(
+            "UPDATE puzzles SET data = ? WHERE id = ?",
+            (json.dumps(puzzle, ensure_ascii=False), puzzle_id)
+        )
+
+    def set_rating(self, puzzle_id: int, rating: float, scores: Optional[Dict[str, Any]] = None):
+        """更新谜题的综合评分, 同时保存各项评分"""
+        with self.conn:
+            self.conn.execute("UPDATE puzzles SET rating = ? WHERE id = ?", (rating, puzzle_id))
+            if scores is not None:
+                self._update_data(puzzle_id, {'scores': scores})
+
+    def set_key_facts(self, puzzle_id: int, key_facts: List[Dict[str, Any]]):
+        """为已保存的谜题补充关键事实"""
+        with self.conn:
+            self._update_data(puzzle_id, {'key_facts': key_facts})
+
+    def stats(self) -> Dict[str, Any]:
+        """获取谜题库的统计信息"""
+        total, plays, rated = self.conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(play_count), 0), COUNT(rating) FROM puzzles"
+        ).fetchone()
+        return {'puzzles': total, 'plays': plays, 'rated': rated}
@@ -0,0 +1,113 @@
+"""
+谜题预生成池模块
+"""
+import asyncio
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Set
+from nonebot.log import logger
+
+
+def normalize_theme(theme: Optional[str]) -> str:
+    """规范化主题文本, 作为分桶的键"""
+    return (theme or "").strip().lower()
+
+
+class PuzzlePool:
+    """按主题分桶的谜题预生成池
+
+    每个主题桶在后台保持 `size` 道已生成好的谜题,
+    取出后异步补充, 使开始游戏时无需等待生成。
+    """
+
+    def __init__(
+        self,
+        generator: Callable[[str], Awaitable[Dict[str, Any]]],
+        size: int,
+        themes: List[str]
+    ):
+        self._generator = generator
+        self.size = size
+        self._buckets: Dict[str, Deque[Dict[str, Any]]] = {
+            normalize_theme(theme): deque() for theme in themes
+        }
+        self._refilling: Set[str] = set()
+        self._tasks: Set[asyncio.Task] = set()
+
+        # 统计计数
+        self.hits = 0
+        self.misses = 0
+        self.generated = 0
+        self.failures = 0
+
+    def pop(self, theme: Optional[str]) -> Optional[Dict[str, Any]]:
+        """从对应主题桶中取出一道谜题, 没有可用谜题时返回 None"""
+        key = normalize_theme(theme)
+        bucket = self._buckets.get(key)
+        if not bucket:
+            self.misses += 1
+            if bucket is not None:
+                self.schedule_refill(key)
+            return None
+
+        puzzle = bucket.popleft()
+        self.hits += 1
+        self.schedule_refill(key)
+        return puzzle
+
+    def warm_up(self):
+        """为所有主题桶安排后台填充"""
+        for key in self._buckets:
+            self.schedule_refill(key)
+
+    def schedule_refill(self, theme: str):
+        """安排后台补充指定主题桶, 同一主题同时只有一个补充任务"""
+        key = normalize_theme(theme)
+        if self.size <= 0 or key not in self._buckets or key in self._refilling:
+            return
+        if len(self._buckets[key]) >= self.size:
+            return
+
+        self._refilling.add(key)
+        task = asyncio.create_task(self._refill(key))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _refill(self, key: str):
+        """逐个生成谜题直到主题桶达到目标数量"""
+        try:
+            bucket = self._buckets[key]
+            while len(bucket) < self.size:
+                try:
+                    puzzle = await self._generator(key)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    # 生成失败时停止本轮补充, 等下一次取出时再尝试
+                    self.failures += 1
+                    logger.warning(f"预生成谜题失败(主题: {key or '随机'}): {e}")
+                    return
+                if not puzzle:
+                    return
+                bucket.append(puzzle)
+                self.generated += 1
+        finally:
+            self._refilling.discard(key)
+
+    async def close(self):
+        """取消所有后台补充任务"""
+        for task in list(self._tasks):
+            task.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """获取预生成池的统计信息"""
+        return {
+            'size': self.size,
+            'buckets': {key: len(bucket) for key, bucket in self._buckets.items()},
+            'hits': self.hits,
+            'misses': self.misses,
+            'generated': self.generated,
+            'failures': self.failures
+        }
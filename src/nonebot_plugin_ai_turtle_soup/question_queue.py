@@ -0,0 +1,116 @@
+"""
+问题队列模块
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Tuple
+from .game_store import GameEndedError
+
+
+class QuestionLimitError(ValueError):
+    """提问次数已用完, 同一批中超出上限的问题不再评判"""
+
+    def __init__(self, message: str = "已达到最大提问次数"):
+        super().__init__(message)
+
+
+class QuestionQueue:
+    """按会话串行处理玩家问题的队列
+
+    同一会话的问题按到达顺序依次处理; 空闲会话的问题立即处理,
+    上一次请求进行中到达的多个问题会被合并为一批, 交给处理函数一次性完成。
+    `window` 大于 0 时, 空闲会话收到问题后先等待这段时间再处理, 以便合并同时到达的问题。
+    处理函数为某个问题返回异常对象时, 只有该问题的提问收到这个异常。
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[str, List[str]], Awaitable[List[Any]]],
+        window: float = 0,
+        max_batch: int = 5
+    ):
+        self._handler = handler
+        self.window = window
+        self.max_batch = max(1, max_batch)
+        self._pending: Dict[str, List[Tuple[str, asyncio.Future]]] = {}
+        self._workers: Dict[str, asyncio.Task] = {}
+
+        # 统计计数
+        self.questions = 0
+        self.batches = 0
+
+    async def submit(self, session_id: str, question: str) -> Dict[str, Any]:
+        """提交问题并等待其结果"""
+        future = asyncio.get_running_loop().create_future()
+        self._pending.setdefault(session_id, []).append((question, future))
+        self.questions += 1
+        if session_id not in self._workers:
+            self._workers[session_id] = asyncio.create_task(self._worker(session_id))
+        return await future
+
+    async def _worker(self, session_id: str):
+        """依次处理会话中积压的问题"""
+        try:
+            # 只在会话空闲时等待收集窗口, 请求进行中积压的问题已经可以直接合并
+            if self.window > 0:
+                await asyncio.sleep(self.window)
+            while True:
+
+                pending = self._pending.get(session_id)
+                if not pending:
+                    break
+                batch = pending[:self.max_batch]
+                del pending[:self.max_batch]
+
+                # 已被取消的问题不再处理
+                batch = [(question, future) for question, future in batch if not future.done()]
+                if not batch:
+                    continue
+
+                self.batches += 1
+                try:
+                    results = await self._handler(session_id, [question for question, _ in batch])
+                except asyncio.CancelledError:
+                    for _, future in batch:
+                        future.cancel()
+                    raise
+                except Exception as e:
+                    for _, future in batch:
+                        if not future.done():
+                            future.set_exception(e)
+                else:
+                    for (_, future), result in zip(batch, results):
+                        if future.done():
+                            continue
+                        if isinstance(result, Exception):
+                            future.set_exception(result)
+                        else:
+                            future.set_result(result)
+        finally:
+            self._workers.pop(session_id, None)
+            if not self._pending.get(session_id):
+                self._pending.pop(session_id, None)
+
+    def discard(self, session_id: str):
+        """丢弃会话中尚未处理的问题, 等待中的提问会收到游戏已结束的错误"""
+        for _, future in self._pending.pop(session_id, []):
+            if not future.done():
+                future.set_exception(GameEndedError())
+
+    async def close(self):
+        """取消所有处理中的任务"""
+        for session_id in list(self._pending):
+            self.discard(session_id)
+        workers = list(self._workers.values())
+        for task in workers:
+            task.cancel()
+        if workers:
+            await asyncio.gather(*workers, return_exceptions=True)
+
+    def stats(self) -> Dict[str, int]:
+        """获取队列的统计信息"""
+        return {
+            'sessions': len(self._workers),
+            'pending': sum(len(pending) for pending in self._pending.values()),
+            'questions': self.questions,
+            'batches': self.batches
+        }
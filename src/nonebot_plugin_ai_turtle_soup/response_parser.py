@@ -0,0 +1,363 @@
+"""
+模型返回内容解析模块
+
+从模型的返回文本中提取 JSON, 按各类调用的格式进行校验,
+并在含义明确时就地修复(如数字写成字符串、缺少可推断的字段)。
+"""
+import json
+import re
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+# 尾随逗号, 如 {"a": 1,}
+_TRAILING_COMMA_RE = re.compile(r",\s*([}\]])")
+# 百分比写法, 如 "45%"、"45.5 %"
+_PERCENT_RE = re.compile(r"^\s*(-?\d+(?:\.\d+)?)\s*%?\s*$")
+
+_RATING_KEYS = ("overall", "suspense", "logic", "creativity", "playability")
+
+
+class ResponseFormatError(ValueError):
+    """模型返回的内容无法解析或不符合要求的格式"""
+
+
+# 校验函数: 接收解析出的 JSON 和修复记录列表, 返回校验后的值, 不符合格式时抛出 ResponseFormatError
+Schema = Callable[[Any, List[str]], Any]
+
+
+def _balanced_json(text: str, start: int) -> Optional[str]:
+    """从 start 处的 `{` 或 `[` 开始, 找到括号配对完整的片段, 括号不配对或未闭合时返回 None"""
+    stack = ["}" if text[start] == "{" else "]"]
+    in_string = escaped = False
+    for index in range(start + 1, len(text)):
+        char = text[index]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == "\"":
+                in_string = False
+        elif char == "\"":
+            in_string = True
+        elif char in "{[":
+            stack.append("}" if char == "{" else "]")
+        elif char in "}]":
+            if char != stack.pop():
+                return None
+            if not stack:
+                return text[start:index + 1]
+    return None
+
+
+def _json_candidates(text: str) -> Iterator[str]:
+    """依次给出文本中括号配对完整的片段, 跳过 "[结果如下]" 这类并非 JSON 的括号内容"""
+    index = 0
+    while True:
+        starts = [pos for pos in (text.find("{", index), text.find("[", index)) if pos >= 0]
+        if not starts:
+            return
+        start = min(starts)
+        candidate = _balanced_json(text, start)
+        if candidate is None:
+            index = start + 1
+            continue
+        yield candidate
+        index = start + len(candidate)
+
+
+def extract_json(text: Optional[str], repairs: List[str]) -> Any:
+    """从返回文本中提取 JSON
+
+    依次尝试: 直接解析、逐个提取配对完整的片段解析(去掉代码块标记和前后的说明文字)、去掉尾随逗号。
+    """
+    if not text or not text.strip():
+        raise ResponseFormatError("返回内容为空")
+    try:
+        return json.loads(text)
+    except ValueError:
+        pass
+
+    error: Optional[ValueError] = None
+    for candidate in _json_candidates(text):
+        try:
+            value = json.loads(candidate)
+        except ValueError:
+            try:
+                value = json.loads(_TRAILING_COMMA_RE.sub(r"\1", candidate))
+            except ValueError as e:
+                error = e
+                continue
+            repairs.append("去除尾随逗号")
+        if candidate.strip() != text.strip():
+            repairs.append("去除 JSON 之外的内容")
+        return value
+
+    if error is None:
+        raise ResponseFormatError("返回内容中没有完整的 JSON")
+    raise ResponseFormatError(f"JSON 格式错误: {error}") from error
+
+
+def _require_dict(value: Any, what: str) -> Dict[str, Any]:
+    if not isinstance(value, dict):
+        raise ResponseFormatError(f"{what}应为 JSON 对象")
+    return value
+
+
+def _to_number(value: Any, field: str, repairs: List[str]) -> float:
+    """把数字或可明确转换为数字的字符串(如 "45"、"45%")转换为数字"""
+    if isinstance(value, bool):
+        raise ResponseFormatError(f"{field} 应为数字")
+    if isinstance(value, (int, float)):
+        return value
+    if isinstance(value, str):
+        match = _PERCENT_RE.match(value)
+        if match:
+            repairs.append(f"{field} 由字符串转换为数字")
+            return float(match.group(1))
+    raise ResponseFormatError(f"{field} 应为数字")
+
+
+def _to_percent(value: Any, field: str, repairs: List[str]) -> int:
+    """转换为 0 到 100 之间的整数进度"""
+    number = _to_number(value, field, repairs)
+    percent = int(round(number))
+    if percent != number:
+        repairs.append(f"{field} 取整")
+    if not 0 <= percent <= 100:
+        repairs.append(f"{field} 限制在 0 到 100 之间")
+        percent = min(100, max(0, percent))
+    return percent
+
+
+def _to_bool(value: Any, field: str, repairs: List[str]) -> bool:
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, str) and value.strip().lower() in ("true", "false"):
+        repairs.append(f"{field} 由字符串转换为布尔值")
+        return value.strip().lower() == "true"
+    raise ResponseFormatError(f"{field} 应为布尔值")
+
+
+def _to_text(value: Any, field: str) -> str:
+    if not isinstance(value, str) or not value.strip():
+        raise ResponseFormatError(f"缺少 {field}")
+    return value.strip()
+
+
+def _key_facts(value: Any, repairs: List[str]) -> List[Dict[str, Any]]:
+    """关键事实: [{fact, weight}], 也接受字符串数组(权重均为 1)"""
+    if not isinstance(value, list):
+        raise ResponseFormatError("key_facts 应为数组")
+    facts = []
+    for item in value:
+        if isinstance(item, str):
+            repairs.append("关键事实补充权重")
+            item = {'fact': item, 'weight': 1}
+        item = _require_dict(item, "关键事实")
+        weight = _to_number(item.get('weight', 1), 'weight', repairs)
+        if weight <= 0:
+            repairs.append("忽略权重不为正数的关键事实")
+            continue
+        facts.append({'fact': _to_text(item.get('fact'), 'fact'), 'weight': weight})
+    if not facts:
+        raise ResponseFormatError("key_facts 为空")
+    return facts
+
+
+def puzzle_schema(value: Any, repairs: List[str]) -> Dict[str, Any]:
+    """谜题: 可以是谜题对象、谜题数组, 或把数组放在 puzzles/data/items 字段中的对象"""
+    if isinstance(value, dict):
+        for key in ('puzzles', 'data', 'items'):
+            if isinstance(value.get(key), list):
+                value = value[key]
+                break
+    if isinstance(value, list):
+        if not value:
+            raise ResponseFormatError("谜题数组为空")
+        value = value[0]
+    puzzle = _require_dict(value, "谜题")
+
+    for field in ('title', 'puzzle_setting', 'solution'):
+        puzzle[field] = _to_text(puzzle.get(field), field)
+
+    info = puzzle.get('supplementary_info')
+    if info is None:
+        repairs.append("补充 supplementary_info")
+        info = []
+    elif isinstance(info, str):
+        repairs.append("supplementary_info 由字符串转换为数组")
+        info = [info]
+    elif not isinstance(info, list):
+        raise ResponseFormatError("supplementary_info 应为数组")
+    puzzle['supplementary_info'] = [str(item) for item in info if str(item).strip()]
+
+    # 关键事实可以缺少, 之后由单独的提取流程补充
+    if 'key_facts' in puzzle:
+        try:
+            puzzle['key_facts'] = _key_facts(puzzle['key_facts'], repairs)
+        except ResponseFormatError as e:
+            repairs.append(f"丢弃无法使用的 key_facts({e})")
+            del puzzle['key_facts']
+    return puzzle
+
+
+def key_facts_schema(value: Any, repairs: List[str]) -> List[Dict[str, Any]]:
+    """单独提取的关键事实: {key_facts: [...]} 或直接为数组"""
+    if isinstance(value, dict):
+        value = value.get('key_facts')
+    return _key_facts(value, repairs)
+
+
+def _fact_ids(value: Any, fact_count: int, repairs: List[str]) -> List[int]:
+    """提问确认的关键事实编号, 忽略超出范围的编号"""
+    if value is None:
+        repairs.append("补充 facts")
+        return []
+    if not isinstance(value, list):
+        repairs.append("facts 转换为数组")
+        value = [value]
+    ids: List[int] = []
+    for item in value:
+        index = int(_to_number(item, 'facts', repairs))
+        if not 1 <= index <= fact_count:
+            repairs.append("忽略超出范围的事实编号")
+            continue
+        if index not in ids:
+            ids.append(index)
+    return ids
+
+
+def _to_confidence(value: Any, repairs: List[str]) -> float:
+    """0 到 1 之间的置信度, 缺少时视为没有把握"""
+    if value is None:
+        repairs.append("缺少 confidence, 视为没有把握")
+        return 0.0
+    confidence = float(_to_number(value, 'confidence', repairs))
+    if 1 < confidence <= 100:
+        repairs.append("confidence 由百分数转换为小数")
+        confidence /= 100
+    if not 0 <= confidence <= 1:
+        repairs.append("confidence 限制在 0 到 1 之间")
+        confidence = min(1.0, max(0.0, confidence))
+    return confidence
+
+
+def _judge_reply(value: Any, ended: bool, repairs: List[str]) -> str:
+    """评判的回答, 玩家放弃结束游戏时按提示词要求为空字符串"""
+    if ended and (value is None or (isinstance(value, str) and not value.strip())):
+        if value is None:
+            repairs.append("游戏结束, 补充空的 reply")
+        return ""
+    return _to_text(value, 'reply')
+
+
+def judge_schema(
+    count: int,
+    last_percent: Optional[int],
+    fact_count: int = 0,
+    confidence: bool = False
+) -> Schema:
+    """评判结果的校验函数
+
+    `count` 为本次提问的问题数量, 多于一个时结果在 `results` 数组中;
+    `last_percent` 为 None 时(进度分离模式或关键事实模式)每个结果为 {reply, finished}, 否则为 {reply, percent}。
+    进度不能低于上一次的进度, 缺少进度时沿用上一次的进度。
+    `fact_count` 大于 0 时每个结果还包含该提问确认的关键事实编号 `facts`。
+    `confidence` 为 True 时(分级评判的快速模型)每个结果还包含 0 到 1 之间的置信度 `confidence`。
+    """
+    def _schema(value: Any, repairs: List[str]) -> List[Dict[str, Any]]:
+        if count == 1:
+            if isinstance(value, dict) and isinstance(value.get('results'), list) and len(value['results']) == 1:
+                repairs.append("展开只有一个结果的 results")
+                value = value['results'][0]
+            items = [value]
+        else:
+            if isinstance(value, list):
+                repairs.append("结果数组补充 results 字段")
+                items = value
+            else:
+                items = _require_dict(value, "评判结果").get('results')
+            if not isinstance(items, list):
+                raise ResponseFormatError("缺少 results")
+            if len(items) != count:
+                raise ResponseFormatError(f"回答数量({len(items)})与问题数量({count})不一致")
+
+        results = []
+        previous = last_percent
+        for item in items:
+            item = _require_dict(item, "评判结果")
+            result: Dict[str, Any] = {}
+            if previous is None:
+                finished = item.get('finished', False)
+                if 'finished' not in item:
+                    repairs.append("补充 finished")
+                result['finished'] = _to_bool(finished, 'finished', repairs)
+                if fact_count:
+                    result['facts'] = _fact_ids(item.get('facts'), fact_count, repairs)
+            else:
+                if 'percent' in item:
+                    percent = _to_percent(item['percent'], 'percent', repairs)
+                else:
+                    repairs.append("缺少 percent, 沿用上一次的进度")
+                    percent = previous
+                if percent < previous:
+                    repairs.append("percent 不能低于上一次的进度")
+                    percent = previous
+                result['percent'] = previous = percent
+            result['reply'] = _judge_reply(item.get('reply'), result.get('finished') or result.get('percent') == 100, repairs)
+            if confidence:
+                result['confidence'] = _to_confidence(item.get('confidence'), repairs)
+            results.append(result)
+        return results
+
+    return _schema
+
+
+def progress_schema(value: Any, repairs: List[str]) -> int:
+    """重新计算的进度"""
+    result = _require_dict(value, "进度结果")
+    if 'recalculated_percent' in result:
+        return _to_percent(result['recalculated_percent'], 'recalculated_percent', repairs)
+    if 'percent' in result:
+        repairs.append("使用 percent 代替 recalculated_percent")
+        return _to_percent(result['percent'], 'recalculated_percent', repairs)
+    raise ResponseFormatError("缺少 recalculated_percent")
+
+
+def rating_schema(value: Any, repairs: List[str]) -> Dict[str, Any]:
+    """谜题评分"""
+    result = _require_dict(value, "评分结果")
+    scores = result.get('scores')
+    if scores is None and all(key in result for key in _RATING_KEYS):
+        repairs.append("评分补充 scores 字段")
+        scores = {key: result[key] for key in _RATING_KEYS}
+    scores = _require_dict(scores, "scores")
+    for key in _RATING_KEYS:
+        if key not in scores:
+            raise ResponseFormatError(f"缺少评分项 {key}")
+        scores[key] = _to_number(scores[key], key, repairs)
+    result['scores'] = scores
+    return result
+
+
+def response_text(response: Any) -> Optional[str]:
+    """获取 chat completion 响应的文本内容"""
+    try:
+        return response.choices[0].message.content
+    except (AttributeError, IndexError, TypeError):
+        return None
+
+
+def decode(text: Optional[str], schema: Schema) -> Tuple[Any, List[str]]:
+    """提取并校验返回内容, 返回校验后的值和所做的修复"""
+    repairs: List[str] = []
+    value = extract_json(text, repairs)
+    return schema(value, repairs), repairs
+
+
+def reask_message(error: ResponseFormatError) -> Dict[str, str]:
+    """让模型重新输出时追加的用户消息"""
+    return {
+        "role": "user",
+        "content": f"你上一次的输出无法使用({error})。请严格按照系统提示中要求的 JSON 格式重新输出, 不要包含任何其他内容。"
+    }
@@ -0,0 +1,221 @@
+"""
+模型调用调度模块
+"""
+import asyncio
+import heapq
+import itertools
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, TypeVar
+from nonebot.log import logger
+
+T = TypeVar("T")
+
+# 调用优先级, 数值越小越优先
+PRIORITY_INTERACTIVE = 0  # 玩家正在等待的评判
+PRIORITY_GENERATE = 1  # 玩家正在等待的谜题生成
+PRIORITY_PROGRESS = 2  # 玩家主动请求的进度重算
+PRIORITY_BACKGROUND = 3  # 后台进度计算、评分、预生成池补充
+
+# 退避等待的上限(秒)
+_MAX_BACKOFF = 30.0
+
+
+class LLMBusyError(Exception):
+    """重试次数用尽后仍被限流或服务端出错"""
+
+
+class LLMTimeoutError(Exception):
+    """模型调用(含排队和重试)超过了操作的截止时间"""
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """读取错误响应中的 Retry-After 头"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def is_retryable(error: Exception) -> bool:
+    """是否为可以重试的错误: 429、5xx、连接错误和超时"""
+    from openai import APIConnectionError, APIStatusError
+
+    if isinstance(error, APIConnectionError):
+        return True
+    if isinstance(error, APIStatusError):
+        return error.status_code == 429 or error.status_code >= 500
+    return False
+
+
+class TokenBucket:
+    """令牌桶限速器"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+
+    def reserve(self) -> float:
+        """取出一个令牌, 返回需要等待的时间(秒)"""
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        self._tokens -= 1
+        if self._tokens >= 0:
+            return 0.0
+        return -self._tokens / self.rate
+
+
+class EndpointLimiter:
+    """单个接口的并发限制, 等待中的调用按优先级获得执行机会"""
+
+    def __init__(self, concurrency: int, rate_per_minute: float):
+        self.concurrency = max(1, concurrency)
+        self.bucket: Optional[TokenBucket] = None
+        if rate_per_minute > 0:
+            self.bucket = TokenBucket(rate_per_minute / 60, max(1.0, rate_per_minute / 60))
+        self._active = 0
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._counter = itertools.count()
+
+        # 统计计数
+        self.calls = 0
+        self.retries = 0
+        self.failures = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    @property
+    def queued(self) -> int:
+        return sum(1 for _, _, future in self._waiters if not future.done())
+
+    async def acquire(self, priority: int):
+        """按优先级等待一个执行名额, 并遵守速率限制"""
+        start = time.monotonic()
+        if self._active < self.concurrency and not self.queued:
+            self._active += 1
+        else:
+            future = asyncio.get_running_loop().create_future()
+            heapq.heappush(self._waiters, (priority, next(self._counter), future))
+            try:
+                await future
+            except asyncio.CancelledError:
+                # 名额已经转交给本调用但调用被取消, 需要归还名额
+                if future.done() and not future.cancelled():
+                    self.release()
+                raise
+
+        if self.bucket:
+            delay = self.bucket.reserve()
+            if delay > 0:
+                try:
+                    await asyncio.sleep(delay)
+                except asyncio.CancelledError:
+                    self.release()
+                    raise
+
+        waited = time.monotonic() - start
+        self.wait_total += waited
+        self.wait_max = max(self.wait_max, waited)
+
+    def release(self):
+        """归还执行名额, 直接转交给优先级最高的等待者"""
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        self._active -= 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'active': self._active,
+            'queued': self.queued,
+            'calls': self.calls,
+            'retries': self.retries,
+            'failures': self.failures,
+            'wait_total': self.wait_total,
+            'wait_avg': self.wait_total / self.calls if self.calls else 0.0,
+            'wait_max': self.wait_max
+        }
+
+
+class LLMScheduler:
+    """所有模型调用共用的调度器
+
+    按接口限制并发数和请求速率, 按优先级排队,
+    遇到 429/5xx/连接错误时带随机抖动地指数退避重试。
+    """
+
+    def __init__(
+        self,
+        concurrency: int = 8,
+        rate_per_minute: float = 0,
+        max_retries: int = 3,
+        backoff: float = 1.0
+    ):
+        self.concurrency = concurrency
+        self.rate_per_minute = rate_per_minute
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self._limiters: Dict[str, EndpointLimiter] = {}
+
+    def _limiter(self, endpoint: str) -> EndpointLimiter:
+        limiter = self._limiters.get(endpoint)
+        if limiter is None:
+            limiter = self._limiters[endpoint] = EndpointLimiter(self.concurrency, self.rate_per_minute)
+        return limiter
+
+    def _backoff_delay(self, attempt: int, error: Exception) -> float:
+        """计算第 attempt 次重试前的等待时间, 优先遵守 Retry-After"""
+        retry_after = _retry_after(error)
+        if retry_after is not None:
+            return min(retry_after, _MAX_BACKOFF)
+        delay = min(self.backoff * (2 ** attempt), _MAX_BACKOFF)
+        return random.uniform(delay / 2, delay)
+
+    async def submit(
+        self,
+        endpoint: str,
+        priority: int,
+        call: Callable[[], Awaitable[T]],
+        max_retries: Optional[int] = None
+    ) -> T:
+        """在指定接口上按优先级执行一次模型调用
+
+        `max_retries` 为 None 时使用调度器的默认重试次数。
+        """
+        if max_retries is None:
+            max_retries = self.max_retries
+        limiter = self._limiter(endpoint)
+        attempt = 0
+        while True:
+            await limiter.acquire(priority)
+            try:
+                limiter.calls += 1
+                return await call()
+            except Exception as e:
+                if not is_retryable(e):
+                    limiter.failures += 1
+                    raise
+                if attempt >= max_retries:
+                    limiter.failures += 1
+                    logger.warning(f"模型调用重试 {attempt} 次后仍然失败({endpoint}): {e}")
+                    raise LLMBusyError("AI 服务繁忙,请稍后重试") from e
+                delay = self._backoff_delay(attempt, e)
+            finally:
+                limiter.release()
+
+            attempt += 1
+            limiter.retries += 1
+            await asyncio.sleep(delay)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """获取各接口的调度统计信息"""
+        return {endpoint: limiter.stats() for endpoint, limiter in self._limiters.items()}
@@ -0,0 +1,45 @@
+"""
+文本处理工具模块
+"""
+import re
+from typing import FrozenSet
+
+# 中英文标点与空白
+_PUNCTUATION_RE = re.compile(r"[\s　-〿＀-／：-＠［-｀｛-･!-/:-@\[-`{-~…—·“”‘’]+")
+
+
+def strip_punctuation(text: str) -> str:
+    """去除文本中的标点符号和空白"""
+    return _PUNCTUATION_RE.sub("", text)
+
+
+def normalize_text(text: str) -> str:
+    """规范化文本: 去除标点和空白并转为小写"""
+    return strip_punctuation(text or "").lower()
+
+
+def char_ngrams(text: str, n: int = 2) -> FrozenSet[str]:
+    """获取文本的字符 n-gram 集合, 文本长度不足 n 时返回整个文本"""
+    if len(text) < n:
+        return frozenset([text]) if text else frozenset()
+    return frozenset(text[i:i + n] for i in range(len(text) - n + 1))
+
+
+def jaccard(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    """计算两个集合的 Jaccard 相似度"""
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def dice(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    """计算两个集合的 Dice 相似度, 对短文本比 Jaccard 更宽容"""
+    if not a or not b:
+        return 0.0
+    return 2 * len(a & b) / (len(a) + len(b))
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算文本的 token 数量: 中文等宽字符约 1 字 1 token, 其余约 4 字符 1 token"""
+    wide = sum(1 for char in text if ord(char) > 0x2E80)
+    return wide + (len(text) - wide + 3) // 4
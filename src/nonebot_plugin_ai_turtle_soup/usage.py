@@ -0,0 +1,67 @@
+"""
+模型用量统计模块
+"""
+from typing import Any, Dict, List, Optional
+from .text_utils import estimate_tokens
+
+
+def estimate_usage(messages: List[Dict[str, str]], response: Any) -> Dict[str, int]:
+    """接口没有返回 `usage` 时按请求和回复的文本估算 token 用量"""
+    try:
+        content = response.choices[0].message.content or ""
+    except (AttributeError, IndexError, TypeError):
+        content = ""
+    return {
+        'prompt_tokens': sum(estimate_tokens(str(message.get("content", ""))) for message in messages),
+        'completion_tokens': estimate_tokens(content),
+        'cached_tokens': 0
+    }
+
+
+def extract_usage(response: Any, messages: Optional[List[Dict[str, str]]] = None) -> Dict[str, int]:
+    """从 chat completion 响应的 `usage` 字段中提取 token 用量
+
+    兼容 OpenAI 的 `prompt_tokens_details.cached_tokens`
+    以及部分服务商使用的 `prompt_cache_hit_tokens` 字段。
+    响应中没有 `usage` 时, 提供了请求消息 `messages` 则在本地估算, 否则记为 0。
+    """
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        if messages is not None:
+            return estimate_usage(messages, response)
+        return {'prompt_tokens': 0, 'completion_tokens': 0, 'cached_tokens': 0}
+
+    cached_tokens = 0
+    details = getattr(usage, "prompt_tokens_details", None)
+    if details is not None:
+        cached_tokens = getattr(details, "cached_tokens", None) or 0
+    if not cached_tokens:
+        cached_tokens = getattr(usage, "prompt_cache_hit_tokens", None) or 0
+
+    return {
+        'prompt_tokens': getattr(usage, "prompt_tokens", None) or 0,
+        'completion_tokens': getattr(usage, "completion_tokens", None) or 0,
+        'cached_tokens': cached_tokens
+    }
+
+
+class UsageStats:
+    """按调用类型累计的 token 用量"""
+
+    def __init__(self):
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    def record(self, kind: str, response: Any, messages: Optional[List[Dict[str, str]]] = None) -> Dict[str, int]:
+        """记录一次调用的用量, 返回本次调用的用量"""
+        usage = extract_usage(response, messages)
+        stats = self._stats.setdefault(kind, {
+            'calls': 0, 'prompt_tokens': 0, 'completion_tokens': 0, 'cached_tokens': 0
+        })
+        stats['calls'] += 1
+        for key, value in usage.items():
+            stats[key] += value
+        return usage
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        """获取各调用类型的累计用量"""
+        return {kind: dict(stats) for kind, stats in self._stats.items()}
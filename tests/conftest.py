@@ -0,0 +1,27 @@
+"""
+测试配置
+
+初始化 NoneBot 并加载插件, 插件的数据文件写入临时目录, 不访问任何模型接口。
+"""
+import asyncio
+import tempfile
+from pathlib import Path
+from typing import Any, Awaitable
+
+import nonebot
+
+_ROOT = Path(tempfile.mkdtemp(prefix="ats-test-"))
+
+nonebot.init(
+    localstore_data_dir=_ROOT / "data",
+    localstore_cache_dir=_ROOT / "cache",
+    localstore_config_dir=_ROOT / "config",
+    ats_openai_generate_api_key="test",
+    ats_openai_judge_api_key="test",
+)
+nonebot.load_plugin("nonebot_plugin_ai_turtle_soup")
+
+
+def run(coro: Awaitable[Any]) -> Any:
+    """在新的事件循环中运行协程"""
+    return asyncio.run(coro)
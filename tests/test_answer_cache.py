@@ -0,0 +1,41 @@
+from nonebot_plugin_ai_turtle_soup.answer_cache import AnswerCache, AnswerCacheStore, normalize_question
+
+
+def test_normalize_strips_politeness_and_particles():
+    assert normalize_question("请问, 他是故意的吗？") == "他是故意的"
+    assert normalize_question("那么他是故意的吧") == "他是故意的"
+
+
+def test_repeated_and_near_duplicate_questions_hit():
+    cache = AnswerCache(threshold=0.8)
+    cache.put("他是故意杀人的吗", "是")
+    assert cache.get("请问他是故意杀人的吗？") == "是"
+    assert cache.get("他是故意杀人吗") == "是"
+
+
+def test_negated_or_substituted_questions_miss():
+    cache = AnswerCache(threshold=0.8)
+    cache.put("他是故意杀人的吗", "是")
+    assert cache.get("他不是故意杀人的吗") is None
+    assert cache.get("他是故意杀猫的吗") is None
+
+
+def test_only_definite_replies_are_cached():
+    cache = AnswerCache(threshold=0.8)
+    cache.put("他是厨师吗", "是也不是")
+    cache.put("汤有问题吗", "不重要")
+    assert cache.get("他是厨师吗") is None
+    assert cache.get("汤有问题吗") == "不重要"
+    assert len(cache) == 1
+
+
+def test_store_evicts_least_recently_used_puzzle():
+    store = AnswerCacheStore(threshold=0.8, max_puzzles=2)
+    store.store("a", "他是厨师吗", "是")
+    store.store("b", "他是厨师吗", "不是")
+    assert store.lookup("a", "他是厨师吗") == "是"
+    store.store("c", "他是厨师吗", "是")
+    assert store.stats()['puzzles'] == 2
+    assert store.lookup("a", "他是厨师吗") == "是"
+    assert store.lookup("b", "他是厨师吗") is None
+    assert (store.stats()['hits'], store.stats()['misses']) == (2, 1)
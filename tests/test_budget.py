@@ -0,0 +1,109 @@
+from datetime import datetime
+
+import pytest
+
+from conftest import run
+from nonebot_plugin_ai_turtle_soup.budget import (
+    BUDGET_GENERATE,
+    BUDGET_JUDGE,
+    WINDOW_DAY,
+    WINDOW_HOUR,
+    BudgetExceededError,
+    TokenBudget,
+)
+from nonebot_plugin_ai_turtle_soup.kv_store import SQLiteKVStore
+
+_LIMITS = {BUDGET_JUDGE: {WINDOW_HOUR: 100, WINDOW_DAY: 150}}
+
+
+def test_usage_is_counted_per_category_and_window():
+    budget = TokenBudget(_LIMITS)
+    now = datetime(2026, 1, 1, 10, 30)
+    budget.record("s", "judge", 40, now)
+    budget.record("s", "judge_fast", 20, now)
+    budget.record("s", "rate", 7, now)
+    budget.record("s", "unknown", 99, now)
+    assert budget.session_usage("s", now) == {
+        BUDGET_GENERATE: {WINDOW_HOUR: 7, WINDOW_DAY: 7},
+        BUDGET_JUDGE: {WINDOW_HOUR: 60, WINDOW_DAY: 60},
+    }
+
+
+def test_hour_window_resets_but_day_window_does_not():
+    budget = TokenBudget(_LIMITS)
+    budget.record("s", "judge", 100, datetime(2026, 1, 1, 10, 59))
+    assert budget.exceeded("s", BUDGET_JUDGE, datetime(2026, 1, 1, 10, 59)) == (
+        WINDOW_HOUR, datetime(2026, 1, 1, 11, 0)
+    )
+    assert budget.exceeded("s", BUDGET_JUDGE, datetime(2026, 1, 1, 11, 0)) is None
+
+    budget.record("s", "judge", 60, datetime(2026, 1, 1, 11, 5))
+    assert budget.exceeded("s", BUDGET_JUDGE, datetime(2026, 1, 1, 11, 5)) == (
+        WINDOW_DAY, datetime(2026, 1, 2, 0, 0)
+    )
+
+
+def test_check_raises_and_counts_rejections():
+    budget = TokenBudget(_LIMITS)
+    budget.record("s", "judge", 200)
+    with pytest.raises(BudgetExceededError):
+        budget.check("s", BUDGET_JUDGE)
+    budget.check("s", BUDGET_GENERATE)
+    budget.check("other", BUDGET_JUDGE)
+    assert budget.rejections == {BUDGET_GENERATE: 0, BUDGET_JUDGE: 1}
+
+
+def test_expired_windows_are_pruned():
+    budget = TokenBudget(_LIMITS)
+    budget.record("old", "judge", 10, datetime(2026, 1, 1, 10, 0))
+    budget.record("new", "judge", 10, datetime(2026, 1, 2, 10, 0))
+    assert list(budget._usage) == ["new"]
+
+
+def test_usage_survives_a_restart(tmp_path):
+    path = tmp_path / "shared.db"
+
+    async def first():
+        budget = TokenBudget(_LIMITS, store=SQLiteKVStore(path))
+        budget.record("s", "judge", 80)
+        budget.record("s", "judge", 30)
+        await budget.close()
+        await budget.store.close()
+
+    async def second():
+        budget = TokenBudget(_LIMITS, store=SQLiteKVStore(path))
+        try:
+            await budget.sync("s")
+            used = budget.used("s", BUDGET_JUDGE, WINDOW_DAY)
+            with pytest.raises(BudgetExceededError):
+                budget.check("s", BUDGET_JUDGE)
+            return used
+        finally:
+            await budget.store.close()
+
+    run(first())
+    assert run(second()) == 110
+
+
+def test_processes_share_one_budget(tmp_path):
+    path = tmp_path / "shared.db"
+
+    async def scenario():
+        first = TokenBudget(_LIMITS, store=SQLiteKVStore(path))
+        second = TokenBudget(_LIMITS, store=SQLiteKVStore(path))
+        try:
+            first.record("s", "judge", 50)
+            second.record("s", "judge", 50)
+            # 未写入的用量在同步时也计入本进程的用量
+            await second.sync("s")
+            assert second.used("s", BUDGET_JUDGE, WINDOW_HOUR) >= 50
+            await first.flush()
+            await second.flush()
+            await first.sync("s")
+            return first.used("s", BUDGET_JUDGE, WINDOW_HOUR)
+        finally:
+            for budget in (first, second):
+                await budget.close()
+                await budget.store.close()
+
+    assert run(scenario()) == 100
@@ -0,0 +1,87 @@
+import sqlite3
+
+from conftest import run
+from nonebot_plugin_ai_turtle_soup.game_backend import SQLiteGameBackend
+
+
+def _game(title: str):
+    return {
+        'puzzle': {'title': title, 'puzzle_setting': '汤面', 'solution': '汤底', 'supplementary_info': []},
+        'puzzle_id': None,
+        'puzzle_key': title,
+        'history': [],
+        'percent': 0,
+        'start_time': 0.0,
+        'hint_index': 0,
+        'unscored': 0,
+    }
+
+
+def _rows(path):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute("SELECT session_id, op FROM journal ORDER BY seq").fetchall()
+    finally:
+        conn.close()
+
+
+def test_ended_games_are_removed_from_journal(tmp_path):
+    path = tmp_path / "games.db"
+    backend = SQLiteGameBackend(path)
+
+    async def scenario():
+        backend.record_create("s1", _game("a"))
+        backend.record_turn("s1", {'question': '是人吗', 'answer': '是', 'percent': 10})
+        backend.record_create("s2", _game("b"))
+        await backend.flush()
+        backend.record_turn("s1", {'question': '死了吗', 'answer': '不是', 'percent': 20})
+        backend.record_end("s1")
+        await backend.flush()
+        await backend.close()
+
+    run(scenario())
+    assert _rows(path) == [("s2", "create")]
+
+
+def test_new_snapshot_replaces_earlier_rows(tmp_path):
+    path = tmp_path / "games.db"
+    backend = SQLiteGameBackend(path)
+
+    async def scenario():
+        backend.record_create("s1", _game("a"))
+        backend.record_turn("s1", {'question': '是人吗', 'answer': '是', 'percent': 10})
+        backend.record_end("s1")
+        backend.record_create("s1", _game("b"))
+        backend.record_update("s1", {'hint_index': 1})
+        await backend.flush()
+        await backend.close()
+
+    run(scenario())
+    assert _rows(path) == [("s1", "create"), ("s1", "update")]
+
+    games = run(SQLiteGameBackend(path).start())
+    assert games["s1"]['puzzle']['title'] == "b"
+    assert games["s1"]['hint_index'] == 1
+
+
+def test_restore_replays_turns(tmp_path):
+    path = tmp_path / "games.db"
+    backend = SQLiteGameBackend(path)
+
+    async def scenario():
+        backend.record_create("s1", _game("a"))
+        backend.record_turn("s1", {'question': '是人吗', 'answer': '是', 'percent': 10})
+        await backend.flush()
+        await backend.close()
+
+    run(scenario())
+    restored = SQLiteGameBackend(path)
+
+    async def restore():
+        games = await restored.start()
+        await restored.close()
+        return games
+
+    games = run(restore())
+    assert games["s1"]['percent'] == 10
+    assert [turn['question'] for turn in games["s1"]['history']] == ['是人吗']
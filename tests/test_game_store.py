@@ -0,0 +1,58 @@
+from nonebot_plugin_ai_turtle_soup.game_state import Game
+from nonebot_plugin_ai_turtle_soup.game_store import GameStore
+
+
+def _game(start_time: float) -> Game:
+    puzzle = {'title': "t", 'puzzle_setting': "s", 'solution': "a", 'supplementary_info': []}
+    return Game(puzzle, None, "t", start_time=start_time)
+
+
+def test_least_recently_used_game_is_evicted():
+    removed = []
+    store = GameStore(timeout=100, max_games=2, on_remove=removed.append)
+    store["a"] = _game(0)
+    store["b"] = _game(0)
+    store.get("a")
+    store["c"] = _game(0)
+    assert list(store) == ["a", "c"]
+    assert removed == ["b"]
+    assert store.stats()['evicted'] == 1
+
+
+def test_sweep_removes_expired_games_only():
+    removed = []
+    store = GameStore(timeout=10, on_remove=removed.append)
+    store["a"] = _game(0)
+    store["b"] = _game(5)
+    assert store.is_expired("a", now=10)
+    assert store.sweep(now=10) == ["a"]
+    assert removed == ["a"]
+    assert "b" in store
+    assert store.stats()['expired'] == 1
+
+
+def test_replaced_game_keeps_new_deadline():
+    store = GameStore(timeout=10)
+    store["a"] = _game(0)
+    store["a"] = _game(8)
+    assert store.sweep(now=12) == []
+    assert store.sweep(now=18) == ["a"]
+
+
+def test_rewriting_a_game_does_not_grow_the_heap():
+    store = GameStore(timeout=10)
+    game = _game(0)
+    for _ in range(100):
+        store["a"] = game
+    assert len(store._heap) == 1
+
+
+def test_stale_entries_are_compacted():
+    store = GameStore(timeout=10)
+    for start in range(100):
+        store["a"] = _game(start)
+        store.pop("b")
+        store["b"] = _game(start)
+    assert len(store._heap) <= 2 * len(store)
+    assert store.sweep(now=108) == []
+    assert sorted(store.sweep(now=109)) == ["a", "b"]
@@ -0,0 +1,62 @@
+import pytest
+
+from nonebot_plugin_ai_turtle_soup.intent import (
+    REASON_CHATTER,
+    REASON_OPEN_QUESTION,
+    Intent,
+    IntentClassifier,
+)
+
+
+@pytest.mark.parametrize("text", [
+    "他是不是生病了或者受伤了",
+    "他多少知道一些内情吗",
+    "他多少知道一些内情",
+    "什么都没发生",
+    "他谁都不认识",
+    "他不是什么好人",
+    "他放弃了游戏",
+    "男人死了吗",
+    "是自杀还是他杀吗",
+])
+def test_yes_no_questions_reach_judge(text):
+    assert IntentClassifier().classify(text) == (Intent.QUESTION, None)
+
+
+@pytest.mark.parametrize("text", [
+    "他为什么这么做",
+    "是自杀还是他杀",
+    "他有多少钱",
+    "死了多少人",
+    "凶手是谁",
+    "发生了什么",
+])
+def test_open_questions_are_filtered(text):
+    assert IntentClassifier().classify(text) == (Intent.INVALID, REASON_OPEN_QUESTION)
+
+
+@pytest.mark.parametrize("text, intent", [
+    ("进度怎么样", Intent.PROGRESS),
+    ("现在进度有变化吗", Intent.PROGRESS),
+    ("帮我重新计算一下", Intent.RECALCULATE),
+    ("重算进度吧", Intent.RECALCULATE),
+    ("查看进度", Intent.PROGRESS),
+    ("给个提示吧", Intent.HINT),
+    ("放弃", Intent.GIVE_UP),
+    ("我放弃了", Intent.GIVE_UP),
+    ("不想玩了", Intent.GIVE_UP),
+])
+def test_commands(text, intent):
+    assert IntentClassifier().classify(text) == (intent, None)
+
+
+@pytest.mark.parametrize("text", ["放弃了游戏", "他放弃", "我放弃治疗"])
+def test_give_up_requires_exact_match(text):
+    assert IntentClassifier().classify(text)[0] != Intent.GIVE_UP
+
+
+def test_chatter_is_filtered_and_counted():
+    classifier = IntentClassifier()
+    assert classifier.classify("哈哈哈") == (Intent.INVALID, REASON_CHATTER)
+    assert classifier.classify("男人死了吗") == (Intent.QUESTION, None)
+    assert classifier.filtered == 1
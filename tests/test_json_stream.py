@@ -0,0 +1,37 @@
+from nonebot_plugin_ai_turtle_soup.json_stream import JSONFieldStream
+
+
+def _feed(stream, text, size=3):
+    found = {}
+    for index in range(0, len(text), size):
+        found.update(stream.feed(text[index:index + size]))
+    return found
+
+
+def test_fields_are_reported_once_complete():
+    stream = JSONFieldStream(["title", "puzzle_setting"])
+    assert stream.feed('```json\n{"title": "红') == {}
+    assert stream.feed('色\\"房间\\"", "solution": "x", ') == {'title': '红色"房间"'}
+    assert stream.feed('"puzzle_setting": "汤面"}') == {'puzzle_setting': "汤面"}
+    assert stream.complete
+
+
+def test_nested_objects_and_first_value_wins():
+    stream = JSONFieldStream(["title"])
+    found = _feed(stream, '[{"meta": {"title": "a"}}, {"title": "b"}]')
+    assert found == {'title': "a"}
+
+
+def test_values_are_not_mistaken_for_keys():
+    stream = JSONFieldStream(["title"])
+    assert _feed(stream, '{"name": "title", "list": ["title", "x"], "title": "t"}') == {'title': "t"}
+
+
+def test_bracketed_prose_before_json_is_skipped():
+    stream = JSONFieldStream(["title"])
+    assert _feed(stream, '[结果如下]\n```json\n{"title": "t"}```') == {'title': "t"}
+
+
+def test_closed_container_without_fields_keeps_scanning():
+    stream = JSONFieldStream(["title"])
+    assert _feed(stream, '示例: {} 实际输出: {"title": "t"}') == {'title': "t"}
@@ -0,0 +1,77 @@
+from nonebot_plugin_ai_turtle_soup.game_state import Game, Turn
+from nonebot_plugin_ai_turtle_soup.judge_context import FOLD_BLOCK, JudgeContext
+from nonebot_plugin_ai_turtle_soup.messages import judge_messages
+
+
+def _game(answers):
+    puzzle = {'title': "t", 'puzzle_setting': "s", 'solution': "a", 'supplementary_info': []}
+    game = Game(puzzle, None, "t")
+    for answer in answers:
+        game.add_turn(Turn(f"q{len(game.history)}", answer, 0))
+    return game
+
+
+def _messages(context, game):
+    context.fold(game)
+    return judge_messages(
+        "system",
+        game.puzzle,
+        history=context.recent_history(game),
+        last_percentage=None,
+        questions=["new"],
+        established_facts=context.established_facts(game)
+    )
+
+
+def test_recent_turns_are_kept_verbatim():
+    context = JudgeContext(recent_turns=3)
+    game = _game(["是"] * (3 + FOLD_BLOCK - 1))
+    context.fold(game)
+    assert len(context.recent_history(game)) == 3 + FOLD_BLOCK - 1
+    assert context.established_facts(game) == []
+
+
+def test_fold_keeps_every_kind_of_answer():
+    context = JudgeContext(recent_turns=1)
+    game = _game(["是", "不是", "不重要", "你猜对了一半", "是", "是"])
+    context.fold(game)
+    assert context.established_facts(game) == [{
+        'confirmed': ["q0", "q4"],
+        'denied': ["q1"],
+        'irrelevant': ["q2"],
+        'other': [{'question': "q3", 'reply': "你猜对了一半"}],
+    }]
+    assert [turn.question for turn in context.recent_history(game)] == ["q5"]
+
+
+def test_folding_only_appends_messages():
+    context = JudgeContext(recent_turns=2)
+    game = _game(["是", "不是"] * 4)
+    before = _messages(context, game)
+    for answer in ["不重要"] * FOLD_BLOCK:
+        game.add_turn(Turn(f"q{len(game.history)}", answer, 0))
+    after = _messages(context, game)
+
+    assert len(context.established_facts(game)) == 2
+    # 系统提示词、谜题和第一个摘要块保持不变, 第二个摘要块追加在它们之后
+    assert after[:3] == before[:3]
+    assert '"irrelevant"' not in after[2]['content']
+    assert after[3]['content'].startswith('{"established_facts"')
+
+
+def test_summary_is_trimmed_to_half_the_budget():
+    context = JudgeContext(recent_turns=1, token_budget=100)
+    game = _game(["是", "不重要"] * 20 + ["是"])
+    context.fold(game)
+    facts = context.established_facts(game)
+    # "不重要"最先丢弃, 确认的事实从最早的开始丢弃
+    assert not any('irrelevant' in block for block in facts)
+    confirmed = [question for block in facts for question in block['confirmed']]
+    assert confirmed == [f"q{index}" for index in range(0, 40, 2)][-len(confirmed):]
+    assert context._summary_tokens(game.summary) <= 50
+
+    # 裁剪后留出的空间可以容纳下一次折叠, 已有的摘要块不变
+    for answer in ["是"] * FOLD_BLOCK:
+        game.add_turn(Turn(f"q{len(game.history)}", answer, 0))
+    context.fold(game)
+    assert context.established_facts(game)[:len(facts)] == facts
@@ -0,0 +1,47 @@
+from types import SimpleNamespace
+
+import pytest
+
+from conftest import run
+from nonebot_plugin_ai_turtle_soup.judge_pool import JudgeEndpoint, JudgePool
+
+
+def _client(base_url: str, fail: bool = False):
+    async def create(model, **kwargs):
+        if fail:
+            raise RuntimeError("down")
+        return f"{base_url}:{model}"
+
+    return SimpleNamespace(base_url=base_url, chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+
+
+async def _submit(name, priority, call, max_retries):
+    return await call()
+
+
+def test_models_on_the_same_url_are_separate_endpoints():
+    client = _client("http://a/v1/")
+    fast = JudgeEndpoint(client, "fast")
+    slow = JudgeEndpoint(client, "slow")
+    assert fast.name != slow.name
+
+    pool = JudgePool([fast, slow], _submit)
+    assert set(pool.stats()['endpoints']) == {fast.name, slow.name}
+
+
+def test_failover_to_next_endpoint():
+    broken = JudgeEndpoint(_client("http://a/v1/", fail=True), "m")
+    working = JudgeEndpoint(_client("http://b/v1/"), "m")
+    pool = JudgePool([broken, working], _submit)
+
+    assert run(pool.chat(0, messages=[])) == "http://b/v1/:m"
+    assert pool.failovers == 1
+    assert broken.errors == 1
+    # 出错的接口进入冷却, 下一次优先使用正常的接口
+    assert pool.primary is working
+
+
+def test_all_endpoints_failing_raises():
+    pool = JudgePool([JudgeEndpoint(_client("http://a/v1/", fail=True), "m")], _submit)
+    with pytest.raises(RuntimeError):
+        run(pool.chat(0, messages=[]))
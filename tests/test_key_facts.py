@@ -0,0 +1,56 @@
+import pytest
+
+from nonebot_plugin_ai_turtle_soup.game_state import Turn
+from nonebot_plugin_ai_turtle_soup.key_facts import confirmed_facts, fact_percent, has_key_facts
+from nonebot_plugin_ai_turtle_soup.response_parser import ResponseFormatError, decode, key_facts_schema
+
+KEY_FACTS = [
+    {'fact': "他曾在海难中被喂过人肉", 'weight': 3},
+    {'fact': "同伴谎称那是海龟汤", 'weight': 2},
+    {'fact': "餐厅的海龟汤味道不同", 'weight': 1},
+]
+
+
+def test_percent_is_weighted_share_of_confirmed_facts():
+    assert fact_percent(KEY_FACTS, []) == 0
+    assert fact_percent(KEY_FACTS, [2]) == 33
+    assert fact_percent(KEY_FACTS, [1, 3]) == 67
+
+
+def test_percent_ignores_unknown_and_repeated_facts():
+    assert fact_percent(KEY_FACTS, [2, 2, 0, 4]) == 33
+
+
+def test_percent_stays_below_100_until_finished():
+    assert fact_percent(KEY_FACTS, [1, 2, 3]) == 99
+    assert fact_percent(KEY_FACTS, [], finished=True) == 100
+
+
+def test_confirmed_facts_collects_all_turns():
+    history = [
+        Turn("他吃过人肉吗", "是", 50, facts=[1]),
+        Turn("他是厨师吗", "不是", 50, facts=[]),
+        Turn("汤的味道不一样吗", "是", 67, facts=[3, 1]),
+        Turn("时间重要吗", "不重要", 67),
+    ]
+    assert confirmed_facts(history) == {1, 3}
+
+
+def test_has_key_facts():
+    assert has_key_facts({'key_facts': KEY_FACTS})
+    assert not has_key_facts({'key_facts': []})
+    assert not has_key_facts({})
+
+
+def test_extracted_facts_are_repaired():
+    value, repairs = decode(
+        '{"key_facts": ["他吃过人肉", {"fact": "同伴骗了他", "weight": "2"}, {"fact": "无关", "weight": 0}]}',
+        key_facts_schema
+    )
+    assert value == [{'fact': "他吃过人肉", 'weight': 1}, {'fact': "同伴骗了他", 'weight': 2}]
+    assert repairs
+
+
+def test_empty_facts_are_rejected():
+    with pytest.raises(ResponseFormatError):
+        decode('{"key_facts": []}', key_facts_schema)
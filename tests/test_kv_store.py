@@ -0,0 +1,84 @@
+import pytest
+
+from conftest import run
+from nonebot_plugin_ai_turtle_soup import kv_store
+from nonebot_plugin_ai_turtle_soup.kv_store import MemoryKVStore, SQLiteKVStore
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        store = MemoryKVStore()
+    else:
+        store = SQLiteKVStore(tmp_path / "kv.db")
+    yield store
+    run(store.close())
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(kv_store.time, "time", lambda: now[0])
+    return now
+
+
+def test_replace_and_delete_require_current_version(store):
+    async def scenario():
+        first = await store.put("game:1", "a", ttl=60)
+        second = await store.replace("game:1", "b", first, ttl=60)
+        assert second is not None and second != first
+        # 持有旧版本号的写入和删除都不生效
+        assert await store.replace("game:1", "c", first, ttl=60) is None
+        assert not await store.delete("game:1", first)
+        assert await store.get("game:1") == (second, "b")
+        assert await store.delete("game:1", second)
+        assert await store.get("game:1") is None
+        assert await store.replace("game:1", "d", second, ttl=60) is None
+
+    run(scenario())
+
+
+def test_values_expire_after_ttl(store, clock):
+    async def scenario():
+        version = await store.put("game:1", "a", ttl=10)
+        clock[0] += 9
+        assert await store.version("game:1") == version
+        clock[0] += 1
+        assert await store.get("game:1") is None
+        assert await store.replace("game:1", "b", version, ttl=10) is None
+
+    run(scenario())
+
+
+def test_lease_is_exclusive_until_released_or_expired(store, clock):
+    async def scenario():
+        assert await store.acquire("lease:1", "bot-a", ttl=30)
+        assert not await store.acquire("lease:1", "bot-b", ttl=30)
+        # 持有者可以续期
+        clock[0] += 20
+        assert await store.acquire("lease:1", "bot-a", ttl=30)
+        clock[0] += 20
+        assert not await store.acquire("lease:1", "bot-b", ttl=30)
+        # 其他持有者不能释放租约
+        await store.release("lease:1", "bot-b")
+        assert not await store.acquire("lease:1", "bot-b", ttl=30)
+        await store.release("lease:1", "bot-a")
+        assert await store.acquire("lease:1", "bot-b", ttl=30)
+        clock[0] += 30
+        assert await store.acquire("lease:1", "bot-a", ttl=30)
+
+    run(scenario())
+
+
+def test_sqlite_values_are_shared_between_connections(tmp_path):
+    async def scenario():
+        writer = SQLiteKVStore(tmp_path / "kv.db")
+        reader = SQLiteKVStore(tmp_path / "kv.db")
+        version = await writer.put("game:1", "a", ttl=60)
+        assert await reader.get("game:1") == (version, "a")
+        assert await reader.acquire("lease:1", "bot-b", ttl=30)
+        assert not await writer.acquire("lease:1", "bot-a", ttl=30)
+        await writer.close()
+        await reader.close()
+
+    run(scenario())
@@ -0,0 +1,12 @@
+import nonebot_plugin_ai_turtle_soup as plugin
+from conftest import run
+
+
+def test_game_manager_is_created_on_first_use(monkeypatch):
+    monkeypatch.setattr(plugin, "_game_manager", None)
+
+    manager = plugin.get_game_manager()
+    try:
+        assert plugin.get_game_manager() is manager
+    finally:
+        run(manager.close())
@@ -0,0 +1,104 @@
+import asyncio
+
+from conftest import run
+from nonebot_plugin_ai_turtle_soup.game_state import Game
+from nonebot_plugin_ai_turtle_soup.game_store import GameEndedError
+from nonebot_plugin_ai_turtle_soup.question_queue import QuestionLimitError, QuestionQueue
+
+
+def test_questions_arriving_during_a_call_are_batched():
+    batches = []
+
+    async def handler(session_id, questions):
+        batches.append(list(questions))
+        await asyncio.sleep(0.01)
+        return [{'reply': question} for question in questions]
+
+    async def scenario():
+        queue = QuestionQueue(handler)
+        first = asyncio.ensure_future(queue.submit("s", "a"))
+        await asyncio.sleep(0)
+        rest = [asyncio.ensure_future(queue.submit("s", question)) for question in "bcd"]
+        results = await asyncio.gather(first, *rest)
+        return queue, results
+
+    queue, results = run(scenario())
+    assert batches == [["a"], ["b", "c", "d"]]
+    assert [result['reply'] for result in results] == ["a", "b", "c", "d"]
+    assert queue.stats()['batches'] == 2
+
+
+def test_max_batch_splits_backlog():
+    batches = []
+
+    async def handler(session_id, questions):
+        batches.append(list(questions))
+        return [{} for _ in questions]
+
+    async def scenario():
+        queue = QuestionQueue(handler, max_batch=2)
+        await asyncio.gather(*(queue.submit("s", question) for question in "abcde"))
+
+    run(scenario())
+    assert batches == [["a", "b"], ["c", "d"], ["e"]]
+
+
+def test_exception_results_fail_only_their_question():
+    async def handler(session_id, questions):
+        return [{'reply': "是"}, QuestionLimitError()]
+
+    async def scenario():
+        queue = QuestionQueue(handler, window=0.01)
+        return await asyncio.gather(queue.submit("s", "a"), queue.submit("s", "b"), return_exceptions=True)
+
+    first, second = run(scenario())
+    assert first == {'reply': "是"}
+    assert isinstance(second, QuestionLimitError)
+
+
+def test_discard_fails_pending_questions():
+    async def handler(session_id, questions):
+        await asyncio.sleep(0.05)
+        return [{} for _ in questions]
+
+    async def scenario():
+        queue = QuestionQueue(handler)
+        first = asyncio.ensure_future(queue.submit("s", "a"))
+        await asyncio.sleep(0)
+        second = asyncio.ensure_future(queue.submit("s", "b"))
+        await asyncio.sleep(0)
+        queue.discard("s")
+        return await asyncio.gather(first, second, return_exceptions=True)
+
+    first, second = run(scenario())
+    assert first == {}
+    assert isinstance(second, GameEndedError)
+
+
+def test_batch_is_cut_at_the_question_limit(monkeypatch):
+    import nonebot_plugin_ai_turtle_soup as plugin
+
+    monkeypatch.setattr(plugin, "_game_manager", None)
+    manager = plugin.get_game_manager()
+    limit = manager.config.ats_max_questions
+
+    async def judge(session_id, questions, messages, last_percentage, fact_count):
+        return [{'reply': "是", 'percent': 10} for _ in questions]
+
+    monkeypatch.setattr(manager, "_cascade_judge", judge)
+    puzzle = {'title': "t", 'puzzle_setting': "s", 'solution': "a", 'supplementary_info': []}
+    manager.games["s"] = Game(puzzle, None, "t")
+
+    async def scenario():
+        try:
+            head = await manager._judge_questions("s", ["q"] * (limit - 1))
+            tail = await manager._judge_questions("s", ["x", "y", "z"])
+            return head, tail
+        finally:
+            await manager.close()
+
+    head, tail = run(scenario())
+    assert len(head) == limit - 1
+    assert tail[0]['reply'] == "是"
+    assert all(isinstance(item, QuestionLimitError) for item in tail[1:])
+    assert manager.games["s"].question_count == limit
@@ -0,0 +1,88 @@
+import pytest
+
+from nonebot_plugin_ai_turtle_soup.response_parser import (
+    ResponseFormatError,
+    decode,
+    extract_json,
+    judge_schema,
+    progress_schema,
+    puzzle_schema,
+)
+
+
+def test_plain_json_needs_no_repair():
+    repairs = []
+    assert extract_json('{"a": 1}', repairs) == {'a': 1}
+    assert repairs == []
+
+
+def test_code_fence_and_prose_are_stripped():
+    repairs = []
+    assert extract_json('好的:\n```json\n{"a": [1, 2]}\n```\n以上', repairs) == {'a': [1, 2]}
+    assert repairs == ["去除 JSON 之外的内容"]
+
+
+def test_bracketed_prose_before_json_is_skipped():
+    repairs = []
+    text = '[结果如下]\n```json\n{"reply": "是", "finished": false}```'
+    assert extract_json(text, repairs) == {'reply': "是", 'finished': False}
+
+
+def test_unbalanced_bracket_before_json_is_skipped():
+    assert extract_json('注意[见下 {"a": 1}', []) == {'a': 1}
+
+
+def test_trailing_comma_is_removed():
+    repairs = []
+    assert extract_json('{"a": [1, 2,],}', repairs) == {'a': [1, 2]}
+    assert repairs == ["去除尾随逗号"]
+
+
+@pytest.mark.parametrize("text", ["", "   ", None, "没有 JSON", "{\"a\": 1"])
+def test_missing_json_is_an_error(text):
+    with pytest.raises(ResponseFormatError):
+        extract_json(text, [])
+
+
+def test_broken_json_reports_format_error():
+    with pytest.raises(ResponseFormatError, match="JSON 格式错误"):
+        extract_json('{"a": 1 "b": 2}', [])
+
+
+def test_judge_fills_missing_fields():
+    results, repairs = decode('{"reply": "是", "percent": "30%"}', judge_schema(1, 40))
+    assert results == [{'percent': 40, 'reply': "是"}]
+    assert "percent 不能低于上一次的进度" in repairs
+
+
+def test_judge_checks_result_count():
+    with pytest.raises(ResponseFormatError):
+        decode('{"results": [{"reply": "是"}]}', judge_schema(2, None))
+
+
+def test_judge_accepts_empty_reply_when_finished():
+    results, _ = decode('{"finished": true}', judge_schema(1, None))
+    assert results == [{'finished': True, 'reply': ""}]
+    with pytest.raises(ResponseFormatError):
+        decode('{"finished": false}', judge_schema(1, None))
+
+
+def test_judge_fact_ids_and_confidence():
+    schema = judge_schema(1, None, fact_count=2, confidence=True)
+    results, repairs = decode('{"reply": "是", "finished": false, "facts": [1, 5], "confidence": 80}', schema)
+    assert results[0]['facts'] == [1]
+    assert results[0]['confidence'] == 0.8
+    assert "忽略超出范围的事实编号" in repairs
+
+
+def test_puzzle_unwraps_array_and_string_info():
+    puzzle, repairs = decode(
+        '{"puzzles": [{"title": "t", "puzzle_setting": "s", "solution": "a", "supplementary_info": "i"}]}',
+        puzzle_schema
+    )
+    assert puzzle['supplementary_info'] == ["i"]
+    assert "supplementary_info 由字符串转换为数组" in repairs
+
+
+def test_progress_accepts_percent_field():
+    assert decode('{"percent": 55}', progress_schema)[0] == 55
@@ -0,0 +1,110 @@
+import asyncio
+from types import SimpleNamespace
+
+import httpx
+import pytest
+from openai import APIConnectionError
+
+from conftest import run
+from nonebot_plugin_ai_turtle_soup import scheduler
+from nonebot_plugin_ai_turtle_soup.scheduler import (
+    PRIORITY_BACKGROUND,
+    PRIORITY_INTERACTIVE,
+    LLMBusyError,
+    LLMScheduler,
+    TokenBucket,
+)
+
+
+def _connection_error() -> APIConnectionError:
+    return APIConnectionError(request=httpx.Request("POST", "http://judge.test/v1/chat/completions"))
+
+
+class _Flaky:
+    """前 `failures` 次调用抛出 `error`, 之后返回 ok"""
+
+    def __init__(self, failures: int, error: Exception):
+        self.failures = failures
+        self.error = error
+        self.calls = 0
+
+    async def __call__(self) -> str:
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise self.error
+        return "ok"
+
+
+def test_token_bucket_waits_once_burst_is_spent(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(scheduler.time, "monotonic", lambda: now[0])
+    bucket = TokenBucket(rate=2, capacity=2)
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == 0
+    assert bucket.reserve() == pytest.approx(0.5)
+    now[0] += 1.5
+    assert bucket.reserve() == 0
+
+
+def test_retryable_errors_are_retried():
+    llm = LLMScheduler(max_retries=3, backoff=0)
+    call = _Flaky(2, _connection_error())
+    assert run(llm.submit("judge", PRIORITY_INTERACTIVE, call)) == "ok"
+    stats = llm.stats()["judge"]
+    assert (stats['calls'], stats['retries'], stats['failures']) == (3, 2, 0)
+
+
+def test_exhausted_retries_raise_busy():
+    llm = LLMScheduler(max_retries=3, backoff=0)
+    call = _Flaky(5, _connection_error())
+    with pytest.raises(LLMBusyError):
+        run(llm.submit("judge", PRIORITY_INTERACTIVE, call, max_retries=1))
+    assert call.calls == 2
+    assert llm.stats()["judge"]['failures'] == 1
+
+
+def test_other_errors_are_not_retried():
+    llm = LLMScheduler(max_retries=3, backoff=0)
+    call = _Flaky(1, ValueError("bad request"))
+    with pytest.raises(ValueError):
+        run(llm.submit("judge", PRIORITY_INTERACTIVE, call))
+    assert call.calls == 1
+    assert llm.stats()["judge"]['retries'] == 0
+
+
+def test_retry_after_header_sets_backoff():
+    llm = LLMScheduler(backoff=1.0)
+    error = Exception("rate limited")
+    error.response = SimpleNamespace(headers={"retry-after": "7"})
+    assert llm._backoff_delay(0, error) == 7
+    assert 2 <= llm._backoff_delay(2, Exception()) <= 4
+
+
+def test_waiting_calls_run_by_priority():
+    llm = LLMScheduler(concurrency=1)
+    order = []
+
+    async def scenario():
+        gate = asyncio.Event()
+
+        async def blocker():
+            await gate.wait()
+            return "blocker"
+
+        def record(name):
+            async def call():
+                order.append(name)
+                return name
+            return call
+
+        first = asyncio.ensure_future(llm.submit("judge", PRIORITY_INTERACTIVE, blocker))
+        await asyncio.sleep(0)
+        background = asyncio.ensure_future(llm.submit("judge", PRIORITY_BACKGROUND, record("background")))
+        interactive = asyncio.ensure_future(llm.submit("judge", PRIORITY_INTERACTIVE, record("interactive")))
+        await asyncio.sleep(0)
+        assert llm.stats()["judge"]['queued'] == 2
+        gate.set()
+        await asyncio.gather(first, background, interactive)
+
+    run(scenario())
+    assert order == ["interactive", "background"]